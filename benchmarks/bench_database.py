@@ -0,0 +1,83 @@
+"""
+Measure how many chain records per second the database can write.
+
+Writing every record immediately (``buffer_size=1``) is what the database
+used to do. The other buffer sizes collect the records in memory and append
+them to the table in one go. The last line is for the memory-mapped
+:class:`pymcmc.NumpyDataBase`.
+
+Usage:
+    python bench_database.py [num_records] [num_params]
+
+Author:
+    Ilias Bilionis
+"""
+
+
+import sys
+import os
+import tempfile
+import shutil
+import time
+import numpy as np
+import pymcmc as pm
+
+
+def make_state(num_params):
+    """
+    Make a state that looks like the state of a :class:`pymcmc.GPyModel`.
+    """
+    state = {}
+    state['params'] = np.random.randn(num_params)
+    state['log_likelihood'] = float(np.random.randn())
+    state['log_prior'] = float(np.random.randn())
+    state['grad_log_likelihood'] = np.random.randn(num_params)
+    state['grad_log_prior'] = np.random.randn(num_params)
+    return state
+
+
+def records_per_second(buffer_size, num_records, num_params):
+    """
+    Write ``num_records`` records and return the rate at which we did it.
+    """
+    state = make_state(num_params)
+    proposal_state = pm.RandomWalkProposal().__getstate__()
+    fd, filename = tempfile.mkstemp(suffix='.h5')
+    os.close(fd)
+    os.remove(filename)
+    try:
+        if buffer_size is None:
+            db = pm.NumpyDataBase(filename, state, proposal_state)
+        else:
+            db = pm.DataBase(filename, state, proposal_state,
+                             buffer_size=buffer_size)
+        db.add_proposal(proposal_state)
+        db.create_new_chain()
+        t0 = time.time()
+        for i in xrange(num_records):
+            db.add_chain_record(i + 1, i, state)
+        db.flush()
+        elapsed = time.time() - t0
+        db.close()
+    finally:
+        if os.path.isdir(filename):
+            shutil.rmtree(filename)
+        else:
+            os.remove(filename)
+    return num_records / elapsed
+
+
+if __name__ == '__main__':
+    num_records = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    num_params = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    print 'Writing %d records with %d parameters' % (num_records, num_params)
+    base = None
+    for buffer_size in [1, 10, 100, 1000]:
+        rate = records_per_second(buffer_size, num_records, num_params)
+        if base is None:
+            base = rate
+        print ('buffer_size: %5d, records/sec: %10.1f, speedup: %6.1fx'
+               % (buffer_size, rate, rate / base))
+    rate = records_per_second(None, num_records, num_params)
+    print ('NumpyDataBase:      records/sec: %10.1f, speedup: %6.1fx'
+           % (rate, rate / base))
@@ -0,0 +1,349 @@
+"""
+Measure the statistical efficiency of the proposals on a set of targets.
+
+Every proposal is run on every target. The proposal is first tuned for
+``num_warmup`` steps. Then, ``num_samples`` steps are taken without tuning
+and for those we report:
+    + the wall time and the samples per second,
+    + the evaluations of the log probability and of its gradient,
+    + the acceptance rate,
+    + the effective sample size (ESS) of the worst and of the median
+      parameter,
+    + the (worst) ESS per second and per evaluation of the log probability.
+
+The results are written as JSON (to the standard output or to a file) and a
+summary table is written to the standard error.
+
+The targets are:
+    + ``isotropic``:        a 10-d standard normal,
+    + ``ill_conditioned``:  a 10-d normal with standard deviations from 0.1
+                            to 10,
+    + ``rosenbrock``:       a 2-d banana shaped density,
+    + ``funnel``:           Neal's funnel in 10-d,
+    + ``gp_regression``:    the hyper-parameters of a small GP regression
+                            model (:class:`pymcmc.GPyModel`, needs GPy).
+
+To benchmark a new proposal, add it to ``PROPOSALS``.
+
+Usage:
+    python bench_ess.py [--targets isotropic,funnel] [--proposals rw,mala]
+                        [--num-warmup 1000] [--num-samples 2000] [--seed 0]
+                        [--output results.json]
+
+Author:
+    Ilias Bilionis
+"""
+
+
+import sys
+import time
+import json
+import platform
+import argparse
+import numpy as np
+import pymcmc as pm
+
+
+class Target(pm.Model):
+
+    """
+    A target density with analytic gradients that counts its evaluations.
+
+    The gradient is only computed if a proposal asks for it.
+    """
+
+    def __init__(self, name, num_params):
+        self._num_params = num_params
+        self.num_log_p_evals = 0
+        self.num_grad_evals = 0
+        super(Target, self).__init__(name=name)
+        self.params = np.zeros(num_params)
+
+    def _log_p(self, x):
+        raise NotImplementedError('Implement this.')
+
+    def _grad_log_p(self, x):
+        raise NotImplementedError('Implement this.')
+
+    def __getstate__(self):
+        return self._state
+
+    def __setstate__(self, state):
+        self._state = state
+
+    @property
+    def num_params(self):
+        return self._num_params
+
+    @property
+    def param_names(self):
+        return ['x%d' % i for i in xrange(self._num_params)]
+
+    @property
+    def params(self):
+        return self._state['params']
+
+    @params.setter
+    def params(self, value):
+        value = np.array(value, dtype='float64')
+        self.num_log_p_evals += 1
+        self._state = {'params': value,
+                       'log_likelihood': self._log_p(value),
+                       'log_prior': 0.}
+
+    @property
+    def log_likelihood(self):
+        return self._state['log_likelihood']
+
+    @property
+    def log_prior(self):
+        return self._state['log_prior']
+
+    @property
+    def grad_log_likelihood(self):
+        if not self._state.has_key('grad_log_likelihood'):
+            self.num_grad_evals += 1
+            self._state['grad_log_likelihood'] = self._grad_log_p(
+                self._state['params'])
+        return self._state['grad_log_likelihood']
+
+    @property
+    def grad_log_prior(self):
+        return np.zeros(self._num_params)
+
+
+class Gaussian(Target):
+
+    """
+    A normal with independent components of the given standard deviations.
+    """
+
+    def __init__(self, name, scales):
+        self.scales = np.asarray(scales, dtype='float64')
+        super(Gaussian, self).__init__(name, self.scales.shape[0])
+
+    def _log_p(self, x):
+        return -0.5 * np.sum((x / self.scales) ** 2)
+
+    def _grad_log_p(self, x):
+        return -x / self.scales ** 2
+
+
+class Rosenbrock(Target):
+
+    """
+    The density ``exp(-((1 - x)^2 + 100 (y - x^2)^2) / 20)``.
+    """
+
+    def __init__(self):
+        super(Rosenbrock, self).__init__('rosenbrock', 2)
+
+    def _log_p(self, x):
+        return -((1. - x[0]) ** 2 + 100. * (x[1] - x[0] ** 2) ** 2) / 20.
+
+    def _grad_log_p(self, x):
+        r = x[1] - x[0] ** 2
+        return np.array([2. * (1. - x[0]) + 400. * x[0] * r,
+                         -200. * r]) / 20.
+
+
+class Funnel(Target):
+
+    """
+    Neal's funnel: ``v ~ N(0, 3^2)`` and ``x_i ~ N(0, exp(v))``.
+    """
+
+    def __init__(self, num_params=10):
+        super(Funnel, self).__init__('funnel', num_params)
+
+    def _log_p(self, x):
+        v = x[0]
+        return (-v ** 2 / 18. - 0.5 * np.exp(-v) * np.dot(x[1:], x[1:]) -
+                0.5 * (self._num_params - 1) * v)
+
+    def _grad_log_p(self, x):
+        v = x[0]
+        g = np.empty(self._num_params)
+        g[0] = (-v / 9. + 0.5 * np.exp(-v) * np.dot(x[1:], x[1:]) -
+                0.5 * (self._num_params - 1))
+        g[1:] = -np.exp(-v) * x[1:]
+        return g
+
+
+def gp_regression():
+    """
+    Make a GP regression model with proper priors on its hyper-parameters.
+
+    GPy is only imported here so that the other targets do not need it.
+    """
+    import GPy
+
+    class CountingGPyModel(pm.GPyModel):
+
+        num_log_p_evals = 0
+        num_grad_evals = 0
+
+        @pm.GPyModel.params.setter
+        def params(self, value):
+            self.num_log_p_evals += 1
+            pm.GPyModel.params.fset(self, value)
+
+        def _eval_grads(self):
+            if not self._state.has_key('grad_log_likelihood'):
+                self.num_grad_evals += 1
+            pm.GPyModel._eval_grads(self)
+
+    rs = np.random.RandomState(0)
+    X = rs.rand(20, 1)
+    Y = np.sin(6. * X) + 0.1 * rs.randn(20, 1)
+    gp = GPy.models.GPRegression(X, Y)
+    gp.kern.variance.set_prior(pm.LogGaussianPrior(0., 1.), warning=False)
+    gp.kern.lengthscale.set_prior(pm.LogGaussianPrior(-1., 1.), warning=False)
+    gp.likelihood.variance.set_prior(pm.LogGaussianPrior(-3., 1.),
+                                     warning=False)
+    return CountingGPyModel(gp, name='gp_regression', assign_priors=False)
+
+
+# The targets (each one is a function making a new model)
+TARGETS = [('isotropic', lambda: Gaussian('isotropic', np.ones(10))),
+           ('ill_conditioned',
+            lambda: Gaussian('ill_conditioned', np.logspace(-1, 1, 10))),
+           ('rosenbrock', Rosenbrock),
+           ('funnel', Funnel),
+           ('gp_regression', gp_regression)]
+
+
+# The proposals (each one is a function of the number of parameters making a
+# new proposal)
+PROPOSALS = [('rw', lambda d: pm.RandomWalkProposal(scale=2.38 / np.sqrt(d))),
+             ('am', lambda d: pm.AdaptiveMetropolisProposal(
+                 np.eye(d), scale=2.38 / np.sqrt(d))),
+             ('mala', lambda d: pm.MALAProposal(dt=0.5)),
+             ('mala_diag', lambda d: pm.MALAProposal(
+                 dt=0.5, mass_matrix=pm.MassMatrix())),
+             ('hmc_diag', lambda d: pm.HMCProposal(
+                 step_size=0.1, num_steps=10, mass_matrix=pm.MassMatrix())),
+             ('nuts_diag', lambda d: pm.NUTSProposal(
+                 step_size=0.1, mass_matrix=pm.MassMatrix()))]
+
+
+class ChainRecorder(pm.Callback):
+
+    """
+    Keep the parameters of every step.
+    """
+
+    def __init__(self):
+        self.blocks = []
+
+    def on_step(self, sampler, steps):
+        self.blocks.append(steps['params'])
+
+    @property
+    def chain(self):
+        return np.concatenate(self.blocks)
+
+
+def run(target_name, make_target, proposal_name, make_proposal, num_warmup,
+        num_samples, seed):
+    """
+    Tune a proposal on a target and measure its efficiency.
+
+    :returns:   A dictionary with the results.
+    """
+    np.random.seed(seed)
+    model = make_target()
+    num_params = model.params.shape[0]
+    proposal = make_proposal(num_params)
+    mcmc = pm.MetropolisHastings(model, proposal=proposal)
+    # Diverging trajectories overflow (and they are rejected)
+    with np.errstate(over='ignore', invalid='ignore'):
+        mcmc.sample(num_warmup, tuning_frequency=100,
+                    stop_tuning_after=num_warmup - 1)
+        model.num_log_p_evals = 0
+        model.num_grad_evals = 0
+        recorder = ChainRecorder()
+        t0 = time.time()
+        mcmc.sample(num_samples, start_tuning_after=None,
+                    callbacks=[recorder], callback_block_size=1000)
+        elapsed = time.time() - t0
+    with np.errstate(invalid='ignore'):
+        ess = np.nan_to_num(pm.effective_sample_size(recorder.chain))
+    result = {}
+    result['target'] = target_name
+    result['proposal'] = proposal_name
+    result['num_params'] = num_params
+    result['num_samples'] = num_samples
+    result['seconds'] = elapsed
+    result['samples_per_sec'] = num_samples / elapsed
+    result['log_p_evals'] = model.num_log_p_evals
+    result['grad_evals'] = model.num_grad_evals
+    result['acceptance_rate'] = mcmc.acceptance_rate
+    result['min_ess'] = float(np.min(ess))
+    result['median_ess'] = float(np.median(ess))
+    result['ess_per_sec'] = result['min_ess'] / elapsed
+    result['ess_per_log_p_eval'] = (result['min_ess'] /
+                                    max(model.num_log_p_evals, 1))
+    return result
+
+
+def select(choices, names):
+    """
+    Keep the choices whose name is in a comma separated list.
+    """
+    if names is None:
+        return choices
+    names = names.split(',')
+    unknown = set(names) - set(name for name, _ in choices)
+    if unknown:
+        raise ValueError('Unknown: ' + ', '.join(sorted(unknown)))
+    return [(name, f) for name, f in choices if name in names]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--targets', default=None,
+                        help='comma separated targets (default: all)')
+    parser.add_argument('--proposals', default=None,
+                        help='comma separated proposals (default: all)')
+    parser.add_argument('--num-warmup', type=int, default=1000)
+    parser.add_argument('--num-samples', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None,
+                        help='write the JSON here (default: stdout)')
+    args = parser.parse_args()
+    results = []
+    sys.stderr.write('%-16s %-10s %10s %10s %8s %8s %10s\n'
+                     % ('target', 'proposal', 'samples/s', 'log_p/s',
+                        'acc', 'min ESS', 'ESS/s'))
+    for target_name, make_target in select(TARGETS, args.targets):
+        for proposal_name, make_proposal in select(PROPOSALS, args.proposals):
+            # Keep whatever the sampler prints away from the JSON
+            stdout = sys.stdout
+            sys.stdout = sys.stderr
+            try:
+                r = run(target_name, make_target, proposal_name,
+                        make_proposal, args.num_warmup, args.num_samples,
+                        args.seed)
+            finally:
+                sys.stdout = stdout
+            results.append(r)
+            sys.stderr.write('%-16s %-10s %10.1f %10.1f %8.2f %8.1f %10.1f\n'
+                             % (target_name, proposal_name,
+                                r['samples_per_sec'],
+                                r['log_p_evals'] / r['seconds'],
+                                r['acceptance_rate'], r['min_ess'],
+                                r['ess_per_sec']))
+    report = {'python': platform.python_version(),
+              'numpy': np.__version__,
+              'platform': platform.platform(),
+              'num_warmup': args.num_warmup,
+              'num_samples': args.num_samples,
+              'seed': args.seed,
+              'results': results}
+    out = json.dumps(report, indent=2, sort_keys=True)
+    if args.output is None:
+        print out
+    else:
+        with open(args.output, 'w') as fd:
+            fd.write(out + '\n')
@@ -0,0 +1,68 @@
+"""
+Measure how long it takes to import the package.
+
+Each measurement runs in a fresh interpreter. ``import pymcmc`` only imports
+the parts of the package that need nothing but numpy. The second line also
+asks for :class:`pymcmc.DataBase` (PyTables) and the third for
+:class:`pymcmc.GPyModel` (GPy, scipy), which is what ``import pymcmc`` used to
+cost. The heavy modules that ended up imported are listed for each case.
+
+Usage:
+    python bench_import_time.py [num_repeats]
+
+Author:
+    Ilias Bilionis
+"""
+
+
+import sys
+import os
+import subprocess
+
+
+# The statement timed in each case
+CASES = [('import pymcmc', ''),
+         ('+ pymcmc.DataBase', 'pymcmc.DataBase'),
+         ('+ pymcmc.GPyModel', 'pymcmc.DataBase; pymcmc.GPyModel')]
+
+
+# The program run by the fresh interpreter
+SCRIPT = """
+import sys
+import time
+t0 = time.time()
+import pymcmc
+%s
+elapsed = time.time() - t0
+heavy = [m for m in ['GPy', 'tables', 'scipy'] if m in sys.modules]
+print elapsed, ','.join(heavy)
+"""
+
+
+def import_time(statement):
+    """
+    Time the import of the package followed by ``statement`` in a new
+    interpreter.
+
+    :returns:   A tuple (seconds, heavy modules imported).
+    """
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    env = dict(os.environ)
+    env['PYTHONPATH'] = root + os.pathsep + env.get('PYTHONPATH', '')
+    out = subprocess.check_output([sys.executable, '-c', SCRIPT % statement],
+                                  env=env)
+    fields = out.split()
+    return float(fields[0]), fields[1] if len(fields) > 1 else ''
+
+
+if __name__ == '__main__':
+    num_repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print 'Best of %d fresh interpreters' % num_repeats
+    base = None
+    for label, statement in CASES:
+        results = [import_time(statement) for i in xrange(num_repeats)]
+        elapsed = min(r[0] for r in results)
+        if base is None:
+            base = elapsed
+        print ('%-20s seconds: %7.3f, slowdown: %6.1fx, imports: %s'
+               % (label, elapsed, elapsed / base, results[0][1] or 'none'))
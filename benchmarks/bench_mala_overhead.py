@@ -0,0 +1,118 @@
+"""
+Measure the time a MALA step spends outside the model.
+
+The model is a standard normal whose state is set with a couple of numpy
+operations, so almost all the time goes to the proposal and the sampler.
+The reference proposal does what :class:`pymcmc.MALAProposal` used to do:
+ask the model for the gradient at the current point on every step and
+evaluate the proposal density with :func:`scipy.stats.norm.logpdf`.
+
+Usage:
+    python bench_mala_overhead.py [num_steps] [num_params]
+
+Author:
+    Ilias Bilionis
+"""
+
+
+import sys
+import time
+import numpy as np
+from scipy.stats import norm
+import pymcmc as pm
+
+
+class StandardNormal(pm.Model):
+
+    """
+    A standard normal target that counts gradient evaluations.
+    """
+
+    def __init__(self, num_params):
+        self._num_params = num_params
+        self.num_grad_evals = 0
+        super(StandardNormal, self).__init__(name='Standard Normal')
+        self.params = np.zeros(num_params)
+
+    def __getstate__(self):
+        return self._state
+
+    def __setstate__(self, state):
+        self._state = state
+
+    @property
+    def num_params(self):
+        return self._num_params
+
+    @property
+    def params(self):
+        return self._state['params']
+
+    @params.setter
+    def params(self, value):
+        value = np.array(value, dtype='float64')
+        self._state = {'params': value,
+                       'log_likelihood': -0.5 * np.dot(value, value),
+                       'log_prior': 0.,
+                       'grad_log_likelihood': -value,
+                       'grad_log_prior': np.zeros(self._num_params)}
+
+    @property
+    def log_likelihood(self):
+        return self._state['log_likelihood']
+
+    @property
+    def log_prior(self):
+        return self._state['log_prior']
+
+    @property
+    def grad_log_likelihood(self):
+        self.num_grad_evals += 1
+        return self._state['grad_log_likelihood']
+
+    @property
+    def grad_log_prior(self):
+        return self._state['grad_log_prior']
+
+
+class ReferenceMALAProposal(pm.MALAProposal):
+
+    """
+    MALA the way it used to be done.
+    """
+
+    def _do_propose(self, model):
+        return pm.GradProposal._do_propose(self, model)
+
+    def __call__(self, new_params, old_params, old_grad_params):
+        return np.sum(norm.logpdf(new_params,
+                                  loc=(old_params + 0.5 * self.dt ** 2 * old_grad_params),
+                                  scale=self.dt), axis=-1)
+
+
+def time_per_step(proposal, num_steps, num_params):
+    """
+    Return the time per step (in microseconds) and the gradient evaluations
+    per step.
+    """
+    model = StandardNormal(num_params)
+    mcmc = pm.MetropolisHastings(model, proposal=proposal)
+    np.random.seed(0)
+    t0 = time.time()
+    mcmc.sample(num_steps, start_tuning_after=None)
+    elapsed = time.time() - t0
+    return (1e6 * elapsed / num_steps,
+            float(model.num_grad_evals) / num_steps)
+
+
+if __name__ == '__main__':
+    num_steps = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    num_params = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    print 'MALA on a %d-d standard normal, %d steps' % (num_params, num_steps)
+    t_ref, g_ref = time_per_step(ReferenceMALAProposal(dt=0.5), num_steps,
+                                 num_params)
+    t_new, g_new = time_per_step(pm.MALAProposal(dt=0.5), num_steps,
+                                 num_params)
+    print 'reference:    %8.1f us/step, %4.2f gradients/step' % (t_ref, g_ref)
+    print 'MALAProposal: %8.1f us/step, %4.2f gradients/step' % (t_new, g_new)
+    print 'speedup:      %8.1fx' % (t_ref / t_new)
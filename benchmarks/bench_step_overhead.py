@@ -0,0 +1,338 @@
+"""
+Measure what the sampler costs per step on top of the model.
+
+The model costs next to nothing: setting its parameters just stores them.
+So, everything that is measured is the cost of the framework. Each component
+of a step is timed on its own (in microseconds per call):
+    + ``model``:            setting the parameters of the model (the floor),
+    + ``getstate/setstate``: getting and setting the state of the model,
+    + ``propose``:          :meth:`pymcmc.Proposal.propose` (random walk),
+    + ``propose_staged``:   :meth:`pymcmc.Proposal.propose_staged` followed
+                            by a rollback, with a model that can stage,
+    + ``tuning check``:     what the sampling loop does to adapt and tune the
+                            proposal on a step,
+    + ``add_chain_record``: writing a record to a :class:`pymcmc.DataBase`
+                            and to a :class:`pymcmc.NumpyDataBase` (including
+                            the flushes),
+and the whole step of :meth:`pymcmc.MetropolisHastings.sample` is timed
+without tuning, with tuning, with a model that can stage and with each one of
+the databases (in microseconds per step). The last lines time the step with
+a proposal that does nothing, i.e. what the sampling loop adds to the
+proposal (accepting, counting, etc.).
+
+The numbers are compared with the baseline stored in
+``bench_step_overhead.json`` (next to this file), so that a change of the
+sampling loop can be judged in microseconds per step. Run with
+``--save-baseline`` to replace the baseline with the current numbers.
+Every number is the best of a few repetitions.
+
+Usage:
+    python bench_step_overhead.py [--num-steps 20000] [--num-params 2]
+                                  [--repeats 5] [--baseline FILE]
+                                  [--save-baseline]
+
+Author:
+    Ilias Bilionis
+"""
+
+
+import sys
+import os
+import json
+import shutil
+import platform
+import tempfile
+import argparse
+import timeit
+import numpy as np
+import pymcmc as pm
+
+
+class TrivialModel(pm.Model):
+
+    """
+    A model that costs next to nothing.
+    """
+
+    def __init__(self, num_params):
+        self._num_params = num_params
+        super(TrivialModel, self).__init__(name='Trivial Model')
+        self.params = np.zeros(num_params)
+
+    def __getstate__(self):
+        return self._state
+
+    def __setstate__(self, state):
+        self._state = state
+
+    @property
+    def num_params(self):
+        return self._num_params
+
+    @property
+    def params(self):
+        return self._state['params']
+
+    @params.setter
+    def params(self, value):
+        self._state = {'params': value, 'log_likelihood': 0.,
+                       'log_prior': 0.}
+
+    @property
+    def log_likelihood(self):
+        return self._state['log_likelihood']
+
+    @property
+    def log_prior(self):
+        return self._state['log_prior']
+
+
+class StagingTrivialModel(TrivialModel):
+
+    """
+    A trivial model that supports staging.
+    """
+
+    _staged_state = None
+
+    @property
+    def can_stage(self):
+        return True
+
+    def stage(self):
+        self._staged_state = self._state
+
+    def commit(self):
+        self._staged_state = None
+
+    def rollback(self):
+        if self._staged_state is not None:
+            self._state = self._staged_state
+            self._staged_state = None
+
+
+class NullProposal(pm.Proposal):
+
+    """
+    A proposal that costs nothing and always stays put.
+    """
+
+    def propose(self, model):
+        return model.__getstate__(), 0.
+
+    def propose_staged(self, model):
+        model.stage()
+        return 0.
+
+
+def best_time(func, num_calls, repeats):
+    """
+    Call ``func`` ``num_calls`` times, ``repeats`` times and return the best
+    time per call in microseconds.
+    """
+    best = None
+    for r in xrange(repeats):
+        t0 = timeit.default_timer()
+        for i in xrange(num_calls):
+            func()
+        elapsed = timeit.default_timer() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return 1e6 * best / num_calls
+
+
+def time_model(num_steps, num_params, repeats):
+    model = TrivialModel(num_params)
+    x = np.zeros(num_params)
+    def func():
+        model.params = x
+    return best_time(func, num_steps, repeats)
+
+
+def time_getstate_setstate(num_steps, num_params, repeats):
+    model = TrivialModel(num_params)
+    def func():
+        model.__setstate__(model.__getstate__())
+    return best_time(func, num_steps, repeats)
+
+
+def time_propose(num_steps, num_params, repeats):
+    model = TrivialModel(num_params)
+    proposal = pm.RandomWalkProposal()
+    def func():
+        proposal.propose(model)
+    return best_time(func, num_steps, repeats)
+
+
+def time_propose_staged(num_steps, num_params, repeats):
+    model = StagingTrivialModel(num_params)
+    proposal = pm.RandomWalkProposal()
+    def func():
+        proposal.propose_staged(model)
+        model.rollback()
+    return best_time(func, num_steps, repeats)
+
+
+def time_tuning_check(num_steps, num_params, repeats):
+    """
+    Time what the sampling loop does for tuning on a step (with the default
+    tuning frequency).
+    """
+    model = TrivialModel(num_params)
+    mcmc = pm.MetropolisHastings(model)
+    mcmc.accepted = 0.
+    mcmc.count = 0.
+    mcmc._last_tune = (0., 0.)
+    proposal = mcmc.proposal
+    step = [0]
+    def func():
+        i = step[0]
+        step[0] = i + 1
+        # A quarter of the steps is accepted
+        mcmc.count += 1
+        mcmc.accepted += 0.25
+        if (isinstance(proposal, pm.TunableProposalConcept) and
+            i >= 0 and i <= num_steps):
+            proposal.adapt(model.params)
+            if i > 0 and i % 1000 == 0:
+                proposal.tune(mcmc._tuning_acceptance_rate())
+    return best_time(func, num_steps, repeats)
+
+
+def _new_db(db_class, path, num_params):
+    model = TrivialModel(num_params)
+    db = db_class(path, model.__getstate__(),
+                  pm.RandomWalkProposal().__getstate__())
+    db.add_proposal(pm.RandomWalkProposal().__getstate__())
+    db.create_new_chain()
+    return db
+
+
+def time_add_chain_record(db_class, num_steps, num_params, repeats):
+    tmpdir = tempfile.mkdtemp()
+    try:
+        model = TrivialModel(num_params)
+        best = None
+        for r in xrange(repeats):
+            path = os.path.join(tmpdir, 'db%d' % r)
+            db = _new_db(db_class, path, num_params)
+            state = model.get_state(db.fields)
+            t0 = timeit.default_timer()
+            for i in xrange(num_steps):
+                db.add_chain_record(i + 1, i, state)
+            db.flush()
+            elapsed = timeit.default_timer() - t0
+            db.close()
+            best = elapsed if best is None else min(best, elapsed)
+        return 1e6 * best / num_steps
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def time_sample(num_steps, num_params, repeats, tuning=False, staging=False,
+                db_class=None, null_proposal=False):
+    tmpdir = tempfile.mkdtemp()
+    try:
+        best = None
+        for r in xrange(repeats):
+            model = (StagingTrivialModel(num_params) if staging
+                     else TrivialModel(num_params))
+            if db_class is None:
+                db = None
+            else:
+                db = _new_db(db_class, os.path.join(tmpdir, 'db%d' % r),
+                             num_params)
+            proposal = NullProposal() if null_proposal else None
+            mcmc = pm.MetropolisHastings(model, proposal=proposal, db=db)
+            t0 = timeit.default_timer()
+            mcmc.sample(num_steps,
+                        start_tuning_after=0 if tuning else None)
+            elapsed = timeit.default_timer() - t0
+            if db is not None:
+                db.close()
+            best = elapsed if best is None else min(best, elapsed)
+        return 1e6 * best / num_steps
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+# The components (name, function of num_steps, num_params and repeats)
+COMPONENTS = [
+    ('model', time_model),
+    ('getstate/setstate', time_getstate_setstate),
+    ('propose', time_propose),
+    ('propose_staged', time_propose_staged),
+    ('tuning check', time_tuning_check),
+    ('add_chain_record (DataBase)',
+     lambda n, d, r: time_add_chain_record(pm.DataBase, n, d, r)),
+    ('add_chain_record (NumpyDataBase)',
+     lambda n, d, r: time_add_chain_record(pm.NumpyDataBase, n, d, r)),
+    ('sample', time_sample),
+    ('sample + tuning',
+     lambda n, d, r: time_sample(n, d, r, tuning=True)),
+    ('sample + staging',
+     lambda n, d, r: time_sample(n, d, r, staging=True)),
+    ('sample + DataBase',
+     lambda n, d, r: time_sample(n, d, r, db_class=pm.DataBase)),
+    ('sample + NumpyDataBase',
+     lambda n, d, r: time_sample(n, d, r, db_class=pm.NumpyDataBase)),
+    ('loop (null proposal)',
+     lambda n, d, r: time_sample(n, d, r, null_proposal=True)),
+    ('loop + staging (null proposal)',
+     lambda n, d, r: time_sample(n, d, r, staging=True,
+                                 null_proposal=True))]
+
+
+def print_row(name, t, baseline):
+    """
+    Print a time next to the one of the baseline.
+    """
+    if baseline is not None and name in baseline['us_per_step']:
+        t_base = baseline['us_per_step'][name]
+        print '%-34s %10.2f %10.2f %+7.1f%%' % (name, t, t_base,
+                                                100. * (t / t_base - 1.))
+    else:
+        print '%-34s %10.2f %10s %8s' % (name, t, '-', '-')
+    sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--num-steps', type=int, default=20000)
+    parser.add_argument('--num-params', type=int, default=2)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--baseline',
+                        default=os.path.join(os.path.dirname(
+                            os.path.abspath(__file__)),
+                            'bench_step_overhead.json'),
+                        help='the baseline JSON file')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='replace the baseline with the current numbers')
+    args = parser.parse_args()
+    baseline = None
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as fd:
+            baseline = json.load(fd)
+    np.random.seed(0)
+    print ('Framework cost with a trivial %d-d model, %d steps, best of %d'
+           % (args.num_params, args.num_steps, args.repeats))
+    if baseline is not None:
+        print ('Baseline: python %s, numpy %s, %s'
+               % (baseline['python'], baseline['numpy'],
+                  baseline['platform']))
+    print '%-34s %10s %10s %8s' % ('component', 'us/step', 'baseline',
+                                  'change')
+    us_per_step = {}
+    for name, func in COMPONENTS:
+        t = func(args.num_steps, args.num_params, args.repeats)
+        us_per_step[name] = t
+        print_row(name, t, baseline)
+    if args.save_baseline:
+        report = {'python': platform.python_version(),
+                  'numpy': np.__version__,
+                  'platform': platform.platform(),
+                  'num_steps': args.num_steps,
+                  'num_params': args.num_params,
+                  'us_per_step': us_per_step}
+        with open(args.baseline, 'w') as fd:
+            fd.write(json.dumps(report, indent=2, sort_keys=True) + '\n')
+        print 'Saved the baseline to', args.baseline
@@ -1,24 +1,101 @@
 """
 A generic Python module for MCMC.
 
+The parts of the package that need GPy or PyTables are imported the first
+time one of their names is used (e.g. ``pymcmc.GPyModel`` or
+``pymcmc.DataBase``). So, a plain :class:`pymcmc.Model` can be sampled
+without paying for importing them.
+
 Author:
     Ilias Bilionis
 """
 
 
-from _priors import *
+import sys
+import types
+import importlib
+
+
+from _evaluation_cache import *
 from _model import *
-from _mean_function import *
-from _assign_priors_to_gpy_model import *
-from _gpy_model import *
+from _array_model import *
+from _tempered_model import *
 from _proposal import *
 from _simple_proposal import *
 from _symmetric_proposal import *
 from _tunable_proposal_concept import *
 from _single_parameter_tunable_proposal_concept import *
 from _random_walk_proposal import *
+from _mass_matrix import *
 from _grad_proposal import *
 from _mala_proposal import *
+from _hmc_proposal import *
+from _nuts_proposal import *
 from _utils import *
-from _database import *
+from _adaptive_metropolis_proposal import *
+from _chain_storage import *
+from _numpy_database import *
+from _online_diagnostics import *
+from _profiler import *
+from _callback import *
 from _metropolis_hastings import *
+from _parallel_sampling import *
+from _parallel_tempering import *
+
+
+# The modules that are imported when one of their names is first used
+_LAZY_MODULES = [('_priors', ['Prior', 'GaussianPrior', 'LogGaussianPrior',
+                              'MultivariateGaussianPrior', 'GammaPrior',
+                              'InverseGammaPrior', 'UninformativeScalePrior',
+                              'UninformativePrior']),
+                 ('_mean_function', ['MeanFunction']),
+                 ('_low_rank_gp_regression', ['LowRankGPRegression']),
+                 ('_assign_priors_to_gpy_model',
+                  ['assign_priors_to_gpy_model']),
+                 ('_gpy_model', ['GPyModel']),
+                 ('_database', ['DataBase', 'merge_databases'])]
+
+
+class _LazyModule(types.ModuleType):
+
+    """
+    The package module. It imports the lazy modules on demand.
+    """
+
+    def __init__(self, module, lazy_modules):
+        """
+        Initialize the object.
+        """
+        super(_LazyModule, self).__init__(module.__name__, module.__doc__)
+        self.__dict__.update(module.__dict__)
+        # Python 2 clears the globals of a module when it is destroyed and
+        # the functions of this file still need them
+        self._module = module
+        self._lazy_names = {}
+        for module_name, names in lazy_modules:
+            for name in names:
+                self._lazy_names[name] = module_name
+        self.__all__ = sorted([name for name in module.__dict__
+                               if not name.startswith('_') and
+                               not isinstance(module.__dict__[name],
+                                              types.ModuleType)] +
+                              self._lazy_names.keys())
+
+    def __getattr__(self, name):
+        """
+        Import the module of a lazy name.
+        """
+        module_name = self.__dict__['_lazy_names'].get(name)
+        if module_name is None:
+            raise AttributeError('\'module\' object has no attribute \''
+                                 + name + '\'')
+        module = importlib.import_module('.' + module_name, self.__name__)
+        value = getattr(module, name)
+        setattr(self, name, value)
+        return value
+
+    def __dir__(self):
+        return sorted(set(self.__dict__.keys() + self.__all__))
+
+
+sys.modules[__name__] = _LazyModule(sys.modules[__name__], _LAZY_MODULES)
@@ -0,0 +1,156 @@
+"""
+An adaptive Metropolis proposal.
+
+Author:
+    Ilias Bilionis
+"""
+
+
+__all__ = ['AdaptiveMetropolisProposal']
+
+
+import numpy as np
+from . import RandomWalkProposal
+from . import cholesky_update
+
+
+# How many times the jitter is increased before giving up
+MAX_JITTER_TRIES = 20
+
+
+class AdaptiveMetropolisProposal(RandomWalkProposal):
+
+    """
+    A random walk proposal that learns the covariance of the target from the
+    chain (Haario, Saksman and Tamminen, 2001).
+
+    The covariance of the proposal (before scaling) is:
+
+        S_n = (n_0 C_0 + M_n) / (n_0 + n),
+
+    where ``C_0`` is the initial covariance, ``n_0`` is the weight we give
+    to it (``num_prior``) and ``M_n`` is the sum of squared deviations of
+    the ``n`` samples seen so far from their mean. The statistics are
+    updated with Welford's algorithm and the Cholesky factor of ``S_n`` with
+    a rescaling and a rank one update. So, adapting costs O(d^2) per sample
+    and the chain is never kept in memory.
+
+    Adaptation happens through :meth:`pymcmc.TunableProposalConcept.adapt`,
+    i.e. after every step of the tuning period. The ``scale`` is still tuned
+    on the acceptance rate. Haario et al. suggest ``2.38 / sqrt(d)``.
+
+    :param cov:         The initial covariance matrix. If it is singular,
+                        then a small multiple of the unit matrix is added to
+                        it.
+    :type cov:          2D numpy array
+    :param num_prior:   The weight of the initial covariance in number of
+                        samples.
+    :type num_prior:    int
+
+    The rest of the keyword arguments are passed to
+    :class:`pymcmc.RandomWalkProposal`.
+    """
+
+    def __init__(self, cov, num_prior=100, **kwargs):
+        """
+        Initialize the object.
+        """
+        cov = np.array(cov, dtype='float64')
+        assert cov.ndim == 2 and cov.shape[0] == cov.shape[1]
+        self.num_prior = int(num_prior)
+        assert self.num_prior >= 1
+        if not kwargs.has_key('name'):
+            kwargs['name'] = 'Adaptive Metropolis Proposal'
+        super(AdaptiveMetropolisProposal, self).__init__(cov=cov, **kwargs)
+
+    @property
+    def cov(self):
+        """
+        Set/Get the covariance matrix.
+
+        Setting it restarts the adaptation with the new matrix as ``C_0``.
+        """
+        return self._cov
+
+    @cov.setter
+    def cov(self, value):
+        """
+        Set the covariance matrix.
+        """
+        self._cov = np.array(value, dtype='float64')
+        self._chol = None
+        self.num_adapt = 0
+        self._mean = np.zeros(self._cov.shape[0])
+
+    @property
+    def chol(self):
+        """
+        Get the lower triangular factor of the covariance matrix.
+
+        The rank one updates of :meth:`pymcmc.AdaptiveMetropolisProposal.adapt`
+        need a Cholesky factor with a positive diagonal (the eigenvalue
+        factor of :class:`pymcmc.RandomWalkProposal` will not do). So, if
+        the covariance is not positive definite, then a jitter is added to
+        its diagonal (starting from ``1e-10`` times its mean and growing
+        ten times per try) until it can be factorized.
+        """
+        if self._chol is None:
+            d = self._cov.shape[0]
+            jitter = 1e-10 * max(np.mean(np.diag(self._cov)), 1e-10)
+            for i in xrange(MAX_JITTER_TRIES):
+                try:
+                    self._chol = np.linalg.cholesky(self._cov)
+                    break
+                except np.linalg.LinAlgError:
+                    self._cov += jitter * np.eye(d)
+                    jitter *= 10.
+            else:
+                self._chol = np.linalg.cholesky(self._cov)
+        return self._chol
+
+    def adapt(self, params):
+        """
+        Update the covariance and its factor with new samples.
+
+        :param params:  The current parameters (a 1D array) or many samples
+                        (a 2D array, one row each).
+        :type params:   :class:`numpy.ndarray`
+        """
+        params = np.atleast_2d(params)
+        L = self.chol
+        for x in params:
+            n = self.num_adapt + 1
+            delta = x - self._mean
+            self._mean += delta / n
+            # S_n = a S_{n-1} + b delta delta^T
+            a = (self.num_prior + n - 1.) / (self.num_prior + n)
+            b = (n - 1.) / n / (self.num_prior + n)
+            self._cov *= a
+            self._cov += b * np.outer(delta, delta)
+            L *= np.sqrt(a)
+            if n > 1:
+                cholesky_update(L, np.sqrt(b) * delta)
+            self.num_adapt = n
+
+    def get_checkpoint(self):
+        """
+        Get the state of the object together with the adaptation statistics.
+        """
+        checkpoint = super(AdaptiveMetropolisProposal, self).get_checkpoint()
+        checkpoint['num_adapt'] = self.num_adapt
+        checkpoint['mean'] = self._mean.copy()
+        checkpoint['chol'] = self.chol.copy()
+        return checkpoint
+
+    def set_checkpoint(self, checkpoint):
+        """
+        Restore the proposal from a checkpoint.
+        """
+        checkpoint = dict(checkpoint)
+        num_adapt = checkpoint.pop('num_adapt')
+        mean = checkpoint.pop('mean')
+        chol = checkpoint.pop('chol')
+        super(AdaptiveMetropolisProposal, self).set_checkpoint(checkpoint)
+        self.num_adapt = num_adapt
+        self._mean = mean.copy()
+        self._chol = chol.copy()
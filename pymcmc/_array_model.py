@@ -0,0 +1,278 @@
+"""
+A model defined by vectorized functions of the parameters.
+
+Author:
+    Ilias Bilionis
+"""
+
+
+__all__ = ['ArrayModel']
+
+
+import numpy as np
+from . import Model
+
+
+class ArrayModel(Model):
+
+    """
+    A model defined by functions that evaluate the log likelihood, the log
+    prior and their gradients at many points at once.
+
+    Each function takes a 2D array with one row per point and returns a 1D
+    array with one value per point (or a 2D array with one gradient per
+    point). So, :meth:`pymcmc.ArrayModel.eval_batch` evaluates all the
+    points with a single call of each function and the single point
+    evaluations of the usual sampling methods simply pass one row.
+
+    The state is not kept in a dictionary. It is kept in arrays that are
+    allocated once, with room for the current state, the state retained by
+    :meth:`pymcmc.Model.stage` and a new one. Setting the parameters fills
+    the room that is free, so staging, committing and rolling back never
+    copy anything. The parameters and the gradients are returned as views of
+    these arrays. They remain valid while the parameters are set once more
+    (which is all a proposal needs), so copy them if you need to keep them.
+
+    :param log_likelihood:      The log likelihood.
+    :type log_likelihood:       function
+    :param init_params:         The initial parameters.
+    :type init_params:          1D :class:`numpy.ndarray`
+    :param log_prior:           The log prior. If ``None``, it is zero.
+    :type log_prior:            function
+    :param grad_log_likelihood: The gradient of the log likelihood. If
+                                ``None``, then the model has no gradients.
+    :type grad_log_likelihood:  function
+    :param grad_log_prior:      The gradient of the log prior. It is required
+                                if both ``log_prior`` and
+                                ``grad_log_likelihood`` are given.
+    :type grad_log_prior:       function
+    :param param_names:         The names of the parameters.
+    :type param_names:          list of str
+    :param cache:               If given, then every state that is evaluated
+                                by setting the parameters is kept in it and
+                                setting the parameters to a point that is
+                                found in it does not evaluate anything.
+                                :meth:`pymcmc.ArrayModel.eval_batch` does not
+                                use it.
+    :type cache:                :class:`pymcmc.EvaluationCache`
+    :param name:                A name for the model.
+    :type name:                 str
+    """
+
+    # The number of states kept (the current one, the staged one and a new
+    # one)
+    _NUM_SLOTS = 3
+
+    def __init__(self, log_likelihood, init_params, log_prior=None,
+                 grad_log_likelihood=None, grad_log_prior=None,
+                 param_names=None, cache=None, name='Array Model'):
+        """
+        Initialize the object.
+        """
+        if (log_prior is not None and grad_log_likelihood is not None and
+            grad_log_prior is None):
+            raise ValueError('The gradient of the log prior is required.')
+        init_params = np.array(init_params, dtype='float64')
+        assert init_params.ndim == 1
+        num_params = init_params.shape[0]
+        if param_names is None:
+            param_names = ['x%d' % i for i in xrange(num_params)]
+        assert len(param_names) == num_params
+        super(ArrayModel, self).__init__(name=name)
+        self._log_likelihood_func = log_likelihood
+        self._log_prior_func = log_prior
+        self._grad_log_likelihood_func = grad_log_likelihood
+        self._grad_log_prior_func = grad_log_prior
+        self._param_names = list(param_names)
+        self.cache = cache
+        n = self._NUM_SLOTS
+        self._params = np.zeros((n, num_params))
+        self._log_likelihood = np.zeros(n)
+        self._log_prior = np.zeros(n)
+        self._grad_log_likelihood = np.zeros((n, num_params))
+        self._grad_log_prior = np.zeros((n, num_params))
+        self._has_grads = [False] * n
+        # The states of the cache that each slot came from (so that the
+        # gradients can be added to them)
+        self._cache_states = [None] * n
+        self._cur = 0
+        self._staged = None
+        self.params = init_params
+
+    def _free_slot(self):
+        """
+        Get a slot that holds neither the current nor the staged state.
+        """
+        if self._staged is None or self._staged == self._cur:
+            return (self._cur + 1) % self._NUM_SLOTS
+        return 3 - self._cur - self._staged
+
+    def _eval_grads(self):
+        """
+        Evaluate the gradients at the current state (if they are not there
+        already).
+        """
+        cur = self._cur
+        if self._has_grads[cur]:
+            return
+        if not self.has_grad:
+            raise RuntimeError('The model has no gradients.')
+        x = self._params[cur:cur + 1]
+        self._grad_log_likelihood[cur] = self._grad_log_likelihood_func(x)[0]
+        if self._grad_log_prior_func is not None:
+            self._grad_log_prior[cur] = self._grad_log_prior_func(x)[0]
+        self._has_grads[cur] = True
+        state = self._cache_states[cur]
+        if state is not None:
+            state['grad_log_likelihood'] = self._grad_log_likelihood[cur].copy()
+            state['grad_log_prior'] = self._grad_log_prior[cur].copy()
+            self.cache.resize(state['params'])
+
+    def __getstate__(self):
+        if self.has_grad:
+            self._eval_grads()
+        return self.get_state()
+
+    def get_state(self, fields=None):
+        cur = self._cur
+        if fields is None:
+            fields = ['params', 'log_likelihood', 'log_prior']
+            if self.has_grad:
+                fields += ['grad_log_likelihood', 'grad_log_prior']
+        elif self.has_grad and ('grad_log_likelihood' in fields or
+                                'grad_log_prior' in fields):
+            self._eval_grads()
+        state = {}
+        for name in fields:
+            if name == 'log_likelihood':
+                state[name] = float(self._log_likelihood[cur])
+            elif name == 'log_prior':
+                state[name] = float(self._log_prior[cur])
+            elif name == 'params':
+                state[name] = self._params[cur].copy()
+            elif self._has_grads[cur]:
+                state[name] = getattr(self, '_' + name)[cur].copy()
+        return state
+
+    def __setstate__(self, state):
+        slot = self._free_slot()
+        self._params[slot] = state['params']
+        self._log_likelihood[slot] = state['log_likelihood']
+        self._log_prior[slot] = state['log_prior']
+        self._has_grads[slot] = state.has_key('grad_log_likelihood')
+        if self._has_grads[slot]:
+            self._grad_log_likelihood[slot] = state['grad_log_likelihood']
+            self._grad_log_prior[slot] = state['grad_log_prior']
+        self._cache_states[slot] = None
+        self._cur = slot
+
+    @property
+    def has_grad(self):
+        return self._grad_log_likelihood_func is not None
+
+    @property
+    def can_stage(self):
+        return True
+
+    def stage(self):
+        self._staged = self._cur
+
+    def commit(self):
+        self._staged = None
+
+    def rollback(self):
+        if self._staged is not None:
+            self._cur = self._staged
+            self._staged = None
+
+    @property
+    def log_likelihood(self):
+        return self._log_likelihood[self._cur]
+
+    @property
+    def log_prior(self):
+        return self._log_prior[self._cur]
+
+    @property
+    def num_params(self):
+        return self._params.shape[1]
+
+    @property
+    def param_names(self):
+        return self._param_names
+
+    @property
+    def params(self):
+        return self._params[self._cur]
+
+    @params.setter
+    def params(self, value):
+        if self.cache is not None:
+            state = self.cache.get(value)
+            if state is not None:
+                self.__setstate__(state)
+                self._cache_states[self._cur] = state
+                return
+        slot = self._free_slot()
+        self._params[slot] = value
+        x = self._params[slot:slot + 1]
+        self._log_likelihood[slot] = self._log_likelihood_func(x)[0]
+        if self._log_prior_func is not None:
+            self._log_prior[slot] = self._log_prior_func(x)[0]
+        self._has_grads[slot] = False
+        self._cache_states[slot] = None
+        self._cur = slot
+        if self.cache is not None:
+            state = self.get_state(['params', 'log_likelihood', 'log_prior'])
+            self.cache.put(value, state)
+            self._cache_states[slot] = state
+
+    @property
+    def grad_log_likelihood(self):
+        self._eval_grads()
+        return self._grad_log_likelihood[self._cur]
+
+    @property
+    def grad_log_prior(self):
+        self._eval_grads()
+        return self._grad_log_prior[self._cur]
+
+    def eval_batch(self, params, compute_grad=False):
+        """
+        Evaluate the model at many parameters with one call of each function.
+
+        See :meth:`pymcmc.Model.eval_batch`.
+        """
+        params = np.array(np.atleast_2d(params), dtype='float64')
+        num_points = params.shape[0]
+        batch = {}
+        batch['params'] = params
+        batch['log_likelihood'] = np.array(self._log_likelihood_func(params),
+                                           dtype='float64')
+        if self._log_prior_func is None:
+            batch['log_prior'] = np.zeros(num_points)
+        else:
+            batch['log_prior'] = np.array(self._log_prior_func(params),
+                                          dtype='float64')
+        if compute_grad:
+            if not self.has_grad:
+                raise RuntimeError('The model has no gradients.')
+            batch['grad_log_likelihood'] = np.array(
+                self._grad_log_likelihood_func(params), dtype='float64')
+            if self._grad_log_prior_func is None:
+                batch['grad_log_prior'] = np.zeros(params.shape)
+            else:
+                batch['grad_log_prior'] = np.array(
+                    self._grad_log_prior_func(params), dtype='float64')
+        return batch
+
+    def __str__(self):
+        """
+        Return a string representation of the object.
+        """
+        s = 'Model name:\t' + self.__name__ + '\n'
+        s += 'num_param:\t' + str(self.num_params) + '\n'
+        s += 'param names:\t' + str(self.param_names) + '\n'
+        s += 'log_likelihood:\t' + str(self.log_likelihood) + '\n'
+        s += 'log_prior:\t' + str(self.log_prior)
+        return s
@@ -0,0 +1,275 @@
+"""
+Callbacks that are notified of the progress of the sampling methods.
+
+Author:
+    Ilias Bilionis
+"""
+
+
+__all__ = ['Callback', 'CallbackList']
+
+
+import numpy as np
+
+
+# The entries of the model state passed with the records by default
+DEFAULT_FIELDS = ['params', 'log_likelihood', 'log_prior']
+
+
+class Callback(object):
+
+    """
+    The base class of all callbacks.
+
+    A callback is passed to :meth:`pymcmc.MetropolisHastings.sample` (or
+    :meth:`pymcmc.MetropolisHastings.sample_batch`) and it is notified of
+    what happens while sampling by calling its ``on_*`` methods. Override the
+    ones you need. The rest do nothing.
+
+    The steps and the records of the chain are not passed one by one. They
+    are collected in blocks (see :class:`pymcmc.CallbackList`) and each
+    block is passed with a single call as a dictionary of arrays whose first
+    dimension runs over the steps (or the records) of the block. So, a
+    callback costs a Python call every ``block_size`` steps. If a callback
+    does not override :meth:`pymcmc.Callback.on_step` (or
+    :meth:`pymcmc.Callback.on_record`), then nothing is collected for it.
+
+    All methods take the sampler as their first argument.
+    """
+
+    def on_step(self, sampler, steps):
+        """
+        It is called with a block of steps of the chain.
+
+        :param sampler: The sampler.
+        :type sampler:  :class:`pymcmc.MetropolisHastings`
+        :param steps:   A dictionary with the arrays ``step`` (the number of
+                        each step), ``params`` (the parameters after each
+                        step), ``log_p`` (the log probability after each
+                        step) and ``accepted`` (``True`` if the proposal of
+                        the step was accepted). When many chains are
+                        sampled at once, the second dimension of the arrays
+                        runs over the chains.
+        :type steps:    dict
+        """
+        pass
+
+    def on_record(self, sampler, records):
+        """
+        It is called with a block of the records of the chain (the steps
+        that are kept after burning and thinning).
+
+        :param sampler: The sampler.
+        :type sampler:  :class:`pymcmc.MetropolisHastings`
+        :param records: A dictionary with the arrays ``step``, ``accepted``
+                        (the number of accepted steps so far) and one array
+                        for each entry of the model state that is stored in
+                        the database (or for ``params``,
+                        ``log_likelihood`` and ``log_prior`` if there is no
+                        database).
+        :type records:  dict
+        """
+        pass
+
+    def on_tune(self, sampler, step, acceptance_rate):
+        """
+        It is called every time the proposal is tuned. All the steps and
+        records up to this point have been passed to the callback before
+        this call.
+
+        :param sampler:         The sampler.
+        :type sampler:          :class:`pymcmc.MetropolisHastings`
+        :param step:            The step after which the proposal was tuned.
+        :type step:             int
+        :param acceptance_rate: The acceptance rate the proposal was tuned
+                                with.
+        :type acceptance_rate:  float
+        """
+        pass
+
+    def on_interrupt(self, sampler, step):
+        """
+        It is called when sampling is interrupted (e.g. with ``Ctrl-C``).
+        All the steps and records up to the interruption have been passed to
+        the callback before this call.
+
+        :param sampler: The sampler.
+        :type sampler:  :class:`pymcmc.MetropolisHastings`
+        :param step:    The number of steps that were completed.
+        :type step:     int
+        """
+        pass
+
+    def on_finish(self, sampler):
+        """
+        It is called when sampling is over (after an interruption too).
+
+        :param sampler: The sampler.
+        :type sampler:  :class:`pymcmc.MetropolisHastings`
+        """
+        pass
+
+
+def _overrides(callback, name):
+    """
+    Return ``True`` if a callback overrides a method of
+    :class:`pymcmc.Callback`.
+    """
+    return (getattr(type(callback), name).__func__ is not
+            getattr(Callback, name).__func__)
+
+
+class _Block(object):
+
+    """
+    Arrays that collect values until they are full.
+    """
+
+    def __init__(self, size):
+        """
+        Initialize the object.
+        """
+        self.size = size
+        self.arrays = None
+        self.num_values = 0
+
+    def append(self, values):
+        """
+        Add a value to each array (a dictionary name -> value).
+
+        :returns:   ``True`` if the block is full.
+        """
+        if self.arrays is None:
+            self.arrays = {}
+            for name, value in values.iteritems():
+                value = np.asarray(value)
+                self.arrays[name] = np.empty((self.size,) + value.shape,
+                                             dtype=value.dtype)
+        j = self.num_values
+        for name, value in values.iteritems():
+            self.arrays[name][j] = value
+        self.num_values = j + 1
+        return self.num_values == self.size
+
+    def pop(self):
+        """
+        Get copies of the collected values and empty the block.
+
+        :returns:   A dictionary of arrays or ``None`` if the block is empty.
+        """
+        if self.num_values == 0:
+            return None
+        block = dict((name, array[:self.num_values].copy())
+                     for name, array in self.arrays.iteritems())
+        self.num_values = 0
+        return block
+
+
+class CallbackList(object):
+
+    """
+    Collects the steps and the records of a chain in blocks and passes them
+    to a list of callbacks.
+
+    The sampling methods call the ``on_*`` methods of this object (which
+    have the same names as those of :class:`pymcmc.Callback` but take
+    single steps and records) and it calls the callbacks.
+
+    :param callbacks:   The callbacks.
+    :type callbacks:    list of :class:`pymcmc.Callback`
+    :param block_size:  The number of steps (records) in a block.
+    :type block_size:   int
+    :param fields:      The entries of the model state that are passed with
+                        the records. If ``None``, then ``params``,
+                        ``log_likelihood`` and ``log_prior`` are passed (not
+                        the gradients, which some models only compute if
+                        they are asked for).
+    :type fields:       list of str
+    """
+
+    def __init__(self, callbacks, block_size=100, fields=None):
+        """
+        Initialize the object.
+        """
+        self.callbacks = list(callbacks)
+        for callback in self.callbacks:
+            assert isinstance(callback, Callback)
+        self.block_size = int(block_size)
+        assert self.block_size >= 1
+        self.fields = list(DEFAULT_FIELDS if fields is None else fields)
+        self.sampler = None
+        self._steps = _Block(self.block_size)
+        self._records = _Block(self.block_size)
+        # Do not collect what nobody asked for (unbound methods are new
+        # objects every time, so we compare the functions)
+        self.wants_steps = any(_overrides(c, 'on_step')
+                               for c in self.callbacks)
+        self.wants_records = any(_overrides(c, 'on_record')
+                                 for c in self.callbacks)
+
+    def on_step(self, step, params, log_p, accepted):
+        """
+        Add a step.
+        """
+        if self._steps.append({'step': step, 'params': params,
+                               'log_p': log_p, 'accepted': accepted}):
+            self._flush_steps()
+
+    def on_record(self, step, accepted, state):
+        """
+        Add a record (``state`` is the model state).
+        """
+        values = dict((name, state[name]) for name in self.fields)
+        values['step'] = step
+        values['accepted'] = accepted
+        if self._records.append(values):
+            self._flush_records()
+
+    def _flush_steps(self):
+        """
+        Pass the collected steps to the callbacks.
+        """
+        steps = self._steps.pop()
+        if steps is not None:
+            for callback in self.callbacks:
+                callback.on_step(self.sampler, steps)
+
+    def _flush_records(self):
+        """
+        Pass the collected records to the callbacks.
+        """
+        records = self._records.pop()
+        if records is not None:
+            for callback in self.callbacks:
+                callback.on_record(self.sampler, records)
+
+    def flush(self):
+        """
+        Pass everything collected so far to the callbacks.
+        """
+        self._flush_steps()
+        self._flush_records()
+
+    def on_tune(self, step, acceptance_rate):
+        """
+        Notify the callbacks that the proposal was tuned.
+        """
+        self.flush()
+        for callback in self.callbacks:
+            callback.on_tune(self.sampler, step, acceptance_rate)
+
+    def on_interrupt(self, step):
+        """
+        Notify the callbacks that sampling was interrupted.
+        """
+        self.flush()
+        for callback in self.callbacks:
+            callback.on_interrupt(self.sampler, step)
+
+    def on_finish(self):
+        """
+        Notify the callbacks that sampling is over.
+        """
+        self.flush()
+        for callback in self.callbacks:
+            callback.on_finish(self.sampler)
@@ -0,0 +1,303 @@
+"""
+Defines the interface of all objects that store MCMC chains.
+
+Author:
+    Ilias Bilionis
+"""
+
+
+__all__ = ['ChainStorage']
+
+
+import atexit
+import weakref
+
+
+# The storages that have not been closed. They are flushed when the
+# interpreter exits. The set holds weak references, so it does not keep a
+# storage (or its open files) alive.
+_open_storages = weakref.WeakSet()
+
+
+def _flush_open_storages():
+    """
+    Write the buffered records of the storages that are still open.
+    """
+    for storage in list(_open_storages):
+        storage._flush_at_exit()
+
+
+def _add_open_storage(storage):
+    """
+    Flush a storage when the interpreter exits unless it is closed (or
+    garbage collected) before that.
+
+    The exit hook is registered when the first storage is opened. The hooks
+    run in reverse order, so it runs before those of the libraries the
+    storage uses (e.g. PyTables closes its files at exit).
+    """
+    global _exit_hook_registered
+    if not _exit_hook_registered:
+        atexit.register(_flush_open_storages)
+        _exit_hook_registered = True
+    _open_storages.add(storage)
+
+
+_exit_hook_registered = False
+
+
+class ChainStorage(object):
+
+    """
+    The base class of all objects that store MCMC chains.
+
+    A storage keeps a list of proposals and a list of chains. Each chain is a
+    sequence of records. A record contains the fields of the model state that
+    are stored (see :attr:`pymcmc.ChainStorage.fields`) as well as the step
+    at which it was taken (``step``), the number of accepted steps so far
+    (``accepted``) and the id of the proposal that was used (``proposal``).
+    """
+
+    # The fields of the model state that are stored
+    fields = None
+
+    def add_proposal(self, state):
+        """
+        Add a proposal to the storage.
+
+        :param state:   The state of the proposal.
+        :type state:    dict
+        """
+        raise NotImplementedError('Implement this.')
+
+    @property
+    def proposal_id(self):
+        """
+        Get the id of the current proposal.
+        """
+        raise NotImplementedError('Implement this.')
+
+    def create_new_chain(self):
+        """
+        Create a new chain.
+
+        :returns:   An object representing the new chain. It can be passed to
+                    :meth:`pymcmc.ChainStorage.add_chain_record`. It also
+                    becomes the current chain.
+        """
+        raise NotImplementedError('Implement this.')
+
+    def add_chain_record(self, step, accepted, state, chain=None):
+        """
+        Add a record to a chain.
+
+        :param step:        The step of the chain.
+        :type step:         int
+        :param accepted:    The number of accepted steps so far.
+        :type accepted:     int
+        :param state:       The state of the model.
+        :type state:        dict
+        :param chain:       The chain to write to (as returned by
+                            :meth:`pymcmc.ChainStorage.create_new_chain`). If
+                            ``None``, then the current chain is used.
+        """
+        raise NotImplementedError('Implement this.')
+
+    def add_checkpoint(self, checkpoint, chain=None):
+        """
+        Store a checkpoint of a chain, replacing any previous one.
+
+        All the records written so far are flushed and the number of records
+        of the chain and the id of the current proposal are added to the
+        checkpoint, so that the chain can be cut back to this point by
+        :meth:`pymcmc.ChainStorage.resume_chain`.
+
+        :param checkpoint:  Everything needed to continue sampling. It must be
+                            picklable.
+        :type checkpoint:   dict
+        :param chain:       The chain (as returned by
+                            :meth:`pymcmc.ChainStorage.create_new_chain`). If
+                            ``None``, then the current chain is used.
+        """
+        raise NotImplementedError('Implement this.')
+
+    def get_checkpoint(self, chain_num):
+        """
+        Get the checkpoint of a chain.
+
+        :param chain_num:   The chain.
+        :type chain_num:    int
+        :returns:           The checkpoint as stored by
+                            :meth:`pymcmc.ChainStorage.add_checkpoint` or
+                            ``None`` if the chain has no checkpoint.
+        """
+        raise NotImplementedError('Implement this.')
+
+    def resume_chain(self, chain_num):
+        """
+        Make a chain the current chain again so that records can be appended
+        to it.
+
+        Any records written after the last checkpoint are removed and the
+        proposal id of the checkpoint becomes the current one.
+
+        :param chain_num:   The chain.
+        :type chain_num:    int
+        :returns:           The checkpoint of the chain.
+        """
+        raise NotImplementedError('Implement this.')
+
+    def add_profile(self, report, chain=None):
+        """
+        Store the timings of the sampling loop of a chain, replacing any
+        previous ones.
+
+        :param report:  The report of a :class:`pymcmc.Profiler` (see
+                        :meth:`pymcmc.Profiler.get_report`).
+        :type report:   dict
+        :param chain:   The chain (as returned by
+                        :meth:`pymcmc.ChainStorage.create_new_chain`). If
+                        ``None``, then the current chain is used.
+        """
+        raise NotImplementedError('Implement this.')
+
+    def get_profile(self, chain_num):
+        """
+        Get the timings of the sampling loop of a chain.
+
+        :param chain_num:   The chain.
+        :type chain_num:    int
+        :returns:           The report stored by
+                            :meth:`pymcmc.ChainStorage.add_profile` or
+                            ``None`` if there is none.
+        """
+        raise NotImplementedError('Implement this.')
+
+    def get_states(self, chain_num, step_num, model=None):
+        """
+        Get the model state and the proposal state from the storage.
+
+        :param chain_num:   The chain.
+        :type chain_num:    int
+        :param step_num:    The record of the chain.
+        :type step_num:     int
+        :param model:       If the chain does not store the whole state of the
+                            model, then the missing entries are recomputed by
+                            setting the parameters of this model to the stored
+                            ones. If ``None``, only the stored entries are
+                            returned.
+        :type model:        :class:`pymcmc.Model`
+        :returns:           A tuple (model_state, proposal_state).
+        """
+        raise NotImplementedError('Implement this.')
+
+    @property
+    def num_chains(self):
+        """
+        Get the number of chains.
+        """
+        raise NotImplementedError('Implement this.')
+
+    def get_num_records(self, chain_num):
+        """
+        Get the number of records of a chain.
+        """
+        raise NotImplementedError('Implement this.')
+
+    def read_chain(self, chain_num, fields=None, start=0, stop=None, step=1):
+        """
+        Read some of the columns of a range of records of a chain.
+
+        :param chain_num:   The chain.
+        :type chain_num:    int
+        :param fields:      The columns to read. If ``None``, then all of them
+                            are read.
+        :type fields:       list of str
+        :param start:       The first record.
+        :type start:        int
+        :param stop:        The record after the last one. If ``None``, read
+                            until the end.
+        :type stop:         int
+        :param step:        Read every ``step`` records.
+        :type step:         int
+        :returns:           A dictionary containing a numpy array for each
+                            column. The first dimension of the arrays runs
+                            over the records.
+        """
+        raise NotImplementedError('Implement this.')
+
+    def iter_chunks(self, chain_nums=None, fields=None, chunk_size=10000,
+                    start=0, stop=None, thin=1):
+        """
+        Iterate over the records of one or more chains in chunks.
+
+        Only one chunk is in memory at a time, so this can go through chains
+        that are larger than the available memory.
+
+        :param chain_nums:  The chains to go through (an int or a list of
+                            ints). If ``None``, then all chains are used.
+        :param fields:      The columns to read. If ``None``, then all of them
+                            are read.
+        :type fields:       list of str
+        :param chunk_size:  The (maximum) number of records in each chunk
+                            (after thinning).
+        :type chunk_size:   int
+        :param start:       The first record of each chain.
+        :type start:        int
+        :param stop:        The record after the last one of each chain. If
+                            ``None``, read until the end of each chain.
+        :type stop:         int
+        :param thin:        Read only every ``thin`` records.
+        :type thin:         int
+        :returns:           A generator of tuples (chain_num, chunk), where
+                            ``chunk`` is as returned by
+                            :meth:`pymcmc.ChainStorage.read_chain`.
+        """
+        assert chunk_size >= 1
+        assert thin >= 1
+        if chain_nums is None:
+            chain_nums = range(self.num_chains)
+        elif isinstance(chain_nums, int):
+            chain_nums = [chain_nums]
+        self.flush()
+        span = chunk_size * thin
+        for chain_num in chain_nums:
+            num_records = self.get_num_records(chain_num)
+            chain_start, chain_stop, _ = slice(start, stop).indices(num_records)
+            for chunk_start in xrange(chain_start, chain_stop, span):
+                chunk_stop = min(chunk_start + span, chain_stop)
+                yield chain_num, self.read_chain(chain_num, fields=fields,
+                                                 start=chunk_start,
+                                                 stop=chunk_stop, step=thin)
+
+    def flush(self):
+        """
+        Make sure that everything written so far reaches the disk.
+        """
+        pass
+
+    def close(self):
+        """
+        Flush and release any resources.
+        """
+        self.flush()
+
+    def _flush_at_exit(self):
+        """
+        Flush the storage when the interpreter exits (if it is still open).
+        """
+        self.flush()
+
+    def _complete_model_state(self, model_state, model):
+        """
+        Add to ``model_state`` the entries of the model state that were not
+        stored by recomputing them from the stored parameters.
+        """
+        if model is None:
+            return model_state
+        model.params = model_state['params']
+        full_state = model.__getstate__()
+        for name in full_state.keys():
+            if not model_state.has_key(name):
+                model_state[name] = full_state[name]
+        return model_state
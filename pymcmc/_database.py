@@ -6,22 +6,63 @@ Author:
 """
 
 
-__all__ = ['DataBase']
+__all__ = ['DataBase', 'merge_databases']
 
 
 import tables as pt
 import numpy as np
 import os
+import time
 from datetime import datetime
 import itertools
 from . import state_to_table_dtype
 from . import UnknownTypeException
+from . import ChainStorage
+from ._chain_storage import _open_storages
+from ._chain_storage import _add_open_storage
 
 
-class DataBase(object):
+class _ChainBuffer(object):
 
     """
-    A database to store MCMC chains.
+    Collects the records of a chain in a preallocated structured array and
+    appends them to the table of the chain in one go.
+
+    :param chain:   The table of the chain.
+    :type chain:    :class:`tables.Table`
+    :param size:    The maximum number of records kept in memory.
+    :type size:     int
+    """
+
+    def __init__(self, chain, size):
+        """
+        Initialize the object.
+        """
+        self.chain = chain
+        self.data = np.zeros(size, dtype=chain.dtype)
+        self.num_records = 0
+
+    @property
+    def is_full(self):
+        """
+        Return ``True`` if there is no more space in the buffer.
+        """
+        return self.num_records == self.data.shape[0]
+
+    def flush(self):
+        """
+        Write the buffered records to the table.
+        """
+        if self.num_records > 0:
+            self.chain.append(self.data[:self.num_records])
+            self.chain.flush()
+            self.num_records = 0
+
+
+class DataBase(ChainStorage):
+
+    """
+    A database to store MCMC chains in an HDF5 file (using PyTables).
 
     :param filename:     The filename of the database.
     :type filename:      str
@@ -31,14 +72,42 @@ class DataBase(object):
     :param proposal_state:     The MCMC proposal. This is needed so that we know
                                exactly what data are required for the proposal.
     :type proposal_state:      dict
+    :param buffer_size:        The chain records are kept in memory and they
+                               are written to the file every ``buffer_size``
+                               records. Use ``1`` to write every record
+                               immediately.
+    :type buffer_size:         int
+    :param flush_interval:     Write the buffered records to the file if more
+                               than so many seconds have passed since the last
+                               write.
+    :type flush_interval:      float
+    :param fields:             The entries of the model state that are stored
+                               with every chain record. If ``None``, then the
+                               whole state is stored. Use it to avoid storing
+                               things that can be recomputed from the
+                               parameters (e.g. gradients).
+    :type fields:              list of str
+
+    .. note::
+        The buffered records are written when the chain changes, when
+        :meth:`pymcmc.DataBase.flush` or :meth:`pymcmc.DataBase.close` is
+        called and when the interpreter exits.
     """
 
-    def __init__(self, filename, model_state, proposal_state):
+    def __init__(self, filename, model_state, proposal_state,
+                 buffer_size=100, flush_interval=10., fields=None):
         """
         Initialize the object.
         """
         self.filename = filename
-        self.ChainRecordDType = state_to_table_dtype(model_state)
+        self.fields = list(model_state.keys() if fields is None else fields)
+        self.buffer_size = int(buffer_size)
+        assert self.buffer_size >= 1
+        self.flush_interval = float(flush_interval)
+        self._buffers = {}
+        self._last_flush = time.time()
+        self.ChainRecordDType = state_to_table_dtype(model_state,
+                                                     fields=self.fields)
         self.ChainRecordDType['step'] = pt.UInt32Col()
         self.ChainRecordDType['accepted'] = pt.UInt32Col()
         self.ChainRecordDType['proposal'] = pt.UInt16Col()
@@ -59,6 +128,9 @@ class DataBase(object):
             self.fd.create_table('/mcmc', 'chain_counter',
                                  self.ChainCounterDType, 'Chain Counter')
             self.fd.create_group('/mcmc', 'data', 'Collection of Chains')
+        # Looking up nodes in the file is slow, so we keep this around
+        self._proposal_id = self.proposals.nrows - 1
+        _add_open_storage(self)
 
     @property
     def proposals(self):
@@ -73,7 +145,31 @@ class DataBase(object):
         """
         Get the id of the current proposal.
         """
-        return self.proposals.nrows - 1
+        return self._proposal_id
+
+    def flush(self):
+        """
+        Write all the buffered chain records to the file.
+        """
+        for buf in self._buffers.values():
+            buf.flush()
+        self._last_flush = time.time()
+
+    def _flush_at_exit(self):
+        """
+        Write the buffered records if the file is still open.
+        """
+        if self.fd.isopen:
+            self.flush()
+
+    def close(self):
+        """
+        Write the buffered records and close the database file.
+        """
+        _open_storages.discard(self)
+        if self.fd.isopen:
+            self.flush()
+            self.fd.close()
 
     def add_proposal(self, state):
         """
@@ -84,11 +180,16 @@ class DataBase(object):
             row[name] = state[name]
         row.append()
         self.proposals.flush()
+        self._proposal_id = self.proposals.nrows - 1
 
     def create_new_chain(self):
         """
         Create a new chain.
+
+        :returns:   The table of the new chain. It also becomes the current
+                    chain.
         """
+        self.flush()
         num_chains = self.chain_counter.nrows
         row = self.chain_counter.row
         row['id'] = num_chains
@@ -100,33 +201,250 @@ class DataBase(object):
                                                   'chain_' + str(num_chains),
                                                   self.ChainRecordDType,
                                                   'Chain Record ' + str(num_chains))
+        self._buffers[self.current_chain._v_name] = _ChainBuffer(self.current_chain,
+                                                                 self.buffer_size)
+        return self.current_chain
 
-    def add_chain_record(self, step, accepted, state):
+    def add_chain_record(self, step, accepted, state, chain=None):
         """
         Add a chain record to the current state.
+
+        :param chain:   The chain table to write to (as returned by
+                        :meth:`pymcmc.DataBase.create_new_chain`). If
+                        ``None``, then the current chain is used.
+
+        Only the entries of ``state`` that are in
+        :attr:`pymcmc.DataBase.fields` are stored. Any stored field that is
+        missing from ``state`` is left zero.
         """
-        row = self.current_chain.row
-        for name in state.keys():
-            row[name] = state[name]
-        row['step'] = step
-        row['accepted'] = int(accepted)
-        row['proposal'] = self.proposal_id
-        row.append()
-        self.current_chain.flush()
+        if chain is None:
+            chain = self.current_chain
+        buf = self._buffers[chain._v_name]
+        record = buf.data[buf.num_records]
+        for name in self.fields:
+            if state.has_key(name):
+                record[name] = state[name]
+        record['step'] = step
+        record['accepted'] = int(accepted)
+        record['proposal'] = self.proposal_id
+        buf.num_records += 1
+        if buf.is_full:
+            buf.flush()
+        if time.time() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def add_checkpoint(self, checkpoint, chain=None):
+        """
+        Store a checkpoint of a chain, replacing any previous one.
+
+        The checkpoint is pickled in ``/mcmc/checkpoints/chain_k``.
+
+        See :meth:`pymcmc.ChainStorage.add_checkpoint`.
+        """
+        if chain is None:
+            chain = self.current_chain
+        self.flush()
+        checkpoint = dict(checkpoint)
+        checkpoint['num_records'] = chain.nrows
+        checkpoint['proposal_id'] = self.proposal_id
+        self._put_object('checkpoints', 'Chain Checkpoints', chain._v_name,
+                         checkpoint)
+
+    def get_checkpoint(self, chain_num):
+        """
+        Get the checkpoint of a chain (or ``None``).
+        """
+        return self._get_object('checkpoints',
+                                self._get_chain(chain_num)._v_name)
+
+    def add_profile(self, report, chain=None):
+        """
+        Store the timings of the sampling loop of a chain, replacing any
+        previous ones.
+
+        The report is pickled in ``/mcmc/profiles/chain_k``.
+
+        See :meth:`pymcmc.ChainStorage.add_profile`.
+        """
+        if chain is None:
+            chain = self.current_chain
+        self._put_object('profiles', 'Sampling Profiles', chain._v_name,
+                         report)
+
+    def get_profile(self, chain_num):
+        """
+        Get the timings of the sampling loop of a chain (or ``None``).
+        """
+        return self._get_object('profiles',
+                                self._get_chain(chain_num)._v_name)
+
+    def _put_object(self, group, title, name, obj):
+        """
+        Pickle an object in ``/mcmc/group/name`` replacing the old one.
+        """
+        where = '/mcmc/' + group
+        if not where in self.fd:
+            self.fd.create_group('/mcmc', group, title)
+        # Write the new object before removing the old one
+        tmp = self.fd.create_vlarray(where, name + '_new', pt.ObjectAtom())
+        tmp.append(obj)
+        tmp.flush()
+        if name in self.fd.get_node(where):
+            self.fd.remove_node(where, name)
+        tmp.rename(name)
+        self.fd.flush()
+
+    def _get_object(self, group, name):
+        """
+        Get the object pickled in ``/mcmc/group/name`` (or ``None``).
+        """
+        where = '/mcmc/' + group
+        if not where + '/' + name in self.fd:
+            return None
+        return self.fd.get_node(where, name)[-1]
+
+    def resume_chain(self, chain_num):
+        """
+        Make a chain the current chain again.
+
+        See :meth:`pymcmc.ChainStorage.resume_chain`.
+        """
+        self.flush()
+        if chain_num < 0:
+            chain_num += self.num_chains
+        checkpoint = self.get_checkpoint(chain_num)
+        if checkpoint is None:
+            raise RuntimeError('Chain ' + str(chain_num)
+                               + ' has no checkpoint.')
+        chain = self._get_chain(chain_num)
+        if chain.nrows > checkpoint['num_records']:
+            chain.remove_rows(checkpoint['num_records'], chain.nrows)
+            chain.flush()
+        self.fields = [name for name in chain.colnames
+                       if not name in ['step', 'accepted', 'proposal']]
+        self.current_chain = chain
+        self._buffers[chain._v_name] = _ChainBuffer(chain, self.buffer_size)
+        self._proposal_id = checkpoint['proposal_id']
+        return checkpoint
+
+    def _get_chain(self, chain_num):
+        """
+        Get the table of a chain.
+        """
+        chain_name = self.chain_counter.cols.name[chain_num]
+        return self.fd.get_node('/mcmc/data', chain_name)
+
+    @property
+    def num_chains(self):
+        return self.chain_counter.nrows
+
+    def get_num_records(self, chain_num):
+        self.flush()
+        return self._get_chain(chain_num).nrows
+
+    def read_chain(self, chain_num, fields=None, start=0, stop=None, step=1):
+        """
+        Read some of the columns of a range of records of a chain.
+
+        See :meth:`pymcmc.ChainStorage.read_chain`.
+        """
+        self.flush()
+        chain = self._get_chain(chain_num)
+        if fields is None:
+            fields = chain.colnames
+        data = {}
+        for name in fields:
+            data[name] = chain.read(start=start, stop=stop, step=step,
+                                    field=name)
+        return data
 
-    def get_states(self, chain_num, step_num):
+    def get_states(self, chain_num, step_num, model=None):
         """
         Get the model state and the proposal state from the data base.
+
+        See :meth:`pymcmc.ChainStorage.get_states`.
         """
+        self.flush()
         model_state = {}
         proposal_state = {}
-        chain_name = self.fd.root.mcmc.chain_counter.cols.name[chain_num]
-        chain = self.fd.get_node('/mcmc/data', chain_name)
+        chain = self._get_chain(chain_num)
         step_data = chain[step_num]
         for name, data in itertools.izip(chain.colnames, step_data):
             model_state[name] = data
+        self._complete_model_state(model_state, model)
         proposals = self.fd.get_node('/mcmc/proposals')
         prop_data = proposals[model_state['proposal']]
         for name, data in itertools.izip(proposals.colnames, prop_data):
             proposal_state[name] = data
         return model_state, proposal_state
+
+
+def _append_chains(fd, src):
+    """
+    Append all the chains of the open database ``src`` to the open database
+    ``fd`` (together with the proposals they refer to).
+    """
+    proposal_offset = fd.root.mcmc.proposals.nrows
+    fd.root.mcmc.proposals.append(src.root.mcmc.proposals.read())
+    fd.root.mcmc.proposals.flush()
+    chain_counter = fd.root.mcmc.chain_counter
+    for src_name in src.root.mcmc.chain_counter.cols.name[:]:
+        num_chains = chain_counter.nrows
+        src_chain = src.get_node('/mcmc/data', src_name)
+        chain = src_chain.copy(fd.root.mcmc.data, 'chain_' + str(num_chains),
+                               title='Chain Record ' + str(num_chains))
+        if chain.nrows > 0 and proposal_offset > 0:
+            chain.modify_column(column=chain.cols.proposal[:] + proposal_offset,
+                                colname='proposal')
+        row = chain_counter.row
+        row['id'] = num_chains
+        row['name'] = 'chain_' + str(num_chains)
+        row['date'] = str(datetime.now())
+        row.append()
+        chain_counter.flush()
+
+
+def merge_databases(filename, shard_filenames, remove_shards=False):
+    """
+    Merge several databases into one.
+
+    The chains of each shard are appended to ``filename`` in the order in
+    which the shards are given and they are renamed so that they follow the
+    chains that are already there (``/mcmc/data/chain_k``). The proposal
+    ids of the records are adjusted accordingly. All databases must have
+    been created with the same kind of model and proposal.
+
+    :param filename:        The database to merge into. If it does not exist,
+                            it is created.
+    :type filename:         str
+    :param shard_filenames: The databases to be merged.
+    :type shard_filenames:  list of str
+    :param remove_shards:   If ``True``, then the shards are deleted after
+                            they are merged.
+    :type remove_shards:    bool
+    """
+    shard_filenames = list(shard_filenames)
+    if len(shard_filenames) == 0:
+        return
+    if not (os.path.exists(filename) and pt.is_pytables_file(filename)):
+        src = pt.open_file(shard_filenames[0], mode='r')
+        try:
+            src.copy_file(filename, overwrite=True)
+        finally:
+            src.close()
+        merged = shard_filenames[1:]
+    else:
+        merged = shard_filenames
+    fd = pt.open_file(filename, mode='a')
+    try:
+        for shard_filename in merged:
+            src = pt.open_file(shard_filename, mode='r')
+            try:
+                _append_chains(fd, src)
+            finally:
+                src.close()
+    finally:
+        fd.close()
+    if remove_shards:
+        for shard_filename in shard_filenames:
+            os.remove(shard_filename)
@@ -0,0 +1,154 @@
+"""
+A cache of model evaluations.
+
+Author:
+    Ilias Bilionis
+"""
+
+
+__all__ = ['EvaluationCache']
+
+
+from collections import OrderedDict
+import numpy as np
+
+
+class EvaluationCache(object):
+
+    """
+    A bounded cache of model states keyed by the exact bytes of the
+    parameters.
+
+    The least recently used entries are evicted when there are more than
+    ``max_entries`` of them or when they take more than ``max_bytes``. Only
+    the numpy arrays of the states are counted towards the size.
+
+    :param max_entries: The maximum number of states kept.
+    :type max_entries:  int
+    :param max_bytes:   The maximum size of the states kept. If ``None``,
+                        then there is no limit.
+    :type max_bytes:    int
+    """
+
+    def __init__(self, max_entries=1000, max_bytes=None):
+        """
+        Initialize the object.
+        """
+        self.max_entries = int(max_entries)
+        assert self.max_entries >= 1
+        self.max_bytes = max_bytes
+        self.clear()
+
+    def clear(self):
+        """
+        Remove all entries and reset the counters.
+        """
+        self._entries = OrderedDict()
+        self.num_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _get_key(params):
+        """
+        Get the key of a parameter vector.
+        """
+        return np.ascontiguousarray(params, dtype='float64').tostring()
+
+    @staticmethod
+    def _get_size(key, state):
+        """
+        Get the size of an entry in bytes.
+        """
+        size = len(key)
+        for value in state.values():
+            if isinstance(value, np.ndarray):
+                size += value.nbytes
+        return size
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def hit_rate(self):
+        """
+        Get the fraction of the lookups that were hits.
+        """
+        num_lookups = self.hits + self.misses
+        return float(self.hits) / num_lookups if num_lookups > 0 else 0.
+
+    def get(self, params):
+        """
+        Look up the state at ``params``.
+
+        :returns:   The state or ``None`` if it is not in the cache.
+        """
+        key = self._get_key(params)
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            self.misses += 1
+            return None
+        # Mark it as the most recently used
+        self._entries[key] = entry
+        self.hits += 1
+        return entry[0]
+
+    def put(self, params, state):
+        """
+        Add the state at ``params`` to the cache.
+
+        The state is not copied, so it should not be modified afterwards
+        (other than adding entries to it, after which
+        :meth:`pymcmc.EvaluationCache.resize` should be called).
+        """
+        key = self._get_key(params)
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.num_bytes -= old[1]
+        size = self._get_size(key, state)
+        self._entries[key] = (state, size)
+        self.num_bytes += size
+        self._evict()
+
+    def resize(self, params):
+        """
+        Count again the size of the state at ``params`` after entries have
+        been added to it (e.g. the gradients) and evict the least recently
+        used states if the cache has become too large.
+
+        It is not a lookup, i.e. it does not change the counters or the
+        order of the entries. If the state is not in the cache, then it does
+        nothing.
+        """
+        key = self._get_key(params)
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        state, old_size = entry
+        size = self._get_size(key, state)
+        self._entries[key] = (state, size)
+        self.num_bytes += size - old_size
+        self._evict()
+
+    def _evict(self):
+        """
+        Remove the least recently used entries until the cache is within its
+        limits (but always keep the last one).
+        """
+        while (len(self._entries) > self.max_entries or
+               (self.max_bytes is not None and
+                self.num_bytes > self.max_bytes and
+                len(self._entries) > 1)):
+            _, (_, size) = self._entries.popitem(last=False)
+            self.num_bytes -= size
+
+    def __str__(self):
+        """
+        Return a string representation of the object.
+        """
+        s = 'Entries:\t' + str(len(self)) + '\n'
+        s += 'Bytes:\t\t' + str(self.num_bytes) + '\n'
+        s += 'Hits:\t\t' + str(self.hits) + '\n'
+        s += 'Misses:\t\t' + str(self.misses) + '\n'
+        s += 'Hit rate:\t%1.3f' % self.hit_rate
+        return s
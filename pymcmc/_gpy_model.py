@@ -23,14 +23,25 @@ class GPyModel(Model):
     :param name:        A name for the model.
     :type name:         str
     :param compute_grad:    Compute gradients of the log probability or not.
+                            Even if it is ``True``, the gradients are computed
+                            only the first time they are needed for a given
+                            set of parameters. So, proposals that do not use
+                            them (e.g. :class:`pymcmc.RandomWalkProposal`) do
+                            not pay for them.
     :type compute_grad:     bool
     :param assign_priors:   If ``True`` then uninformative priors are assigned
                             to the underlying GPyModel.
     :type assign_priors:    bool
+    :param cache:           If given, then every state that is evaluated is
+                            kept in it and setting the parameters to a point
+                            that is found in it does not evaluate anything
+                            (not even the underlying GPy model is changed;
+                            it is only updated if the gradients are needed).
+    :type cache:            :class:`pymcmc.EvaluationCache`
     """
 
     def __init__(self, model, name='GPy model wrapper', compute_grad=True,
-                 assign_priors=True):
+                 assign_priors=True, cache=None):
         """
         Initialize the object.
         """
@@ -39,7 +50,11 @@ class GPyModel(Model):
         self.model = model
         super(GPyModel, self).__init__(name=name)
         self._compute_grad = compute_grad
+        self._staged_state = None
+        self.cache = cache
         self._eval_state()
+        if self.cache is not None:
+            self.cache.put(self._state['params'], self._state)
 
     def _eval_state(self):
         """
@@ -48,21 +63,69 @@ class GPyModel(Model):
         self._state = {}
         self._state['log_likelihood'] = self.model.log_likelihood()
         self._state['log_prior'] = self.model.log_prior()
-        if self._compute_grad:
-            g = self.model._log_likelihood_gradients()
-            self._state['grad_log_likelihood'] = self.model._transform_gradients(g)
-            g = self.model._log_prior_gradients()
-            if isinstance(g, float):
-                g = np.array([g] * self.num_params)
-            self._state['grad_log_prior'] = self.model._transform_gradients(g)
         self._state['params'] = self.model.optimizer_array.copy()
 
+    def _eval_grads(self):
+        """
+        Add the gradients to the current state (if they are not there
+        already).
+        """
+        if self._state.has_key('grad_log_likelihood'):
+            return
+        if not self._compute_grad:
+            raise RuntimeError('The model does not compute gradients'
+                               ' (compute_grad=False).')
+        # After a rollback or a __setstate__, the GPy model may still be at
+        # other parameters
+        if not np.array_equal(self.model.optimizer_array,
+                              self._state['params']):
+            self.model.optimizer_array = self._state['params']
+        g = self.model._log_likelihood_gradients()
+        self._state['grad_log_likelihood'] = self.model._transform_gradients(g)
+        g = self.model._log_prior_gradients()
+        if isinstance(g, float):
+            g = np.array([g] * self.num_params)
+        self._state['grad_log_prior'] = self.model._transform_gradients(g)
+        if self.cache is not None:
+            self.cache.resize(self._state['params'])
+
     def __getstate__(self):
+        if self._compute_grad:
+            self._eval_grads()
+        return self._state
+
+    def get_state(self, fields=None):
+        if fields is None:
+            return self.__getstate__()
+        if self._compute_grad and ('grad_log_likelihood' in fields or
+                                   'grad_log_prior' in fields):
+            self._eval_grads()
         return self._state
 
     def __setstate__(self, state):
         self._state = state
 
+    @property
+    def has_grad(self):
+        return self._compute_grad
+
+    @property
+    def can_stage(self):
+        return True
+
+    def stage(self):
+        # Setting the parameters creates a brand new state, so there is no
+        # need to copy the current one.
+        self._staged_state = self._state
+
+    def commit(self):
+        self._staged_state = None
+
+    def rollback(self):
+        if self._staged_state is not None:
+            self._state = self._staged_state
+            self._staged_state = None
+
     @property
     def log_likelihood(self):
         return self._state['log_likelihood']
@@ -81,8 +144,18 @@ class GPyModel(Model):
 
     @params.setter
     def params(self, value):
+        if self.cache is not None:
+            state = self.cache.get(value)
+            if state is not None:
+                self._state = state
+                return
         self.model.optimizer_array = value
         self._eval_state()
+        if self.cache is not None:
+            self.cache.put(value, self._state)
+            # The transformations of GPy may change the last bits
+            if not np.array_equal(value, self._state['params']):
+                self.cache.put(self._state['params'], self._state)
 
     @property
     def param_names(self):
@@ -90,8 +163,10 @@ class GPyModel(Model):
 
     @property
     def grad_log_likelihood(self):
+        self._eval_grads()
         return self._state['grad_log_likelihood']
 
     @property
     def grad_log_prior(self):
+        self._eval_grads()
         return self._state['grad_log_prior']
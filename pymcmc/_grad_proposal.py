@@ -9,6 +9,8 @@ Author:
 __all__ = ['GradProposal']
 
 
+import copy
+import numpy as np
 from . import Proposal
 
 
@@ -18,7 +20,13 @@ class GradProposal(Proposal):
     The base class for proposals that depend on the gradient of the target
     probability distribution with respect to the parameters.
 
-    The keyword arguments are the same as in :class:`pymcmc.Proposal`.
+    :param mass_matrix: If given, the proposal is preconditioned with it and
+                        it is adapted during the tuning period (by the
+                        proposals that support it).
+    :type mass_matrix:  :class:`pymcmc.MassMatrix`
+
+    The rest of the keyword arguments are the same as in
+    :class:`pymcmc.Proposal`.
     """
 
     def __init__(self, **kwargs):
@@ -27,8 +35,114 @@ class GradProposal(Proposal):
         """
         if not kwargs.has_key('name'):
             kwargs['name'] = 'Grad Proposal'
+        self._grad_cache = []
+        self.mass_matrix = (kwargs['mass_matrix']
+                            if kwargs.has_key('mass_matrix') else None)
         super(GradProposal, self).__init__(**kwargs)
 
+    def __setstate__(self, state):
+        """
+        Set the state of the object.
+        """
+        super(GradProposal, self).__setstate__(state)
+        self._grad_cache = []
+
+    def _dot_chol(self, v):
+        """
+        Multiply by the factor of the inverse mass matrix (if any).
+        """
+        if self.mass_matrix is None:
+            return v
+        return self.mass_matrix.dot_chol(v)
+
+    def _dot_chol_t(self, v):
+        """
+        Multiply by the transpose of the factor of the inverse mass matrix (if
+        any).
+        """
+        if self.mass_matrix is None:
+            return v
+        return self.mass_matrix.dot_chol_t(v)
+
+    def _solve_chol(self, v):
+        """
+        Solve with the factor of the inverse mass matrix (if any).
+        """
+        if self.mass_matrix is None:
+            return v
+        return self.mass_matrix.solve_chol(v)
+
+    def _adapt_mass_matrix(self, params):
+        """
+        Add samples to the estimate of the mass matrix (if any).
+        """
+        if self.mass_matrix is not None:
+            self.mass_matrix.update(params)
+
+    def _apply_mass_matrix(self, normalize=False):
+        """
+        Start using the latest estimate of the mass matrix (if any).
+
+        :param normalize:   See :meth:`pymcmc.MassMatrix.apply`.
+        :returns:           ``True`` if the mass matrix changed.
+        """
+        if self.mass_matrix is None:
+            return False
+        changed = self.mass_matrix.apply(normalize=normalize)
+        if changed:
+            self._grad_cache = []
+        return changed
+
+    def get_checkpoint(self):
+        """
+        Get the state of the object together with the mass matrix.
+        """
+        checkpoint = super(GradProposal, self).get_checkpoint()
+        if self.mass_matrix is not None:
+            checkpoint['mass_matrix'] = copy.deepcopy(self.mass_matrix.__getstate__())
+        return checkpoint
+
+    def set_checkpoint(self, checkpoint):
+        """
+        Restore the proposal from a checkpoint.
+        """
+        checkpoint = dict(checkpoint)
+        mass_matrix = checkpoint.pop('mass_matrix', None)
+        super(GradProposal, self).set_checkpoint(checkpoint)
+        if mass_matrix is not None:
+            self.mass_matrix.__setstate__(copy.deepcopy(mass_matrix))
+
+    def _get_grad(self, model):
+        """
+        Get the gradient of the target at the current parameters of the model
+        (from the cache if we have seen them).
+        """
+        params = model.params
+        for cached_params, grad in self._grad_cache:
+            if np.array_equal(cached_params, params):
+                return grad
+        return model.grad_log_p
+
+    def forget_grads(self):
+        """
+        Forget the gradients remembered from the previous steps.
+
+        Call it if the target changes while the parameters stay the same
+        (e.g. when the temperature of a :class:`pymcmc.TemperedModel`
+        changes). Otherwise, the next step starts from a stale gradient.
+        """
+        self._grad_cache = []
+
+    def _remember_grads(self, *pairs):
+        """
+        Remember the gradients at some points so that the next proposal does
+        not have to ask the model for them.
+
+        :param pairs:   Tuples (params, grad). Usually, the current and the
+                        proposed point.
+        """
+        self._grad_cache = [(np.array(params), grad) for params, grad in pairs]
+
     def _do_propose(self, model):
         """
         Do the actual proposal and change the state of the model to contain
@@ -48,6 +162,27 @@ class GradProposal(Proposal):
         log_p_old_cond_new = self(old_params, new_params, new_grad_params)
         return log_p_old_cond_new - log_p_new_cond_old
 
+    def propose_batch(self, model, state):
+        """
+        Propose a move for many chains at once.
+
+        The ``state`` must contain the gradients, i.e. it should have been
+        computed with ``compute_grad=True``.
+        See :meth:`pymcmc.Proposal.propose_batch`.
+        """
+        old_params = state['params']
+        old_grad_params = state['grad_log_likelihood'] + state['grad_log_prior']
+        new_params = self._sample_batch(old_params, old_grad_params)
+        log_p_new_cond_old = self(new_params, old_params, old_grad_params)
+        new_state = model.eval_batch(new_params, compute_grad=True)
+        new_grad_params = (new_state['grad_log_likelihood'] +
+                           new_state['grad_log_prior'])
+        log_p_old_cond_new = self(old_params, new_params, new_grad_params)
+        log_a1 = ((new_state['log_likelihood'] - state['log_likelihood']) +
+                  (new_state['log_prior'] - state['log_prior']))
+        log_a2 = log_p_old_cond_new - log_p_new_cond_old
+        return new_state, log_a1 + log_a2
+
     def _sample(self, old_params, old_grad_params):
         """
         Sample the proposal given the ``old_params`` and the gradient of the
@@ -59,6 +194,21 @@ class GradProposal(Proposal):
         """
         raise NotImplementedError('Implement this.')
 
+    def _sample_batch(self, old_params, old_grad_params):
+        """
+        Sample the proposal given many ``old_params`` at once.
+
+        :param old_params:      The old parameters (one row per chain).
+        :param old_grad_params: The gradients of the target probability (one
+                                row per chain).
+        :returns:               The new parameters (one row per chain).
+
+        The default implementation loops over the rows. Deriving classes
+        should override it with something faster.
+        """
+        return np.array([self._sample(p, g)
+                         for p, g in zip(old_params, old_grad_params)])
+
     def __call__(self, new_params, old_params, old_grad_params):
         """
         Evaluate the proposal at the new parameters given the old parameters.
@@ -67,5 +217,8 @@ class GradProposal(Proposal):
                                 are conditioning on them.
         :param old_grad_params: The gradient of the target probability with
                                 respect to the parameters.
+
+        If the parameters are 2D arrays (one row per chain), then this should
+        return a 1D array with the value for each row.
         """
         raise NotImplementedError('Implement this.')
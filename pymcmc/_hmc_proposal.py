@@ -0,0 +1,163 @@
+"""
+A Hamiltonian Monte Carlo (HMC) proposal.
+
+Author:
+    Ilias Bilionis
+"""
+
+
+__all__ = ['HMCProposal']
+
+
+import numpy as np
+from . import GradProposal
+from . import SingleParameterTunableProposalConcept
+
+
+class HMCProposal(GradProposal, SingleParameterTunableProposalConcept):
+
+    """
+    A Hamiltonian Monte Carlo proposal.
+
+    A momentum is drawn from a standard normal and the Hamiltonian dynamics
+    are integrated with ``num_steps`` leapfrog steps of size ``step_size``.
+    This costs ``num_steps`` evaluations of the model (the gradient at the
+    starting point is remembered from the previous step). The ratio returned
+    by :meth:`pymcmc.HMCProposal._do_propose` is the change of the kinetic
+    energy, so that the Metropolis-Hastings acceptance probability is that of
+    the change of the total energy.
+
+    If a :class:`pymcmc.MassMatrix` is given (keyword ``mass_matrix``), then
+    the dynamics are those of the momentum ``N(0, Sigma^{-1})``, where
+    ``Sigma`` is the inverse mass matrix. It is estimated from the samples of
+    the tuning period and it is updated every time the proposal is tuned.
+
+    The ``step_size`` is tuned on the acceptance rate (by default the
+    acceptance rate is kept between 0.6 and 0.9). At each step, it is
+    multiplied by a random factor in ``[1 - jitter, 1 + jitter]`` so that the
+    trajectories do not keep coming back to where they started (which
+    happens when their length matches a period of the dynamics).
+
+    :param step_size:   The leapfrog step size.
+    :type step_size:    float
+    :param num_steps:   The number of leapfrog steps.
+    :type num_steps:    int
+    :param jitter:      The relative jitter of the step size
+                        (``0 <= jitter < 1``).
+    :type jitter:       float
+
+    The rest of the keyword arguments is what you would find in:
+        + :class:`pymcmc.GradProposal`
+        + :class:`pymcmc.SingleParameterTunableProposalConcept`
+    """
+
+    def __init__(self, step_size=0.1, num_steps=10, jitter=0.2, **kwargs):
+        """
+        Initialize the object.
+        """
+        self.step_size = step_size
+        self.num_steps = int(num_steps)
+        assert self.num_steps >= 1
+        self.jitter = float(jitter)
+        assert self.jitter >= 0. and self.jitter < 1.
+        if not kwargs.has_key('name'):
+            kwargs['name'] = 'HMC Proposal'
+        if not kwargs.has_key('lowest_ac'):
+            kwargs['lowest_ac'] = 0.6
+        if not kwargs.has_key('highest_ac'):
+            kwargs['highest_ac'] = 0.9
+        kwargs['param_name'] = 'step_size'
+        GradProposal.__init__(self, **kwargs)
+        SingleParameterTunableProposalConcept.__init__(self, **kwargs)
+
+    def _jitter_step_size(self):
+        """
+        Get the step size for the next trajectory.
+        """
+        if self.jitter == 0.:
+            return self.step_size
+        return self.step_size * (1. + self.jitter * (2. * np.random.rand() - 1.))
+
+    def _do_propose(self, model):
+        """
+        Integrate the dynamics and leave the model at the end point.
+
+        :returns:   The kinetic energy at the start minus the kinetic energy
+                    at the end.
+        """
+        old_params = np.array(model.params)
+        old_grad_params = self._get_grad(model)
+        p0 = np.random.randn(old_params.shape[0])
+        step_size = self._jitter_step_size()
+        # We integrate in the coordinates in which the mass matrix is the
+        # unit matrix
+        q = old_params
+        p = p0 + 0.5 * step_size * self._dot_chol_t(old_grad_params)
+        for i in xrange(self.num_steps):
+            q = q + step_size * self._dot_chol(p)
+            model.params = q
+            grad = np.array(model.grad_log_p)
+            if i < self.num_steps - 1:
+                p = p + step_size * self._dot_chol_t(grad)
+        p = p + 0.5 * step_size * self._dot_chol_t(grad)
+        self._remember_grads((old_params, old_grad_params), (q, grad))
+        return 0.5 * (np.dot(p0, p0) - np.dot(p, p))
+
+    def propose_batch(self, model, state):
+        """
+        Propose a move for many chains at once.
+
+        The ``state`` must contain the gradients, i.e. it should have been
+        computed with ``compute_grad=True``.
+
+        See :meth:`pymcmc.Proposal.propose_batch`.
+        """
+        grad = state['grad_log_likelihood'] + state['grad_log_prior']
+        p0 = np.random.randn(*state['params'].shape)
+        step_size = self._jitter_step_size()
+        q = state['params']
+        p = p0 + 0.5 * step_size * self._dot_chol_t(grad)
+        for i in xrange(self.num_steps):
+            q = q + step_size * self._dot_chol(p)
+            new_state = model.eval_batch(q, compute_grad=True)
+            grad = (new_state['grad_log_likelihood'] +
+                    new_state['grad_log_prior'])
+            if i < self.num_steps - 1:
+                p = p + step_size * self._dot_chol_t(grad)
+        p = p + 0.5 * step_size * self._dot_chol_t(grad)
+        log_a1 = ((new_state['log_likelihood'] - state['log_likelihood']) +
+                  (new_state['log_prior'] - state['log_prior']))
+        log_a2 = 0.5 * (np.sum(p0 ** 2, axis=1) - np.sum(p ** 2, axis=1))
+        return new_state, log_a1 + log_a2
+
+    def adapt(self, params):
+        """
+        Add the parameters to the estimate of the mass matrix (if any).
+        """
+        self._adapt_mass_matrix(params)
+
+    def tune(self, ac, verbose=False, **kwargs):
+        """
+        Start using the latest estimate of the mass matrix (if any) and tune
+        the ``step_size``.
+        """
+        # The tuner follows the scale of the steps, so we only use the shape
+        # of the estimated covariance
+        self._apply_mass_matrix(normalize=True)
+        SingleParameterTunableProposalConcept.tune(self, ac, verbose=verbose,
+                                                   **kwargs)
+
+    def __getstate__(self):
+        state = GradProposal.__getstate__(self)
+        state['step_size'] = self.step_size
+        state['num_steps'] = self.num_steps
+        state['jitter'] = self.jitter
+        tuner_state = SingleParameterTunableProposalConcept.__getstate__(self)
+        return dict(state.items() + tuner_state.items())
+
+    def __setstate__(self, state):
+        GradProposal.__setstate__(self, state)
+        self.step_size = state['step_size']
+        self.num_steps = state['num_steps']
+        self.jitter = state['jitter']
+        SingleParameterTunableProposalConcept.__setstate__(self, state)
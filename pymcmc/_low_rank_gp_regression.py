@@ -0,0 +1,162 @@
+"""
+A GP regression model for low-rank kernels.
+
+Author:
+    Ilias Bilionis
+"""
+
+
+__all__ = ['LowRankGPRegression']
+
+
+import numpy as np
+from scipy.linalg import cho_factor
+from scipy.linalg import cho_solve
+from GPy.core import Model
+from GPy.likelihoods import Gaussian
+from . import MeanFunction
+
+
+class LowRankGPRegression(Model):
+
+    """
+    GP regression with a :class:`pymcmc.MeanFunction` kernel and Gaussian
+    noise, i.e. with the covariance matrix:
+
+        C = Phi diag(variance) Phi^T + noise_variance I,
+
+    where ``Phi`` is the ``n x m`` design matrix of the ``m`` basis functions.
+
+    The ``n x n`` matrix ``C`` is never formed. Its inverse and determinant
+    are computed with the Woodbury and the matrix determinant identities
+    through the ``m x m`` matrix:
+
+        A = noise_variance I + F^T F,
+
+    where ``F = Phi diag(variance)^{1/2}`` (see
+    :meth:`pymcmc.MeanFunction.low_rank_factor`). The products ``Phi^T Phi``
+    and ``Phi^T Y`` are computed once (``O(n m^2)``), so the memory is
+    ``O(n m)`` and a new evaluation of the log likelihood and its gradients
+    costs only ``O(m^3)``.
+
+    It is a :class:`GPy.core.Model`, so it can be wrapped by
+    :class:`pymcmc.GPyModel` just like :class:`GPy.models.GPRegression`.
+
+    :param X:               The input points (``n x input_dim``).
+    :type X:                :class:`numpy.ndarray`
+    :param Y:               The observations (``n x output_dim``). The
+                            columns are independent outputs sharing the same
+                            covariance.
+    :type Y:                :class:`numpy.ndarray`
+    :param kernel:          The low-rank kernel.
+    :type kernel:           :class:`pymcmc.MeanFunction`
+    :param noise_variance:  The initial variance of the noise.
+    :type noise_variance:   float
+    :param name:            A name for the model.
+    :type name:             str
+    """
+
+    def __init__(self, X, Y, kernel, noise_variance=1., name='low rank gp'):
+        """
+        Initialize the object.
+        """
+        super(LowRankGPRegression, self).__init__(name)
+        if not isinstance(kernel, MeanFunction):
+            raise TypeError('The kernel must be a pymcmc.MeanFunction.')
+        X = np.array(X, dtype='float64')
+        Y = np.array(Y, dtype='float64')
+        assert X.ndim == 2 and Y.ndim == 2
+        assert X.shape[0] == Y.shape[0]
+        self.X = X
+        self.Y = Y
+        self.num_data, self.input_dim = X.shape
+        self.output_dim = Y.shape[1]
+        self.kern = kernel
+        self.likelihood = Gaussian(variance=noise_variance)
+        phi = self.kern.design_matrix(self.X)
+        self._phi_phi = np.dot(phi.T, phi)
+        self._phi_Y = np.dot(phi.T, self.Y)
+        self._Y_Y = np.sum(self.Y ** 2)
+        self.link_parameters(self.kern, self.likelihood)
+
+    def _get_sqrt_variance(self):
+        """
+        Get the square root of the variance of each basis function.
+        """
+        return (np.sqrt(self.kern.variance.values) *
+                np.ones(self.kern.num_basis))
+
+    def parameters_changed(self):
+        """
+        Compute the log likelihood and its gradients.
+        """
+        n = self.num_data
+        m = self.kern.num_basis
+        D = self.output_dim
+        s = float(self.likelihood.variance)
+        sqrt_v = self._get_sqrt_variance()
+        G = self._phi_phi
+        B = self._phi_Y
+        # F^T F and A = s I + F^T F
+        FF = sqrt_v[:, None] * G * sqrt_v[None, :]
+        A = FF + s * np.eye(m)
+        self._A_chol = cho_factor(A, lower=True)
+        log_det_A = 2. * np.sum(np.log(np.diag(self._A_chol[0])))
+        # F^T Y and W = A^{-1} F^T Y
+        FY = sqrt_v[:, None] * B
+        self._W = cho_solve(self._A_chol, FY)
+        FY_W = np.sum(FY * self._W)
+        # Y^T C^{-1} Y = (Y^T Y - Y^T F A^{-1} F^T Y) / s
+        quad = (self._Y_Y - FY_W) / s
+        log_det_C = (n - m) * np.log(s) + log_det_A
+        self._log_marginal_likelihood = -0.5 * (n * D * np.log(2. * np.pi) +
+                                                D * log_det_C + quad)
+        # The gradient of the log likelihood with respect to C is
+        # 0.5 * (alpha alpha^T - D C^{-1}), alpha = C^{-1} Y.
+        # Phi^T alpha:
+        phi_alpha = (B - np.dot(G, sqrt_v[:, None] * self._W)) / s
+        # diag(Phi^T C^{-1} Phi):
+        GS = G * sqrt_v[None, :]
+        Z = cho_solve(self._A_chol, GS.T)
+        phi_C_phi = (np.diag(G) - np.sum(GS.T * Z, axis=0)) / s
+        g = 0.5 * (np.sum(phi_alpha ** 2, axis=1) - D * phi_C_phi)
+        if not self.kern.ARD:
+            g = np.sum(g)
+        self.kern.variance.gradient = g
+        # tr(C^{-1}) and alpha^T alpha
+        A_inv = cho_solve(self._A_chol, np.eye(m))
+        tr_C_inv = (n - m) / s + np.trace(A_inv)
+        alpha_alpha = (self._Y_Y - 2. * FY_W +
+                       np.sum(self._W * np.dot(FF, self._W))) / s ** 2
+        self.likelihood.variance.gradient = 0.5 * (alpha_alpha - D * tr_C_inv)
+
+    def log_likelihood(self):
+        """
+        Get the log marginal likelihood of the data.
+        """
+        return self._log_marginal_likelihood
+
+    def predict(self, Xnew, full_cov=False):
+        """
+        Predict the observations at ``Xnew`` (including the noise).
+
+        :param Xnew:        The input points.
+        :type Xnew:         :class:`numpy.ndarray`
+        :param full_cov:    If ``True``, then the full predictive covariance
+                            is returned. Otherwise, only its diagonal.
+        :type full_cov:     bool
+        :returns:           A tuple (mean, variance) with the mean
+                            (``num_new x output_dim``) and the variance
+                            (``num_new x 1``) or the covariance
+                            (``num_new x num_new``).
+        """
+        s = float(self.likelihood.variance)
+        # The posterior of the weights of the factor is N(W, s A^{-1})
+        F_new = self.kern.low_rank_factor(np.asarray(Xnew))
+        mean = np.dot(F_new, self._W)
+        A_inv_F = cho_solve(self._A_chol, F_new.T)
+        if full_cov:
+            var = s * np.dot(F_new, A_inv_F) + s * np.eye(F_new.shape[0])
+        else:
+            var = s * np.sum(F_new * A_inv_F.T, axis=1)[:, None] + s
+        return mean, var
@@ -9,8 +9,8 @@ Author:
 __all__ = ['MALAProposal']
 
 
+import math
 import numpy as np
-from scipy.stats import norm
 from . import GradProposal
 from . import SingleParameterTunableProposalConcept
 
@@ -24,6 +24,15 @@ class MALAProposal(GradProposal, SingleParameterTunableProposalConcept):
                     you make and the acceptance rate will go down.
     :type dt:       float
     
+    If a :class:`pymcmc.MassMatrix` is given (keyword ``mass_matrix``), then
+    the proposal is ``N(params + dt^2 / 2 Sigma grad, dt^2 Sigma)``, where
+    ``Sigma`` is the inverse mass matrix. It is estimated from the samples of
+    the tuning period and it is updated every time the proposal is tuned.
+
+    The gradients of the last two points that were visited (the current and
+    the proposed one) are remembered, so that the next step does not have to
+    ask the model for the gradient at the current point again.
+
     The rest of the keyword arguments is what you would find in:
         + :class:`pymcmc.GradProposal`
         + :class:`pymcmc.SingleParameterTunableProposal`
@@ -41,15 +50,67 @@ class MALAProposal(GradProposal, SingleParameterTunableProposalConcept):
         GradProposal.__init__(self, **kwargs)
         SingleParameterTunableProposalConcept.__init__(self, **kwargs)
 
+    def _do_propose(self, model):
+        """
+        Do the actual proposal reusing the gradient at the current point.
+
+        See :meth:`pymcmc.GradProposal._do_propose`.
+        """
+        old_params = np.array(model.params)
+        old_grad_params = self._get_grad(model)
+        old_mean = old_params + 0.5 * self.dt ** 2 * self._drift(old_grad_params)
+        z = np.random.randn(old_params.shape[0])
+        new_params = old_mean + self.dt * self._dot_chol(z)
+        model.params = new_params
+        new_grad_params = np.array(model.grad_log_p)
+        new_mean = new_params + 0.5 * self.dt ** 2 * self._drift(new_grad_params)
+        self._remember_grads((old_params, old_grad_params),
+                             (new_params, new_grad_params))
+        # The normalization constants of the two densities cancel
+        r = self._solve_chol(old_params - new_mean) / self.dt
+        return 0.5 * (np.dot(z, z) - np.dot(r, r))
+
+    def _drift(self, grad_params):
+        """
+        Get the preconditioned gradient ``Sigma grad``.
+        """
+        return self._dot_chol(self._dot_chol_t(grad_params))
+
     def _sample(self, old_params, old_grad_params):
         return (old_params +
-                0.5 * self.dt ** 2 * old_grad_params +
-                self.dt * np.random.randn(old_params.shape[0]))
+                0.5 * self.dt ** 2 * self._drift(old_grad_params) +
+                self.dt * self._dot_chol(np.random.randn(old_params.shape[0])))
+
+    def _sample_batch(self, old_params, old_grad_params):
+        return (old_params +
+                0.5 * self.dt ** 2 * self._drift(old_grad_params) +
+                self.dt * self._dot_chol(np.random.randn(*old_params.shape)))
 
     def __call__(self, new_params, old_params, old_grad_params):
-        return np.sum(norm.logpdf(new_params,
-                                  loc=(old_params + 0.5 * self.dt ** 2 * old_grad_params),
-                                  scale=self.dt))
+        r = self._solve_chol(new_params - old_params -
+                             0.5 * self.dt ** 2 * self._drift(old_grad_params)) / self.dt
+        d = new_params.shape[-1]
+        log_det = (0. if self.mass_matrix is None
+                   else self.mass_matrix.log_det_chol)
+        return (-0.5 * np.sum(r ** 2, axis=-1) - d * math.log(self.dt)
+                - log_det - 0.5 * d * math.log(2. * math.pi))
+
+    def adapt(self, params):
+        """
+        Add the parameters to the estimate of the mass matrix (if any).
+        """
+        self._adapt_mass_matrix(params)
+
+    def tune(self, ac, verbose=False, **kwargs):
+        """
+        Start using the latest estimate of the mass matrix (if any) and tune
+        ``dt``.
+        """
+        # The tuner follows the scale of the steps, so we only use the shape
+        # of the estimated covariance
+        self._apply_mass_matrix(normalize=True)
+        SingleParameterTunableProposalConcept.tune(self, ac, verbose=verbose,
+                                                   **kwargs)
 
     def __getstate__(self):
         state = GradProposal.__getstate__(self)
@@ -60,4 +121,4 @@ class MALAProposal(GradProposal, SingleParameterTunableProposalConcept):
     def __setstate__(self, state):
         GradProposal.__setstate__(self, state)
         self.dt = state['dt']
-        SingleParameterTunableProposalConcept.__setstate__(self, state['tuner'])
+        SingleParameterTunableProposalConcept.__setstate__(self, state)
@@ -0,0 +1,207 @@
+"""
+A mass matrix (preconditioner) for the gradient based proposals.
+
+Author:
+    Ilias Bilionis
+"""
+
+
+__all__ = ['MassMatrix']
+
+
+import numpy as np
+
+
+class MassMatrix(object):
+
+    """
+    The inverse mass matrix (metric) used to precondition a gradient based
+    proposal.
+
+    It is an estimate of the covariance of the target. If ``Sigma = L L^T``,
+    then the proposals move in the coordinates ``x = L^{-1} params``, in which
+    the target should look isotropic. Until the first estimate is available,
+    ``Sigma`` is the unit matrix.
+
+    The covariance of the samples passed to
+    :meth:`pymcmc.MassMatrix.update` is estimated on the fly (Welford's
+    algorithm) and it becomes the metric when
+    :meth:`pymcmc.MassMatrix.apply` is called. Then, the samples are
+    forgotten, i.e. each metric is estimated from the window of samples
+    since the previous one, so the transient from the initial point does not
+    stay in the estimate. As in Stan, the estimate is shrunk towards a small
+    multiple of the unit matrix:
+
+        Sigma = n / (n + 5) S + 1e-3 * 5 / (n + 5) I.
+
+    :param dense:       If ``True``, then a dense metric is estimated.
+                        Otherwise, only its diagonal.
+    :type dense:        bool
+    :param min_samples: The minimum number of samples needed for an estimate.
+    :type min_samples:  int
+    """
+
+    def __init__(self, dense=False, min_samples=10):
+        """
+        Initialize the object.
+        """
+        self.dense = dense
+        self.min_samples = int(min_samples)
+        assert self.min_samples >= 2
+        self.inv_metric = None
+        self._chol = None
+        self._chol_inv = None
+        self.reset()
+
+    def reset(self):
+        """
+        Forget the samples seen so far (but not the current metric).
+        """
+        self.num_samples = 0
+        self._mean = None
+        self._m2 = None
+
+    @property
+    def is_identity(self):
+        """
+        Return ``True`` if the metric has not been estimated yet.
+        """
+        return self.inv_metric is None
+
+    def update(self, params):
+        """
+        Add samples to the estimate of the covariance.
+
+        :param params:  A sample (1D array) or many samples (one per row).
+        :type params:   :class:`numpy.ndarray`
+        """
+        for x in np.atleast_2d(params):
+            if self._mean is None:
+                d = x.shape[0]
+                self._mean = np.zeros(d)
+                self._m2 = np.zeros((d, d)) if self.dense else np.zeros(d)
+            self.num_samples += 1
+            delta = x - self._mean
+            self._mean += delta / self.num_samples
+            if self.dense:
+                self._m2 += np.outer(delta, x - self._mean)
+            else:
+                self._m2 += delta * (x - self._mean)
+
+    def apply(self, normalize=False):
+        """
+        Make the current estimate of the covariance the metric and start a
+        new estimate.
+
+        :param normalize:   If ``True``, then the metric is scaled so that its
+                            determinant is one. That is, only the shape of the
+                            covariance is used and the overall scale is left
+                            to the step size of the proposal. This keeps the
+                            steps from shrinking (or growing) abruptly when
+                            the metric changes before the step size has had a
+                            chance to adjust.
+        :type normalize:    bool
+        :returns:           ``True`` if the metric changed (there were enough
+                            samples).
+        """
+        n = self.num_samples
+        if n < self.min_samples:
+            return False
+        S = self._m2 / (n - 1.)
+        reg = 1e-3 * 5. / (n + 5.)
+        inv_metric = n / (n + 5.) * S
+        if self.dense:
+            inv_metric += reg * np.eye(S.shape[0])
+        else:
+            inv_metric += reg
+        if normalize:
+            diag = np.diag(inv_metric) if self.dense else inv_metric
+            if self.dense:
+                log_det = 2. * np.sum(np.log(np.diag(np.linalg.cholesky(inv_metric))))
+            else:
+                log_det = np.sum(np.log(diag))
+            inv_metric = inv_metric / np.exp(log_det / diag.shape[0])
+        self.set_inv_metric(inv_metric)
+        self.reset()
+        return True
+
+    def set_inv_metric(self, inv_metric):
+        """
+        Set the metric (a vector for a diagonal metric or a matrix).
+        """
+        inv_metric = np.array(inv_metric, dtype='float64')
+        assert inv_metric.ndim == (2 if self.dense else 1)
+        self.inv_metric = inv_metric
+        if self.dense:
+            self._chol = np.linalg.cholesky(inv_metric)
+            self._chol_inv = np.linalg.inv(self._chol)
+        else:
+            self._chol = np.sqrt(inv_metric)
+            self._chol_inv = 1. / self._chol
+
+    def dot_chol(self, v):
+        """
+        Compute ``L v`` (``v`` may have one vector per row).
+        """
+        if self.is_identity:
+            return v
+        if self.dense:
+            return np.dot(v, self._chol.T)
+        return self._chol * v
+
+    def dot_chol_t(self, v):
+        """
+        Compute ``L^T v`` (``v`` may have one vector per row).
+        """
+        if self.is_identity:
+            return v
+        if self.dense:
+            return np.dot(v, self._chol)
+        return self._chol * v
+
+    def solve_chol(self, v):
+        """
+        Compute ``L^{-1} v`` (``v`` may have one vector per row).
+        """
+        if self.is_identity:
+            return v
+        if self.dense:
+            return np.dot(v, self._chol_inv.T)
+        return self._chol_inv * v
+
+    @property
+    def log_det_chol(self):
+        """
+        Get the logarithm of the determinant of ``L``.
+        """
+        if self.is_identity:
+            return 0.
+        if self.dense:
+            return np.sum(np.log(np.diag(self._chol)))
+        return np.sum(np.log(self._chol))
+
+    def __getstate__(self):
+        """
+        Get the state of the object.
+        """
+        state = {}
+        state['dense'] = self.dense
+        state['min_samples'] = self.min_samples
+        state['inv_metric'] = self.inv_metric
+        state['num_samples'] = self.num_samples
+        state['mean'] = self._mean
+        state['m2'] = self._m2
+        return state
+
+    def __setstate__(self, state):
+        """
+        Set the state of the object.
+        """
+        self.dense = state['dense']
+        self.min_samples = state['min_samples']
+        self.inv_metric = None
+        if state['inv_metric'] is not None:
+            self.set_inv_metric(state['inv_metric'])
+        self.num_samples = state['num_samples']
+        self._mean = state['mean']
+        self._m2 = state['m2']
@@ -20,6 +20,10 @@ from GPy.util.caching import Cache_this
 import numpy as np
 
 
+# The number of design matrices kept by a mean function
+DESIGN_MATRIX_CACHE_SIZE = 5
+
+
 class MeanFunction(Kern):
 
     """
@@ -112,6 +116,7 @@ class MeanFunction(Kern):
                             ' basis functions it contains.')
         self._basis = basis
         self._num_params = basis.num_output
+        self._design_matrices = []
         if not ARD:
             if variance is None:
                 variance = np.ones(1)
@@ -129,6 +134,42 @@ class MeanFunction(Kern):
         self.variance = Param('variance', variance, Logexp())
         self.link_parameters(self.variance)
 
+    def design_matrix(self, X):
+        """
+        Get the design matrix of the basis at ``X``.
+
+        The basis is evaluated only the first time it is needed for some
+        ``X``. The design matrices of the last few inputs are kept (together
+        with copies of the inputs so that we can tell if they change).
+        """
+        for cached_X, phi in self._design_matrices:
+            if cached_X.shape == X.shape and np.array_equal(cached_X, X):
+                return phi
+        phi = np.asarray(self.basis(X))
+        self._design_matrices.insert(0, (np.array(X), phi))
+        del self._design_matrices[DESIGN_MATRIX_CACHE_SIZE:]
+        return phi
+
+    def _design_matrices_of(self, X, X2):
+        """
+        Get the design matrices at ``X`` and ``X2``.
+        """
+        phi_X = self.design_matrix(X)
+        phi_X2 = phi_X if X2 is None or X2 is X else self.design_matrix(X2)
+        return phi_X, phi_X2
+
+    def low_rank_factor(self, X):
+        """
+        Get a factor ``F`` of the covariance matrix at ``X``, i.e.
+        ``K(X) = F F^T``.
+
+        It is ``Phi diag(variance)^{1/2}``, an ``n x num_basis`` matrix. Use it
+        instead of :meth:`pymcmc.MeanFunction.K` when ``n`` is large (see
+        :class:`pymcmc.LowRankGPRegression`).
+        """
+        phi_X = self.design_matrix(X)
+        return phi_X * np.sqrt(self.variance.values)
+
     @Cache_this(limit=5, ignore_args=())
     def K(self, X, X2=None):
         """
@@ -136,11 +177,8 @@ class MeanFunction(Kern):
         If ``X2`` is ``None`` the covariance matrix is computed. The result is
         added to ``target``.
         """
-        # Compute the design matrix
-        # TODO: This should happen only once if X does not change!
-        phi_X = self.basis(X)
-        phi_X2 = phi_X if X2 is None or X2 is X else self.basis(X2)
-        return np.einsum('ij,j,kj', phi_X, self.variance, phi_X2)
+        phi_X, phi_X2 = self._design_matrices_of(X, X2)
+        return np.dot(phi_X * self.variance.values, phi_X2.T)
 
     @Cache_this(limit=5, ignore_args=())
     def Kdiag(self, X):
@@ -148,8 +186,8 @@ class MeanFunction(Kern):
         Evaluate only the diagonal part of the covariance matrix at ``X`` and
         add it to ``target``.
         """
-        phi_X = self.basis(X)
-        return np.einsum('ij,j,ij->i', phi_X, self.variance, phi_X)
+        phi_X = self.design_matrix(X)
+        return np.dot(phi_X ** 2, self.variance.values * np.ones(phi_X.shape[1]))
 
     def update_gradients_full(self, dL_dK, X, X2=None):
         """
@@ -157,7 +195,8 @@ class MeanFunction(Kern):
         (dL_dK), compute the gradient wrt the parameters of this kernel,
         and store in the parameters object as e.g. self.variance.gradient
         """
-        phi_X = self.basis(X)
-        phi_X2 = phi_X if X2 is None or X2 is X else self.basis(X2)
-        i = 0
-        self.variance.gradient = np.einsum('ij,ik,jk->k', dL_dK, phi_X, phi_X2)
\ No newline at end of file
+        phi_X, phi_X2 = self._design_matrices_of(X, X2)
+        g = np.sum(phi_X * np.dot(dL_dK, phi_X2), axis=0)
+        if not self.ARD:
+            g = np.sum(g)
+        self.variance.gradient = g
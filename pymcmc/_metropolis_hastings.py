@@ -10,18 +10,28 @@ __all__ = ['MetropolisHastings']
 
 
 from . import Model
-from . import GPyModel
 from . import Proposal
+from . import GradProposal
 from . import TunableProposalConcept
 from . import RandomWalkProposal
-from . import MALAProposal
-from . import DataBase
-import GPy
+from . import ChainStorage
+from . import OnlineDiagnostics
+from . import Profiler
+from . import Callback
+from . import CallbackList
 import numpy as np
+import copy
 import math
 import sys
 
 
+# The entries of the model state that hold the gradients
+GRAD_FIELDS = ['grad_log_likelihood', 'grad_log_prior']
+
+# The entries of the model state that do not need the gradients
+NO_GRAD_FIELDS = ['params', 'log_likelihood', 'log_prior']
+
+
 class MetropolisHastings(object):
 
     """
@@ -29,42 +39,105 @@ class MetropolisHastings(object):
 
     :param model:       The model to sample from.
     :type model:        :class:`pymcmc.Model`
-    :param proposal:    The MCMC proposal.
+    :param proposal:    The MCMC proposal. If ``None``, then a
+                        :class:`pymcmc.RandomWalkProposal` is used, even if
+                        the model has gradients. A gradient based proposal
+                        (e.g. :class:`pymcmc.MALAProposal`) has to be picked
+                        explicitly, because for some models (e.g. GPs) the
+                        gradients cost much more than the log probability.
     :type proposal:     :class:`pymcmc.Proposal`
     :param db_filename: A filename to store the MCMC chains. If ``None``, then
                         nothing is saved.
     :type db_filename:  str
+    :param db_buffer_size:      The number of chain records kept in memory
+                                before they are written to the database.
+    :type db_buffer_size:       int
+    :param db_flush_interval:   Write the buffered chain records to the
+                                database at least this often (in seconds).
+    :type db_flush_interval:    float
+    :param db_fields:           The entries of the model state that are
+                                stored in the database. If ``None``, then the
+                                whole state is stored, except for the
+                                gradients if the proposal does not use them
+                                (storing them would compute them at every
+                                step).
+    :type db_fields:            list of str
+    :param db:                  Store the chains in this object instead of
+                                in a :class:`pymcmc.DataBase` (e.g. use a
+                                :class:`pymcmc.NumpyDataBase`). If it is
+                                given, then all the other database
+                                parameters are ignored.
+    :type db:                   :class:`pymcmc.ChainStorage`
     """
 
     def __init__(self, model, proposal=None,
-                 db_filename=None):
+                 db_filename=None, db_buffer_size=100,
+                 db_flush_interval=10., db_fields=None, db=None):
         """
         Initialize the object.
         """
-        if isinstance(model, GPy.core.Model):
+        # A GPy model can only be passed if GPy has been imported, so we do
+        # not import GPy just to check
+        if ('GPy' in sys.modules and
+            isinstance(model, sys.modules['GPy'].core.Model)):
+            from . import GPyModel
             model = GPyModel(model)
         else:
             assert isinstance(model, Model)
         self.model = model
         if proposal is None:
-            try:
-                y = model.grad_log_p
-                proposal = MALAProposal()
-            except:
-                proposal = RandomWalkProposal()
+            proposal = RandomWalkProposal()
         assert isinstance(proposal, Proposal)
         self.proposal = proposal
+        self.diagnostics = None
+        self.profiler = None
+        self._callbacks = None
         self.db_filename = db_filename
-        if self.has_db:
-            self.db = DataBase(db_filename, model.__getstate__(),
-                               proposal.__getstate__())
+        self._db_buffer_size = db_buffer_size
+        self._db_flush_interval = db_flush_interval
+        if db is not None:
+            assert isinstance(db, ChainStorage)
+            self.db = db
+        elif db_filename is not None:
+            from . import DataBase
+            model_state, db_fields = self._get_db_model_state(db_fields)
+            self.db = DataBase(db_filename, model_state,
+                               proposal.__getstate__(),
+                               buffer_size=db_buffer_size,
+                               flush_interval=db_flush_interval,
+                               fields=db_fields)
+        else:
+            self.db = None
+
+    def _get_db_model_state(self, db_fields=None):
+        """
+        Get the model state a database is created from and the entries of
+        it that are stored.
+
+        :param db_fields:   The entries the user asked for. If ``None``, then
+                            the whole state is stored, except for the
+                            gradients if the proposal does not use them
+                            (storing them would compute them at every step).
+        :type db_fields:    list of str
+        :returns:           A tuple of the model state and the stored fields
+                            (``None`` means all of them).
+        """
+        if db_fields is None and not isinstance(self.proposal, GradProposal):
+            model_state = self.model.get_state(NO_GRAD_FIELDS)
+            db_fields = [name for name in model_state.keys()
+                         if not name in GRAD_FIELDS]
+        elif db_fields is None:
+            model_state = self.model.__getstate__()
+        else:
+            model_state = self.model.get_state(db_fields)
+        return model_state, db_fields
 
     @property
     def has_db(self):
         """
         Return ``True`` if we are using a database, ``False`` otherwise.
         """
-        return self.db_filename is not None
+        return self.db is not None
 
     @property
     def acceptance_rate(self):
@@ -73,11 +146,107 @@ class MetropolisHastings(object):
         """
         return self.accepted / self.count
 
+    def _tuning_acceptance_rate(self):
+        """
+        Get the acceptance rate since the last time the proposal was tuned.
+
+        Tuning on the overall acceptance rate reacts too slowly once the
+        proposal has changed, e.g. the step keeps growing long after the
+        proposals stopped being accepted.
+        """
+        accepted, count = self._last_tune
+        rate = (self.accepted - accepted) / (self.count - count)
+        self._last_tune = (copy.copy(self.accepted), self.count)
+        return rate
+
+    def _init_diagnostics(self, diagnostics, num_chains):
+        """
+        Set up the diagnostics object used by the sampling methods.
+        """
+        if diagnostics is True:
+            diagnostics = OnlineDiagnostics(self.model.num_params,
+                                            num_chains=num_chains)
+        elif diagnostics is False:
+            diagnostics = None
+        else:
+            assert isinstance(diagnostics, OnlineDiagnostics)
+            assert diagnostics.num_chains == num_chains
+        self.diagnostics = diagnostics
+
+    def _init_profiler(self, profile):
+        """
+        Set up the profiler used by the sampling methods.
+        """
+        if profile is True:
+            profile = Profiler()
+        elif profile is False:
+            profile = None
+        else:
+            assert isinstance(profile, Profiler)
+        self.profiler = profile
+
+    def _init_callbacks(self, callbacks, block_size, fields=None):
+        """
+        Set up the callbacks used by the sampling methods.
+
+        The records passed to the callbacks have the given ``fields`` or, if
+        ``None``, those stored in the database.
+        """
+        if callbacks is None:
+            self._callbacks = None
+            return
+        if isinstance(callbacks, Callback):
+            callbacks = [callbacks]
+        if fields is None and self.has_db:
+            fields = self.db.fields
+        self._callbacks = CallbackList(callbacks, block_size=block_size,
+                                       fields=fields)
+        self._callbacks.sampler = self
+
+    def _prepare(self, num_chains=None, diagnostics=False, profile=False,
+                 callbacks=None, callback_block_size=100):
+        """
+        Reset the counters and set up the diagnostics, the profiler and the
+        callbacks before sampling.
+
+        :param num_chains:  The number of chains of
+                            :meth:`pymcmc.MetropolisHastings.sample_batch`.
+                            If ``None``, then there is a single chain and
+                            the counters are numbers instead of arrays.
+        :type num_chains:   int
+
+        The rest of the parameters are as in
+        :meth:`pymcmc.MetropolisHastings.sample`.
+        """
+        if num_chains is None:
+            self.accepted = 0.
+            self._last_tune = (0., 0.)
+        else:
+            self.accepted = np.zeros(num_chains)
+            self._last_tune = (np.zeros(num_chains), 0.)
+        self.count = 0.
+        self._init_diagnostics(diagnostics,
+                               1 if num_chains is None else num_chains)
+        self._init_profiler(profile)
+        self._init_callbacks(callbacks, callback_block_size)
+
+    def _diagnostics_str(self):
+        """
+        Return a short description of the diagnostics for verbose output.
+        """
+        if self.diagnostics is None:
+            return ''
+        return (', min ESS: %.1f, max split-R-hat: %1.3f'
+                % (self.diagnostics.min_ess,
+                   np.max(self.diagnostics.split_rhat)))
+
     def sample(self, num_samples, num_thin=1, num_burn=0,
                init_model_state=None, init_proposal_state=None,
                start_tuning_after=0, stop_tuning_after=None,
                tuning_frequency=1000,
-               verbose=False):
+               verbose=False, diagnostics=False,
+               checkpoint_frequency=None, profile=False,
+               callbacks=None, callback_block_size=100):
         """
         Take samples from the target.
 
@@ -99,10 +268,56 @@ class MetropolisHastings(object):
                                     ``num_samples``.
         :type start_tuning_after:   int
         :param stop_tuning_after:   Stop tuning after this sample. If ``None``, then
-                                    we never stop tuning.
+                                    we tune until the last sample. When the
+                                    tuning stops,
+                                    :meth:`pymcmc.TunableProposalConcept.finish_tuning`
+                                    is called.
         :type stop_tuning_after:    int
         :param tuning_frequecny:    Tune every so many samples.
         :type param:                int
+
+        Diagnostics:
+        :param diagnostics:     If ``True``, then convergence diagnostics are
+                                computed while sampling (after the burn-in
+                                period) and they are stored in
+                                :attr:`pymcmc.MetropolisHastings.diagnostics`.
+                                You may also pass your own
+                                :class:`pymcmc.OnlineDiagnostics` object.
+        :type diagnostics:      bool or :class:`pymcmc.OnlineDiagnostics`
+
+        Checkpoints:
+        :param checkpoint_frequency:    Write a checkpoint to the database
+                                        every so many samples (and at the
+                                        end). A checkpoint contains
+                                        everything needed to continue the
+                                        chain exactly as if it had never
+                                        stopped (see
+                                        :meth:`pymcmc.MetropolisHastings.resume`).
+                                        If ``None``, no checkpoints are
+                                        written.
+        :type checkpoint_frequency:     int
+
+        Profiling:
+        :param profile:         If ``True``, then the time spent in each phase
+                                of the sampling loop (proposing, evaluating
+                                the model and its gradients, accepting,
+                                storing and tuning) is recorded in
+                                :attr:`pymcmc.MetropolisHastings.profiler`.
+                                The report is also written to the database
+                                (see :meth:`pymcmc.ChainStorage.get_profile`).
+                                You may also pass your own
+                                :class:`pymcmc.Profiler` object in order to
+                                add up the times of many calls.
+        :type profile:          bool or :class:`pymcmc.Profiler`
+
+        Callbacks:
+        :param callbacks:           Objects that are notified of the steps,
+                                    the records, the tuning, the interruption
+                                    and the end of sampling.
+        :type callbacks:            list of :class:`pymcmc.Callback`
+        :param callback_block_size: The steps (and the records) are passed
+                                    to the callbacks in blocks of this size.
+        :type callback_block_size:  int
         """
         # Set the initial state of the model.
         if init_model_state is not None:
@@ -112,51 +327,390 @@ class MetropolisHastings(object):
         # Check the tuning parameters
         start_tuning_after = (num_samples if start_tuning_after is None
                               else start_tuning_after)
-        stop_tuning_after = (num_samples if stop_tuning_after is None
-                             else stop_tuning_after)
+        # The tuning period ends at the last sample at the latest (so that
+        # the proposal is told that it is over)
+        stop_tuning_after = (num_samples - 1 if stop_tuning_after is None
+                             else min(stop_tuning_after, num_samples - 1))
         # Initialize counters
-        self.accepted = 0.
-        self.count = 0.
+        self._prepare(diagnostics=diagnostics, profile=profile,
+                      callbacks=callbacks,
+                      callback_block_size=callback_block_size)
         # Initialize the database
         if self.has_db:
             self.db.add_proposal(self.proposal.__getstate__())
             self.db.create_new_chain()
+        elif checkpoint_frequency is not None:
+            raise RuntimeError('Checkpoints require a database.')
+        self._settings = {'num_samples': num_samples,
+                          'num_thin': num_thin,
+                          'num_burn': num_burn,
+                          'start_tuning_after': start_tuning_after,
+                          'stop_tuning_after': stop_tuning_after,
+                          'tuning_frequency': tuning_frequency,
+                          'checkpoint_frequency': checkpoint_frequency}
+        self._sample(0, verbose=verbose, **self._settings)
+
+    def _get_checkpoint(self, step):
+        """
+        Get everything needed to continue sampling from ``step``.
+        """
+        checkpoint = {}
+        checkpoint['step'] = step
+        checkpoint['settings'] = self._settings
+        checkpoint['accepted'] = self.accepted
+        checkpoint['count'] = self.count
+        checkpoint['last_tune'] = self._last_tune
+        checkpoint['rng_state'] = np.random.get_state()
+        # The gradients are recomputed if they are needed after resuming, so
+        # there is no point in evaluating them here
+        if isinstance(self.proposal, GradProposal):
+            model_state = self.model.__getstate__()
+        else:
+            model_state = self.model.get_state(NO_GRAD_FIELDS)
+        checkpoint['model_state'] = copy.deepcopy(model_state)
+        checkpoint['proposal_state'] = self.proposal.get_checkpoint()
+        checkpoint['diagnostics'] = copy.deepcopy(self.diagnostics)
+        return checkpoint
+
+    def resume(self, db_filename=None, chain_num=-1, verbose=False,
+               profile=False, callbacks=None, callback_block_size=100):
+        """
+        Continue a chain from the last checkpoint stored in the database.
+
+        The records written after the checkpoint are discarded. Then, the
+        state of the model, the state of the proposal (including that of the
+        tuner), the counters and the state of the random number generator are
+        restored, and sampling continues with the settings of the original
+        call to :meth:`pymcmc.MetropolisHastings.sample`. The result is
+        exactly the same as if the chain had never stopped.
+
+        :param db_filename: The database to read the checkpoint from. If
+                            ``None``, then the current database is used.
+        :type db_filename:  str
+        :param chain_num:   The chain to continue.
+        :type chain_num:    int
+        :param verbose:     Be verbose or not.
+        :type verbose:      bool
+        :param profile:     Profile the sampling loop or not (see
+                            :meth:`pymcmc.MetropolisHastings.sample`).
+        :type profile:      bool or :class:`pymcmc.Profiler`
+
+        The callbacks are as in :meth:`pymcmc.MetropolisHastings.sample`.
+        """
+        if db_filename is not None:
+            if self.has_db:
+                self.db.close()
+            self.db_filename = db_filename
+            from . import DataBase
+            self.db = DataBase(db_filename, self.model.__getstate__(),
+                               self.proposal.__getstate__(),
+                               buffer_size=self._db_buffer_size,
+                               flush_interval=self._db_flush_interval)
+        if not self.has_db:
+            raise RuntimeError('There is no database to resume from.')
+        checkpoint = self.db.resume_chain(chain_num)
+        self.model.__setstate__(copy.deepcopy(checkpoint['model_state']))
+        self.proposal.set_checkpoint(checkpoint['proposal_state'])
+        self.accepted = checkpoint['accepted']
+        self.count = checkpoint['count']
+        self._last_tune = checkpoint['last_tune']
+        self.diagnostics = checkpoint['diagnostics']
+        self._settings = checkpoint['settings']
+        self._init_profiler(profile)
+        self._init_callbacks(callbacks, callback_block_size)
+        np.random.set_state(checkpoint['rng_state'])
+        self._sample(checkpoint['step'], verbose=verbose, **self._settings)
+
+    def _sample(self, first_step, num_samples, num_thin, num_burn,
+                start_tuning_after, stop_tuning_after, tuning_frequency,
+                checkpoint_frequency, verbose):
+        """
+        Take samples ``first_step, ..., num_samples - 1``.
+
+        This is the actual sampling loop of
+        :meth:`pymcmc.MetropolisHastings.sample`. Everything should be
+        initialized before calling it.
+        """
+        # All model evaluations go through model so that they can be timed
+        model = self.model
+        profiler = self.profiler
+        if profiler is not None:
+            model = profiler.wrap_model(model)
+            profiler.begin()
+        callbacks = self._callbacks
+        step_callbacks = callbacks is not None and callbacks.wants_steps
+        record_callbacks = callbacks is not None and callbacks.wants_records
+        # Avoid copying the state of the model if it supports staging
+        staged = model.can_stage
         try:
             # Start sampling
-            for i in xrange(num_samples):
+            for i in xrange(first_step, num_samples):
                 # MCMC Step
-                new_state, log_p = self.proposal.propose(self.model)
+                if profiler is not None:
+                    profiler.start('propose')
+                if staged:
+                    log_p = self.proposal.propose_staged(model)
+                else:
+                    new_state, log_p = self.proposal.propose(model)
+                if profiler is not None:
+                    profiler.stop()
+                    profiler.start('accept')
                 log_u = math.log(np.random.rand())
-                if log_u <= log_p:
-                    self.model.__setstate__(new_state)
+                is_accepted = log_u <= log_p
+                if is_accepted:
+                    if staged:
+                        model.commit()
+                    else:
+                        model.__setstate__(new_state)
                     self.accepted += 1
+                elif staged:
+                    model.rollback()
                 self.count += 1
+                if profiler is not None:
+                    profiler.stop()
+                if self.diagnostics is not None and i >= num_burn:
+                    self.diagnostics.update(model.params)
+                if step_callbacks:
+                    if profiler is not None:
+                        profiler.start('callbacks')
+                    callbacks.on_step(i + 1, model.params, model.log_p,
+                                      is_accepted)
+                    if profiler is not None:
+                        profiler.stop()
                 # Output
                 if i > num_burn and i % num_thin == 0:
                     # To database
                     if self.has_db:
+                        if profiler is not None:
+                            profiler.start('storage')
                         self.db.add_chain_record(i + 1, self.accepted,
-                                                 self.model.__getstate__())
+                                                 model.get_state(self.db.fields))
+                        if profiler is not None:
+                            profiler.stop()
+                    # To callbacks
+                    if record_callbacks:
+                        if profiler is not None:
+                            profiler.start('callbacks')
+                        callbacks.on_record(i + 1, self.accepted,
+                                            model.get_state(callbacks.fields))
+                        if profiler is not None:
+                            profiler.stop()
                     # To user
                     if verbose:
                         sys.stdout.write('sample ' + str(i + 1).zfill(len(str(num_samples)))
                                          + ' of ' + str(num_samples)
                                          + ', log_p: %.6f, acc. rate: %1.2f'
-                                           % (self.model.log_p, self.acceptance_rate)
+                                           % (model.log_p, self.acceptance_rate)
+                                         + self._diagnostics_str()
                                          + '\r')
                         sys.stdout.flush() 
                 # Tuning
-                if isinstance(self.proposal, TunableProposalConcept):
-                    if (i > 0 and
-                        i >= start_tuning_after and
-                        i % tuning_frequency == 0 and
-                        i <= stop_tuning_after):
-                        self.proposal.tune(self.acceptance_rate, verbose=verbose)
+                if (isinstance(self.proposal, TunableProposalConcept) and
+                    i >= start_tuning_after and i <= stop_tuning_after):
+                    if profiler is not None:
+                        profiler.start('tuning')
+                    self.proposal.adapt(model.params)
+                    if i > 0 and i % tuning_frequency == 0:
+                        ac = self._tuning_acceptance_rate()
+                        self.proposal.tune(ac, verbose=verbose)
+                        if callbacks is not None:
+                            callbacks.on_tune(i + 1, ac)
+                    if i == stop_tuning_after:
+                        self.proposal.finish_tuning()
+                    if profiler is not None:
+                        profiler.stop()
+                # Checkpoint
+                if (checkpoint_frequency is not None and
+                    (i + 1) % checkpoint_frequency == 0):
+                    if profiler is not None:
+                        profiler.start('storage')
+                    self.db.add_checkpoint(self._get_checkpoint(i + 1))
+                    if profiler is not None:
+                        profiler.stop()
+        except KeyboardInterrupt:
+            if staged:
+                # Do not leave the model at a half-processed proposal
+                model.rollback()
+            if verbose:
+                sys.stdout.flush()
+                sys.stdout.write('\n')
+            print '*** Interrupting sampling'
+            if callbacks is not None:
+                callbacks.on_interrupt(int(self.count))
+
+        else:
+            if (checkpoint_frequency is not None and
+                num_samples % checkpoint_frequency != 0):
+                if profiler is not None:
+                    profiler.start('storage')
+                self.db.add_checkpoint(self._get_checkpoint(num_samples))
+                if profiler is not None:
+                    profiler.stop()
+
+        if self.diagnostics is not None:
+            self.diagnostics.flush()
+        if self.has_db:
+            if profiler is not None:
+                profiler.start('storage')
+            self.db.flush()
+            if profiler is not None:
+                profiler.stop()
+        if callbacks is not None:
+            if profiler is not None:
+                profiler.start('callbacks')
+            callbacks.on_finish()
+            if profiler is not None:
+                profiler.stop()
+        if profiler is not None:
+            profiler.end()
+            if self.has_db:
+                self.db.add_profile(profiler.get_report())
+        if verbose:
+            sys.stdout.write('\n')
+
+    def sample_batch(self, num_samples, num_chains, init_params=None,
+                     num_thin=1, num_burn=0,
+                     start_tuning_after=0, stop_tuning_after=None,
+                     tuning_frequency=1000,
+                     verbose=False, diagnostics=False,
+                     callbacks=None, callback_block_size=100):
+        """
+        Take samples from the target advancing many independent chains at once.
+
+        All chains are held in a single (``num_chains`` x ``num_params``)
+        array. At each step, the proposals and the uniforms of all chains are
+        drawn with one call and they are accepted or rejected using a boolean
+        mask. This pays off when the model is cheap and it can evaluate
+        many parameters in one go (see :meth:`pymcmc.Model.eval_batch`).
+        The proposal must implement :meth:`pymcmc.Proposal.propose_batch`.
+
+        :param num_samples:     The number of samples to take (per chain).
+        :type num_samples:      int
+        :param num_chains:      The number of chains.
+        :type num_chains:       int
+        :param init_params:     The initial parameters of the chains. It can
+                                either be a 1D array (all chains start from
+                                the same point) or a 2D array with one row
+                                per chain. If ``None``, then the current
+                                parameters of the model are used.
+        :type init_params:      numpy array
+
+        The rest of the parameters (including the callbacks) are as in
+        :meth:`pymcmc.MetropolisHastings.sample`. Tuning is based on the
+        average acceptance rate over all chains. The gradients are computed
+        only if the proposal is a :class:`pymcmc.GradProposal`, so a
+        ``ValueError`` is raised before sampling if the database (or the
+        callbacks) should store them otherwise. Upon return, the state of
+        the chains is stored in :attr:`pymcmc.MetropolisHastings.batch_state`
+        and each chain is written to its own table in the database.
+        """
+        if init_params is None:
+            init_params = self.model.params
+        init_params = np.asarray(init_params, dtype='float64')
+        if init_params.ndim == 1:
+            init_params = np.tile(init_params, (num_chains, 1))
+        assert init_params.shape == (num_chains, self.model.num_params)
+        # Check the tuning parameters
+        start_tuning_after = (num_samples if start_tuning_after is None
+                              else start_tuning_after)
+        # The tuning period ends at the last sample at the latest (so that
+        # the proposal is told that it is over)
+        stop_tuning_after = (num_samples - 1 if stop_tuning_after is None
+                             else min(stop_tuning_after, num_samples - 1))
+        compute_grad = isinstance(self.proposal, GradProposal)
+        state = self.model.eval_batch(init_params, compute_grad=compute_grad)
+        self.batch_state = state
+        # Initialize counters
+        self._prepare(num_chains=num_chains, diagnostics=diagnostics,
+                      callbacks=callbacks,
+                      callback_block_size=callback_block_size)
+        callbacks = self._callbacks
+        step_callbacks = callbacks is not None and callbacks.wants_steps
+        record_callbacks = callbacks is not None and callbacks.wants_records
+        # The records are made from the batch state, which has the gradients
+        # only if the proposal uses them
+        fields = list(self.db.fields) if self.has_db else []
+        if record_callbacks:
+            fields += callbacks.fields
+        missing = sorted(set(name for name in fields
+                             if not state.has_key(name)))
+        if len(missing) > 0:
+            raise ValueError('Batch sampling with a '
+                             + self.proposal.__class__.__name__
+                             + ' does not compute ' + ', '.join(missing)
+                             + ', so they cannot be stored. Leave them out'
+                             ' of the database (and callback) fields.')
+        # Initialize the database
+        if self.has_db:
+            self.db.add_proposal(self.proposal.__getstate__())
+            chains = [self.db.create_new_chain() for k in xrange(num_chains)]
+        try:
+            # Start sampling
+            for i in xrange(num_samples):
+                # MCMC Step
+                new_state, log_p = self.proposal.propose_batch(self.model,
+                                                               state)
+                log_u = np.log(np.random.rand(num_chains))
+                accept = log_u <= log_p
+                for name in state.keys():
+                    state[name][accept] = new_state[name][accept]
+                self.accepted += accept
+                self.count += 1
+                if self.diagnostics is not None and i >= num_burn:
+                    self.diagnostics.update(state['params'])
+                if step_callbacks:
+                    callbacks.on_step(i + 1, state['params'],
+                                      state['log_likelihood'] +
+                                      state['log_prior'],
+                                      accept)
+                # Output
+                if i > num_burn and i % num_thin == 0:
+                    # To database
+                    if self.has_db:
+                        for k in xrange(num_chains):
+                            chain_state = dict((name, state[name][k])
+                                               for name in state.keys())
+                            self.db.add_chain_record(i + 1, self.accepted[k],
+                                                     chain_state,
+                                                     chain=chains[k])
+                    # To callbacks
+                    if record_callbacks:
+                        callbacks.on_record(i + 1, self.accepted, state)
+                    # To user
+                    if verbose:
+                        log_p = state['log_likelihood'] + state['log_prior']
+                        sys.stdout.write('sample ' + str(i + 1).zfill(len(str(num_samples)))
+                                         + ' of ' + str(num_samples)
+                                         + ', mean log_p: %.6f, mean acc. rate: %1.2f'
+                                           % (np.mean(log_p),
+                                              np.mean(self.acceptance_rate))
+                                         + self._diagnostics_str()
+                                         + '\r')
+                        sys.stdout.flush()
+                # Tuning
+                if (isinstance(self.proposal, TunableProposalConcept) and
+                    i >= start_tuning_after and i <= stop_tuning_after):
+                    self.proposal.adapt(state['params'])
+                    if i > 0 and i % tuning_frequency == 0:
+                        ac = np.mean(self._tuning_acceptance_rate())
+                        self.proposal.tune(ac, verbose=verbose)
+                        if callbacks is not None:
+                            callbacks.on_tune(i + 1, ac)
+                    if i == stop_tuning_after:
+                        self.proposal.finish_tuning()
         except KeyboardInterrupt:
             if verbose:
                 sys.stdout.flush()
                 sys.stdout.write('\n')
             print '*** Interrupting sampling'
+            if callbacks is not None:
+                callbacks.on_interrupt(int(self.count))
 
+        if self.diagnostics is not None:
+            self.diagnostics.flush()
+        if self.has_db:
+            self.db.flush()
+        if callbacks is not None:
+            callbacks.on_finish()
         if verbose:
             sys.stdout.write('\n')
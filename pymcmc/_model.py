@@ -12,6 +12,10 @@ Author:
 __all__ = ['Model']
 
 
+import copy
+import numpy as np
+
+
 class Model(object):
 
     """
@@ -21,6 +25,10 @@ class Model(object):
     :type name:     str
     """
 
+    # An optional cache of evaluations (a :class:`pymcmc.EvaluationCache`).
+    # Models that support it look up the parameters in it before evaluating.
+    cache = None
+
     def __init__(self, name='Pymcmc Model'):
         """
         Initialize the object.
@@ -113,6 +121,112 @@ class Model(object):
         """
         return self.grad_log_likelihood + self.grad_log_prior
 
+    @property
+    def has_grad(self):
+        """
+        Return ``True`` if the model provides the gradients of the log
+        likelihood and of the log prior.
+
+        This should not evaluate anything. The default implementation checks
+        if the deriving class implements
+        :attr:`pymcmc.Model.grad_log_likelihood`.
+        """
+        return type(self).grad_log_likelihood is not Model.grad_log_likelihood
+
+    def get_state(self, fields=None):
+        """
+        Get some of the entries of the state of the model.
+
+        :param fields:  The entries we need. If ``None``, then the whole state
+                        is returned (see :meth:`pymcmc.Model.__getstate__`).
+        :type fields:   list of str
+        :returns:       A dictionary with the entries of the state that are in
+                        ``fields`` (and possibly more).
+
+        Models that compute some of the entries of their state only when they
+        are needed (e.g. the gradients) can override this in order to avoid
+        computing the ones that are not asked for.
+        """
+        return self.__getstate__()
+
+    @property
+    def can_stage(self):
+        """
+        Return ``True`` if the model supports staging, i.e. if it implements
+        :meth:`pymcmc.Model.stage`, :meth:`pymcmc.Model.commit` and
+        :meth:`pymcmc.Model.rollback`. Samplers use this to avoid copying the
+        state of the model at every step.
+        """
+        return False
+
+    def stage(self):
+        """
+        Retain the current state of the model.
+
+        After this call, the parameters may be changed to a proposed value.
+        Then, the proposed state is either kept by calling
+        :meth:`pymcmc.Model.commit` or it is discarded by calling
+        :meth:`pymcmc.Model.rollback`. Retaining the state should not involve
+        any copies.
+        """
+        raise NotImplementedError('Implement this.')
+
+    def commit(self):
+        """
+        Keep the current state and forget the one retained by
+        :meth:`pymcmc.Model.stage`.
+        """
+        raise NotImplementedError('Implement this.')
+
+    def rollback(self):
+        """
+        Go back to the state retained by :meth:`pymcmc.Model.stage`.
+
+        It should do nothing if no state is retained.
+        """
+        raise NotImplementedError('Implement this.')
+
+    def eval_batch(self, params, compute_grad=False):
+        """
+        Evaluate the model at many parameters at once.
+
+        :param params:          The parameters. Each row is a different
+                                point.
+        :type params:           2D numpy array
+        :param compute_grad:    If ``True``, then the gradients of the log
+                                likelihood and of the log prior are also
+                                computed.
+        :type compute_grad:     bool
+        :returns:               A dictionary with the keys ``params``,
+                                ``log_likelihood`` and ``log_prior`` (and
+                                ``grad_log_likelihood``, ``grad_log_prior`` if
+                                ``compute_grad`` is ``True``). Each entry has
+                                one row per point.
+
+        The default implementation simply loops over the rows of ``params``.
+        Models that can evaluate many points in one go should override it.
+        The model shall remain the same after a call to this method.
+        """
+        params = np.atleast_2d(params)
+        num_points = params.shape[0]
+        batch = {}
+        batch['params'] = params.copy()
+        batch['log_likelihood'] = np.empty(num_points)
+        batch['log_prior'] = np.empty(num_points)
+        if compute_grad:
+            batch['grad_log_likelihood'] = np.empty(params.shape)
+            batch['grad_log_prior'] = np.empty(params.shape)
+        old_state = copy.deepcopy(self.__getstate__())
+        for i in xrange(num_points):
+            self.params = params[i]
+            batch['log_likelihood'][i] = self.log_likelihood
+            batch['log_prior'][i] = self.log_prior
+            if compute_grad:
+                batch['grad_log_likelihood'][i] = self.grad_log_likelihood
+                batch['grad_log_prior'][i] = self.grad_log_prior
+        self.__setstate__(old_state)
+        return batch
+
     def __str__(self):
         """
         Return a string representation of the object.
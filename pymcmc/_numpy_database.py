@@ -0,0 +1,459 @@
+"""
+A storage for MCMC chains based on memory-mapped numpy arrays.
+
+Author:
+    Ilias Bilionis
+"""
+
+
+__all__ = ['NumpyDataBase']
+
+
+import os
+import struct
+import copy
+import cPickle as pickle
+from datetime import datetime
+import numpy as np
+from . import ChainStorage
+from . import state_to_numpy_dtype
+from ._chain_storage import _open_storages
+from ._chain_storage import _add_open_storage
+
+
+# The length of the header of the .npy files we write. It is fixed so that
+# the header can be rewritten in place when the number of records changes.
+NPY_HEADER_LENGTH = 256
+
+
+def _write_npy_header(fd, dtype, shape):
+    """
+    Write (or overwrite) the header of a .npy file (format version 1.0).
+    """
+    header = ("{'descr': %r, 'fortran_order': False, 'shape': %r, }"
+              % (np.lib.format.dtype_to_descr(dtype), tuple(shape)))
+    magic = np.lib.format.magic(1, 0)
+    header_len = NPY_HEADER_LENGTH - len(magic) - 2
+    header += ' ' * (header_len - len(header) - 1) + '\n'
+    fd.seek(0)
+    fd.write(magic + struct.pack('<H', header_len) + header)
+
+
+def _dump_object(obj, filename):
+    """
+    Pickle an object to a file replacing it only after it is written.
+    """
+    with open(filename + '.new', 'wb') as fd:
+        pickle.dump(obj, fd, pickle.HIGHEST_PROTOCOL)
+    os.rename(filename + '.new', filename)
+
+
+def _load_object(filename):
+    """
+    Unpickle an object from a file (or return ``None`` if there is no file).
+    """
+    if not os.path.exists(filename):
+        return None
+    with open(filename, 'rb') as fd:
+        return pickle.load(fd)
+
+
+class _NpyColumn(object):
+
+    """
+    A column of a chain stored in a .npy file which grows as needed.
+
+    The file is preallocated and memory-mapped, so appending a record is just
+    an assignment to a slice of the map. When it is full, the file is
+    extended and mapped again (no copies).
+
+    :param filename:    The name of the .npy file.
+    :type filename:     str
+    :param dtype:       The data type of the column.
+    :param shape:       The shape of each record.
+    :type shape:        tuple
+    :param capacity:    The initial number of records that fit in the file.
+    :type capacity:     int
+    """
+
+    def __init__(self, filename, dtype, shape, capacity):
+        """
+        Initialize the object.
+        """
+        self.filename = filename
+        self.dtype = np.dtype(dtype)
+        self.shape = tuple(shape)
+        self.num_records = 0
+        self._record_size = self.dtype.itemsize * int(np.prod(self.shape))
+        with open(filename, 'wb') as fd:
+            _write_npy_header(fd, self.dtype, (0, ) + self.shape)
+        self._map(max(int(capacity), 1))
+
+    @classmethod
+    def reopen(cls, filename, num_records):
+        """
+        Open an existing column keeping only its first ``num_records``
+        records.
+        """
+        data = np.load(filename, mmap_mode='r')
+        assert num_records <= data.shape[0]
+        column = cls.__new__(cls)
+        column.filename = filename
+        column.dtype = data.dtype
+        column.shape = data.shape[1:]
+        del data
+        column.num_records = num_records
+        column._record_size = column.dtype.itemsize * int(np.prod(column.shape))
+        column._map(max(num_records, 1))
+        return column
+
+    def _map(self, capacity):
+        """
+        Make room for ``capacity`` records and map the file.
+        """
+        with open(self.filename, 'r+b') as fd:
+            fd.truncate(NPY_HEADER_LENGTH + capacity * self._record_size)
+        self.capacity = capacity
+        self._memmap = np.memmap(self.filename, dtype=self.dtype, mode='r+',
+                                 offset=NPY_HEADER_LENGTH,
+                                 shape=(capacity, ) + self.shape)
+        # Indexing a plain array is much faster than indexing a memmap
+        self.data = self._memmap.view(np.ndarray)
+
+    def append(self, value):
+        """
+        Append a record.
+        """
+        if self.num_records == self.capacity:
+            self._memmap.flush()
+            self._map(2 * self.capacity)
+        self.data[self.num_records] = value
+        self.num_records += 1
+
+    def flush(self):
+        """
+        Write the data to the disk and update the header so that the file can
+        be read with :func:`numpy.load`.
+        """
+        self._memmap.flush()
+        with open(self.filename, 'r+b') as fd:
+            _write_npy_header(fd, self.dtype,
+                              (self.num_records, ) + self.shape)
+
+    def close(self):
+        """
+        Flush and drop the space that was preallocated but not used.
+        """
+        self.flush()
+        self._memmap = None
+        self.data = None
+        with open(self.filename, 'r+b') as fd:
+            fd.truncate(NPY_HEADER_LENGTH + self.num_records * self._record_size)
+
+
+class NumpyDataBase(ChainStorage):
+
+    """
+    A storage for MCMC chains that writes every field of a chain to its own
+    memory-mapped .npy file.
+
+    The layout of the storage is::
+
+        dirname/index.pkl               (proposals and chain counter)
+        dirname/chain_k/<field>.npy     (one file per field of chain k)
+
+    Writing a record is a plain assignment to a preallocated array and, at
+    any time after :meth:`pymcmc.NumpyDataBase.flush`, a stored field can be
+    read without loading it in memory with::
+
+        np.load(db.get_chain_filename(k, 'params'), mmap_mode='r')
+
+    :param dirname:         The directory of the storage. It is created if it
+                            does not exist.
+    :type dirname:          str
+    :param model_state:     The state of the model. This is needed so that we
+                            know exactly how to store it.
+    :type model_state:      dict
+    :param proposal_state:  The state of the MCMC proposal.
+    :type proposal_state:   dict
+    :param fields:          The entries of the model state that are stored
+                            with every record. If ``None``, then the whole
+                            state is stored.
+    :type fields:           list of str
+    :param initial_capacity:    The number of records for which space is
+                                preallocated. It is doubled every time the
+                                chain runs out of space.
+    :type initial_capacity:     int
+    """
+
+    def __init__(self, dirname, model_state, proposal_state, fields=None,
+                 initial_capacity=1024):
+        """
+        Initialize the object.
+        """
+        self.dirname = dirname
+        self.fields = list(model_state.keys() if fields is None else fields)
+        self.initial_capacity = int(initial_capacity)
+        self.RecordDType = state_to_numpy_dtype(model_state,
+                                                fields=self.fields)
+        self.RecordDType['step'] = (np.dtype('uint32'), ())
+        self.RecordDType['accepted'] = (np.dtype('uint32'), ())
+        self.RecordDType['proposal'] = (np.dtype('uint16'), ())
+        self._chains = {}
+        if os.path.exists(self._index_filename):
+            with open(self._index_filename, 'rb') as fd:
+                self._index = pickle.load(fd)
+        else:
+            if not os.path.exists(dirname):
+                os.makedirs(dirname)
+            self._index = {'proposals': [], 'chain_counter': []}
+            self._write_index()
+        self._proposal_id = len(self.proposals) - 1
+        _add_open_storage(self)
+
+    @property
+    def _index_filename(self):
+        return os.path.join(self.dirname, 'index.pkl')
+
+    def _write_index(self):
+        """
+        Write the proposals and the chain counter to the disk.
+        """
+        with open(self._index_filename, 'wb') as fd:
+            pickle.dump(self._index, fd, pickle.HIGHEST_PROTOCOL)
+
+    @property
+    def proposals(self):
+        """
+        Get the states of all the proposals.
+        """
+        return self._index['proposals']
+
+    @property
+    def chain_counter(self):
+        """
+        Get a list of dictionaries (keys ``id``, ``name`` and ``date``)
+        describing the chains.
+        """
+        return self._index['chain_counter']
+
+    @property
+    def proposal_id(self):
+        """
+        Get the id of the current proposal.
+        """
+        return self._proposal_id
+
+    def get_chain_filename(self, chain_num, name):
+        """
+        Get the name of the .npy file storing the field ``name`` of a chain.
+        """
+        chain_name = self.chain_counter[chain_num]['name']
+        return os.path.join(self.dirname, chain_name, name + '.npy')
+
+    def add_proposal(self, state):
+        """
+        Add a proposal to the storage.
+        """
+        self.proposals.append(copy.deepcopy(state))
+        self._write_index()
+        self._proposal_id = len(self.proposals) - 1
+
+    def create_new_chain(self):
+        """
+        Create a new chain.
+
+        :returns:   The new chain. It also becomes the current chain.
+        """
+        num_chains = len(self.chain_counter)
+        chain_name = 'chain_' + str(num_chains)
+        os.mkdir(os.path.join(self.dirname, chain_name))
+        self.chain_counter.append({'id': num_chains,
+                                   'name': chain_name,
+                                   'date': str(datetime.now())})
+        self._write_index()
+        chain = {}
+        for name, (dtype, shape) in self.RecordDType.items():
+            filename = os.path.join(self.dirname, chain_name, name + '.npy')
+            chain[name] = _NpyColumn(filename, dtype, shape,
+                                     self.initial_capacity)
+        self._chains[chain_name] = chain
+        self.current_chain = chain
+        return chain
+
+    def add_chain_record(self, step, accepted, state, chain=None):
+        """
+        Add a record to a chain.
+
+        Only the entries of ``state`` that are in
+        :attr:`pymcmc.NumpyDataBase.fields` are stored. Any stored field that
+        is missing from ``state`` is left zero.
+        """
+        if chain is None:
+            chain = self.current_chain
+        for name in self.fields:
+            chain[name].append(state[name] if state.has_key(name) else 0)
+        chain['step'].append(step)
+        chain['accepted'].append(int(accepted))
+        chain['proposal'].append(self.proposal_id)
+
+    def _get_checkpoint_filename(self, chain_num):
+        """
+        Get the name of the file storing the checkpoint of a chain.
+        """
+        return os.path.join(self.dirname, self.chain_counter[chain_num]['name'],
+                            'checkpoint.pkl')
+
+    def add_checkpoint(self, checkpoint, chain=None):
+        """
+        Store a checkpoint of a chain, replacing any previous one.
+
+        The checkpoint is pickled in ``dirname/chain_k/checkpoint.pkl``.
+
+        See :meth:`pymcmc.ChainStorage.add_checkpoint`.
+        """
+        if chain is None:
+            chain = self.current_chain
+        self.flush()
+        checkpoint = dict(checkpoint)
+        checkpoint['num_records'] = chain['step'].num_records
+        checkpoint['proposal_id'] = self.proposal_id
+        _dump_object(checkpoint,
+                     os.path.join(os.path.dirname(chain['step'].filename),
+                                  'checkpoint.pkl'))
+
+    def get_checkpoint(self, chain_num):
+        """
+        Get the checkpoint of a chain (or ``None``).
+        """
+        return _load_object(self._get_checkpoint_filename(chain_num))
+
+    def add_profile(self, report, chain=None):
+        """
+        Store the timings of the sampling loop of a chain, replacing any
+        previous ones.
+
+        The report is pickled in ``dirname/chain_k/profile.pkl``.
+
+        See :meth:`pymcmc.ChainStorage.add_profile`.
+        """
+        if chain is None:
+            chain = self.current_chain
+        _dump_object(report,
+                     os.path.join(os.path.dirname(chain['step'].filename),
+                                  'profile.pkl'))
+
+    def get_profile(self, chain_num):
+        """
+        Get the timings of the sampling loop of a chain (or ``None``).
+        """
+        return _load_object(os.path.join(self.dirname,
+                                         self.chain_counter[chain_num]['name'],
+                                         'profile.pkl'))
+
+    def resume_chain(self, chain_num):
+        """
+        Make a chain the current chain again.
+
+        See :meth:`pymcmc.ChainStorage.resume_chain`.
+        """
+        self.flush()
+        if chain_num < 0:
+            chain_num += self.num_chains
+        checkpoint = self.get_checkpoint(chain_num)
+        if checkpoint is None:
+            raise RuntimeError('Chain ' + str(chain_num)
+                               + ' has no checkpoint.')
+        chain_name = self.chain_counter[chain_num]['name']
+        if self._chains.has_key(chain_name):
+            for column in self._chains[chain_name].values():
+                column.close()
+        chain_dir = os.path.join(self.dirname, chain_name)
+        chain = {}
+        for filename in os.listdir(chain_dir):
+            name, ext = os.path.splitext(filename)
+            if ext != '.npy':
+                continue
+            chain[name] = _NpyColumn.reopen(os.path.join(chain_dir, filename),
+                                            checkpoint['num_records'])
+        self.fields = [name for name in chain.keys()
+                       if not name in ['step', 'accepted', 'proposal']]
+        self._chains[chain_name] = chain
+        self.current_chain = chain
+        self._proposal_id = checkpoint['proposal_id']
+        return checkpoint
+
+    @property
+    def num_chains(self):
+        return len(self.chain_counter)
+
+    def get_num_records(self, chain_num):
+        self.flush()
+        return np.load(self.get_chain_filename(chain_num, 'step'),
+                       mmap_mode='r').shape[0]
+
+    def read_chain(self, chain_num, fields=None, start=0, stop=None, step=1):
+        """
+        Read some of the columns of a range of records of a chain.
+
+        See :meth:`pymcmc.ChainStorage.read_chain`.
+        """
+        self.flush()
+        if fields is None:
+            chain_dir = os.path.join(self.dirname,
+                                     self.chain_counter[chain_num]['name'])
+            fields = [os.path.splitext(filename)[0]
+                      for filename in os.listdir(chain_dir)
+                      if filename.endswith('.npy')]
+        data = {}
+        for name in fields:
+            column = np.load(self.get_chain_filename(chain_num, name),
+                             mmap_mode='r')
+            data[name] = np.array(column[start:stop:step])
+        return data
+
+    def get_states(self, chain_num, step_num, model=None):
+        """
+        Get the model state and the proposal state from the storage.
+
+        See :meth:`pymcmc.ChainStorage.get_states`.
+        """
+        self.flush()
+        model_state = {}
+        chain_dir = os.path.join(self.dirname,
+                                 self.chain_counter[chain_num]['name'])
+        for filename in os.listdir(chain_dir):
+            name, ext = os.path.splitext(filename)
+            if ext != '.npy':
+                continue
+            data = np.load(os.path.join(chain_dir, filename), mmap_mode='r')
+            value = data[step_num]
+            model_state[name] = np.array(value) if data.ndim > 1 else value
+        proposal_state = copy.deepcopy(self.proposals[model_state['proposal']])
+        self._complete_model_state(model_state, model)
+        return model_state, proposal_state
+
+    def flush(self):
+        """
+        Write everything to the disk.
+        """
+        for chain in self._chains.values():
+            for column in chain.values():
+                column.flush()
+
+    def _flush_at_exit(self):
+        """
+        Flush at exit unless the directory has been removed in the meantime.
+        """
+        if os.path.isdir(self.dirname):
+            self.flush()
+
+    def close(self):
+        """
+        Flush and trim the files of all chains to their actual size.
+        """
+        _open_storages.discard(self)
+        for chain in self._chains.values():
+            for column in chain.values():
+                column.close()
+        self._chains = {}
@@ -0,0 +1,284 @@
+"""
+A No-U-Turn Sampler (NUTS) proposal.
+
+Author:
+    Ilias Bilionis
+"""
+
+
+__all__ = ['NUTSProposal']
+
+
+import copy
+import math
+import numpy as np
+from . import GradProposal
+from . import TunableProposalConcept
+
+
+# A trajectory is stopped if the energy error exceeds this
+DELTA_MAX = 1000.
+
+
+class NUTSProposal(GradProposal, TunableProposalConcept):
+
+    """
+    The No-U-Turn Sampler of Hoffman and Gelman (2014) with dual averaging of
+    the step size.
+
+    The leapfrog trajectory is doubled (forwards or backwards at random) until
+    it starts turning back on itself or ``max_depth`` doublings have been
+    made, and the new point is picked from the trajectory with the slice
+    sampling scheme of the paper (efficient NUTS). This is a valid MCMC move
+    on its own, so the ratio returned by
+    :meth:`pymcmc.NUTSProposal._do_propose` makes the Metropolis-Hastings
+    step always accept it.
+
+    During the tuning period, the step size is adapted after every step (see
+    :meth:`pymcmc.TunableProposalConcept.adapt`) so that the average
+    acceptance statistic of the trajectories approaches ``target_accept``.
+    When the tuning period is over, the step size is fixed to the average of
+    the adapted step sizes.
+
+    If a :class:`pymcmc.MassMatrix` is given (keyword ``mass_matrix``), then
+    it is estimated from the samples of the tuning period. Every time the
+    proposal is tuned, the latest estimate is used and the dual averaging
+    starts over.
+
+    :param step_size:       The (initial) leapfrog step size.
+    :type step_size:        float
+    :param max_depth:       The maximum number of doublings of the trajectory.
+    :type max_depth:        int
+    :param target_accept:   The target of the dual averaging.
+    :type target_accept:    float
+    :param gamma:           The dual averaging regularization scale.
+    :type gamma:            float
+    :param t0:              The dual averaging iteration offset.
+    :type t0:               float
+    :param kappa:           The dual averaging decay of the averaging weights.
+    :type kappa:            float
+
+    The rest of the keyword arguments is what you would find in
+    :class:`pymcmc.GradProposal`.
+    """
+
+    def __init__(self, step_size=0.1, max_depth=10, target_accept=0.8,
+                 gamma=0.05, t0=10., kappa=0.75, **kwargs):
+        """
+        Initialize the object.
+        """
+        self.step_size = step_size
+        self.max_depth = int(max_depth)
+        assert self.max_depth >= 1
+        self.target_accept = float(target_accept)
+        assert self.target_accept > 0. and self.target_accept < 1.
+        self.gamma = float(gamma)
+        self.t0 = float(t0)
+        self.kappa = float(kappa)
+        self._reset_dual_averaging()
+        if not kwargs.has_key('name'):
+            kwargs['name'] = 'NUTS Proposal'
+        GradProposal.__init__(self, **kwargs)
+        TunableProposalConcept.__init__(self, **kwargs)
+
+    def _reset_dual_averaging(self):
+        """
+        Start the dual averaging from the current step size.
+        """
+        self._mu = math.log(10. * self.step_size)
+        self._da_count = 0
+        self._h_bar = 0.
+        self._log_step_size_bar = 0.
+        self.accept_stat = None
+        self.tree_depth = 0
+
+    def _leapfrog(self, model, q, p, grad, step_size):
+        """
+        Make one leapfrog step and leave the model at the new point.
+        """
+        p = p + 0.5 * step_size * self._dot_chol_t(grad)
+        q = q + step_size * self._dot_chol(p)
+        model.params = q
+        grad = np.array(model.grad_log_p)
+        p = p + 0.5 * step_size * self._dot_chol_t(grad)
+        return q, p, grad
+
+    def _build_tree(self, model, q, p, grad, log_u, v, j, H0):
+        """
+        Build a subtree of ``2 ** j`` leapfrog steps in direction ``v``.
+
+        :returns:   A tuple (q_minus, p_minus, grad_minus, q_plus, p_plus,
+                    grad_plus, candidate, n, s, alpha, n_alpha), where
+                    ``candidate`` is a tuple (params, grad, log_p) or
+                    ``None``.
+        """
+        if j == 0:
+            q, p, grad = self._leapfrog(model, q, p, grad, v * self.step_size)
+            log_p = model.log_likelihood + model.log_prior
+            H = log_p - 0.5 * np.dot(p, p)
+            if not np.isfinite(H):
+                H = -np.inf
+            n = int(log_u <= H)
+            s = log_u < DELTA_MAX + H
+            candidate = None
+            if n:
+                candidate = (q, grad, log_p)
+            alpha = min(1., math.exp(H - H0)) if H > -np.inf else 0.
+            return q, p, grad, q, p, grad, candidate, n, s, alpha, 1
+        (q_minus, p_minus, grad_minus, q_plus, p_plus, grad_plus,
+         candidate, n, s, alpha, n_alpha) = self._build_tree(model, q, p, grad,
+                                                             log_u, v, j - 1,
+                                                             H0)
+        if s:
+            if v == -1:
+                (q_minus, p_minus, grad_minus, _, _, _,
+                 candidate2, n2, s2, alpha2, n_alpha2) = self._build_tree(
+                     model, q_minus, p_minus, grad_minus, log_u, v, j - 1, H0)
+            else:
+                (_, _, _, q_plus, p_plus, grad_plus,
+                 candidate2, n2, s2, alpha2, n_alpha2) = self._build_tree(
+                     model, q_plus, p_plus, grad_plus, log_u, v, j - 1, H0)
+            if n + n2 > 0 and np.random.rand() < float(n2) / (n + n2):
+                candidate = candidate2
+            alpha += alpha2
+            n_alpha += n_alpha2
+            dq = self._solve_chol(q_plus - q_minus)
+            s = s2 and np.dot(dq, p_minus) >= 0. and np.dot(dq, p_plus) >= 0.
+            n += n2
+        return (q_minus, p_minus, grad_minus, q_plus, p_plus, grad_plus,
+                candidate, n, s, alpha, n_alpha)
+
+    def _do_propose(self, model):
+        """
+        Build a trajectory and leave the model at the point picked from it.
+
+        Only the parameters, the gradient and the log probability of the
+        candidate points are kept. At the end, the model is set to the
+        picked point, unless it is already there. This costs at most one
+        more evaluation of the model (but not of its gradients).
+
+        :returns:   The log probability at the start minus the log probability
+                    at the new point (so that the move is always accepted).
+        """
+        q0 = np.array(model.params)
+        grad0 = self._get_grad(model)
+        log_p0 = model.log_likelihood + model.log_prior
+        # Going back to the start is cheap if we keep its state
+        state0 = copy.deepcopy(model.get_state(['params', 'log_likelihood',
+                                                'log_prior']))
+        candidate = (q0, grad0, log_p0)
+        p0 = np.random.randn(q0.shape[0])
+        H0 = log_p0 - 0.5 * np.dot(p0, p0)
+        log_u = H0 + math.log(np.random.rand())
+        q_minus, p_minus, grad_minus = q0, p0, grad0
+        q_plus, p_plus, grad_plus = q0, p0, grad0
+        n = 1
+        s = True
+        j = 0
+        while s and j < self.max_depth:
+            v = 1 if np.random.rand() < 0.5 else -1
+            if v == -1:
+                (q_minus, p_minus, grad_minus, _, _, _,
+                 candidate2, n2, s2, alpha, n_alpha) = self._build_tree(
+                     model, q_minus, p_minus, grad_minus, log_u, v, j, H0)
+            else:
+                (_, _, _, q_plus, p_plus, grad_plus,
+                 candidate2, n2, s2, alpha, n_alpha) = self._build_tree(
+                     model, q_plus, p_plus, grad_plus, log_u, v, j, H0)
+            if s2 and np.random.rand() < float(n2) / n:
+                candidate = candidate2
+            n += n2
+            dq = self._solve_chol(q_plus - q_minus)
+            s = s2 and np.dot(dq, p_minus) >= 0. and np.dot(dq, p_plus) >= 0.
+            j += 1
+        self.accept_stat = alpha / n_alpha
+        self.tree_depth = j
+        q, grad, log_p = candidate
+        if q is q0:
+            model.__setstate__(state0)
+        elif not np.array_equal(model.params, q):
+            model.params = q
+        self._remember_grads((q0, grad0), (q, grad))
+        return log_p0 - log_p
+
+    def propose_batch(self, model, state):
+        """
+        NUTS cannot advance many chains at once (the trajectories have
+        different lengths).
+        """
+        raise NotImplementedError('NUTS does not support batch sampling.')
+
+    def adapt(self, params):
+        """
+        Make a dual averaging step for the step size using the acceptance
+        statistic of the last trajectory.
+        """
+        self._adapt_mass_matrix(params)
+        if self.accept_stat is None:
+            return
+        self._da_count += 1
+        m = self._da_count
+        eta = 1. / (m + self.t0)
+        self._h_bar = ((1. - eta) * self._h_bar +
+                       eta * (self.target_accept - self.accept_stat))
+        log_step_size = self._mu - math.sqrt(m) / self.gamma * self._h_bar
+        w = m ** (-self.kappa)
+        self._log_step_size_bar = (w * log_step_size +
+                                   (1. - w) * self._log_step_size_bar)
+        self.step_size = math.exp(log_step_size)
+
+    def tune(self, ac, verbose=False, **kwargs):
+        """
+        Start using the latest estimate of the mass matrix (if any). The step
+        size is adapted at every step.
+        """
+        if self._apply_mass_matrix():
+            self._reset_dual_averaging()
+
+    def finish_tuning(self):
+        """
+        Fix the step size to the average of the adapted ones.
+        """
+        if self._da_count > 0:
+            self.step_size = math.exp(self._log_step_size_bar)
+
+    def __getstate__(self):
+        state = GradProposal.__getstate__(self)
+        state['step_size'] = self.step_size
+        state['max_depth'] = self.max_depth
+        state['target_accept'] = self.target_accept
+        state['gamma'] = self.gamma
+        state['t0'] = self.t0
+        state['kappa'] = self.kappa
+        return state
+
+    def __setstate__(self, state):
+        GradProposal.__setstate__(self, state)
+        self.step_size = state['step_size']
+        self.max_depth = state['max_depth']
+        self.target_accept = state['target_accept']
+        self.gamma = state['gamma']
+        self.t0 = state['t0']
+        self.kappa = state['kappa']
+        self._reset_dual_averaging()
+
+    def get_checkpoint(self):
+        """
+        Get the state of the object together with the dual averaging
+        statistics.
+        """
+        checkpoint = GradProposal.get_checkpoint(self)
+        checkpoint['dual_averaging'] = (self._mu, self._da_count, self._h_bar,
+                                        self._log_step_size_bar,
+                                        self.accept_stat)
+        return checkpoint
+
+    def set_checkpoint(self, checkpoint):
+        """
+        Restore the proposal from a checkpoint.
+        """
+        checkpoint = dict(checkpoint)
+        dual_averaging = checkpoint.pop('dual_averaging')
+        GradProposal.set_checkpoint(self, checkpoint)
+        (self._mu, self._da_count, self._h_bar, self._log_step_size_bar,
+         self.accept_stat) = dual_averaging
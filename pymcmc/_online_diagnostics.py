@@ -0,0 +1,275 @@
+"""
+Convergence diagnostics that are updated while sampling.
+
+Author:
+    Ilias Bilionis
+"""
+
+
+__all__ = ['autocorrelation', 'effective_sample_size', 'OnlineDiagnostics']
+
+
+import numpy as np
+
+
+def autocorrelation(x, max_lag=None):
+    """
+    Compute the autocorrelation of a chain using the FFT.
+
+    :param x:       The chain. The first dimension runs over the samples. Any
+                    other dimension is treated as a separate chain.
+    :type x:        :class:`numpy.ndarray`
+    :param max_lag: The maximum lag. If ``None``, all lags are returned.
+    :type max_lag:  int
+    :returns:       An array of the same shape as ``x`` (except for the first
+                    dimension which is ``max_lag + 1``) with the
+                    autocorrelation at each lag.
+    """
+    x = np.asarray(x, dtype='float64')
+    n = x.shape[0]
+    if max_lag is None:
+        max_lag = n - 1
+    max_lag = min(max_lag, n - 1)
+    x = x - x.mean(axis=0)
+    # Pad to a power of two to avoid the circular correlation
+    size = 2 ** int(np.ceil(np.log2(2 * n)))
+    f = np.fft.rfft(x, n=size, axis=0)
+    acov = np.fft.irfft(f * np.conjugate(f), n=size, axis=0)[:max_lag + 1]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return acov / acov[0]
+
+
+def effective_sample_size(x):
+    """
+    Estimate the effective sample size of a chain.
+
+    The integrated autocorrelation time is estimated by summing the
+    autocorrelation until the sum of two consecutive lags becomes negative
+    (Geyer's initial positive sequence).
+
+    :param x:       The chain. The first dimension runs over the samples. Any
+                    other dimension is treated as a separate chain.
+    :type x:        :class:`numpy.ndarray`
+    :returns:       The effective sample size (a float or an array with the
+                    shape of ``x[0]``).
+    """
+    x = np.asarray(x, dtype='float64')
+    n = x.shape[0]
+    rho = autocorrelation(x)
+    num_pairs = n // 2
+    pairs = rho[:2 * num_pairs].reshape((num_pairs, 2) + rho.shape[1:]).sum(axis=1)
+    positive = np.cumprod(pairs > 0., axis=0)
+    tau = -1. + 2. * np.sum(pairs * positive, axis=0)
+    tau = np.maximum(tau, 1. / np.log10(max(n, 10)))
+    return n / tau
+
+
+class OnlineDiagnostics(object):
+
+    """
+    Convergence diagnostics that are updated as the samples come in.
+
+    The samples are first copied into a block of ``block_size`` rows. When
+    the block is full, all the statistics are updated with a few vectorized
+    operations, so the cost per sample is just the copy. The following
+    diagnostics are maintained:
+        + the running mean and variance of each parameter (Welford's
+          algorithm merged block by block),
+        + the effective sample size estimated with batch means (each block
+          is a batch),
+        + the autocorrelation over a rolling window of the latest samples
+          (via the FFT),
+        + the split-R-hat over the rolling window (it also works with a
+          single chain).
+
+    All statistics are computed separately for each chain and have shape
+    ``(num_chains, num_params)``. They reflect the samples of the complete
+    blocks only (call :meth:`pymcmc.OnlineDiagnostics.flush` to include an
+    incomplete block).
+
+    :param num_params:  The number of parameters.
+    :type num_params:   int
+    :param num_chains:  The number of chains that are updated together.
+    :type num_chains:   int
+    :param block_size:  The number of samples in each block (batch).
+    :type block_size:   int
+    :param window_size: The number of latest samples used for the
+                        autocorrelation and the split-R-hat.
+    :type window_size:  int
+    """
+
+    def __init__(self, num_params, num_chains=1, block_size=100,
+                 window_size=1000):
+        """
+        Initialize the object.
+        """
+        self.num_params = int(num_params)
+        self.num_chains = int(num_chains)
+        self.block_size = int(block_size)
+        self.window_size = int(window_size)
+        assert self.block_size >= 2
+        assert self.window_size >= 4
+        shape = (self.num_chains, self.num_params)
+        self._block = np.empty((self.block_size, ) + shape)
+        self._num_in_block = 0
+        self._window = np.empty((self.window_size, ) + shape)
+        self._mean = np.zeros(shape)
+        self._m2 = np.zeros(shape)
+        # Running mean and variance of the batch means
+        self._num_batches = 0
+        self._bm_mean = np.zeros(shape)
+        self._bm_m2 = np.zeros(shape)
+        self.num_samples = 0
+        self._split_rhat = None
+
+    def update(self, params):
+        """
+        Add a sample.
+
+        :param params:  The parameters. For a single chain it can be a 1D
+                        array, otherwise it should have one row per chain.
+        :type params:   :class:`numpy.ndarray`
+        """
+        self._block[self._num_in_block] = params
+        self._num_in_block += 1
+        if self._num_in_block == self.block_size:
+            self._process_block()
+
+    def _process_block(self):
+        """
+        Update the statistics with the samples of the current block.
+        """
+        n_b = self._num_in_block
+        if n_b == 0:
+            return
+        block = self._block[:n_b]
+        b_mean = block.mean(axis=0)
+        b_m2 = ((block - b_mean) ** 2).sum(axis=0)
+        n_a = self.num_samples
+        n = n_a + n_b
+        delta = b_mean - self._mean
+        self._mean += delta * (float(n_b) / n)
+        self._m2 += b_m2 + delta ** 2 * (float(n_a) * n_b / n)
+        if n_b == self.block_size:
+            self._num_batches += 1
+            delta = b_mean - self._bm_mean
+            self._bm_mean += delta / self._num_batches
+            self._bm_m2 += delta * (b_mean - self._bm_mean)
+        idx = np.arange(n_a, n) % self.window_size
+        self._window[idx] = block
+        self.num_samples = n
+        self._num_in_block = 0
+        self._split_rhat = None
+
+    def flush(self):
+        """
+        Update the statistics with any samples that are waiting in an
+        incomplete block.
+
+        The incomplete block is not used as a batch for the batch means.
+        """
+        self._process_block()
+
+    @property
+    def mean(self):
+        """
+        Get the running mean.
+        """
+        return self._mean.copy()
+
+    @property
+    def variance(self):
+        """
+        Get the running variance.
+        """
+        if self.num_samples < 2:
+            return np.nan * np.ones(self._m2.shape)
+        return self._m2 / (self.num_samples - 1)
+
+    @property
+    def ess(self):
+        """
+        Get the effective sample size estimated with batch means.
+
+        It is ``nan`` until there are at least two complete batches.
+        """
+        if self._num_batches < 2:
+            return np.nan * np.ones(self._m2.shape)
+        batch_var = self._bm_m2 / (self._num_batches - 1)
+        n = self._num_batches * self.block_size
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return n * self.variance / (self.block_size * batch_var)
+
+    @property
+    def min_ess(self):
+        """
+        Get the smallest effective sample size over all parameters (summing
+        over the chains).
+        """
+        return np.min(np.sum(self.ess, axis=0))
+
+    @property
+    def window(self):
+        """
+        Get the latest samples in the order they were taken (at most
+        ``window_size`` of them).
+        """
+        n = self.num_samples
+        if n <= self.window_size:
+            return self._window[:n].copy()
+        start = n % self.window_size
+        return np.concatenate([self._window[start:], self._window[:start]])
+
+    def autocorrelation(self, max_lag=None):
+        """
+        Get the autocorrelation over the rolling window.
+
+        :param max_lag: The maximum lag. If ``None``, then all lags are
+                        returned.
+        :type max_lag:  int
+        :returns:       An array of shape
+                        ``(max_lag + 1, num_chains, num_params)``.
+        """
+        return autocorrelation(self.window, max_lag=max_lag)
+
+    @property
+    def window_ess(self):
+        """
+        Get the effective sample size of the rolling window (from its
+        autocorrelation).
+        """
+        return effective_sample_size(self.window)
+
+    @property
+    def split_rhat(self):
+        """
+        Get the split-R-hat of each parameter over the rolling window.
+
+        The window of each chain is split in two halves and the potential
+        scale reduction factor is computed over all the halves. The result
+        is cached until the next block is processed.
+        """
+        if self._split_rhat is not None:
+            return self._split_rhat
+        window = self.window
+        m = window.shape[0] // 2
+        if m < 2:
+            return np.nan * np.ones(self.num_params)
+        halves = np.concatenate([window[:m], window[-m:]], axis=1)
+        within = np.mean(np.var(halves, axis=0, ddof=1), axis=0)
+        between_m = np.var(np.mean(halves, axis=0), axis=0, ddof=1)
+        var_plus = (m - 1.) / m * within + between_m
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self._split_rhat = np.sqrt(var_plus / within)
+        return self._split_rhat
+
+    def __str__(self):
+        """
+        Return a string representation of the object.
+        """
+        s = 'Number of samples:\t' + str(self.num_samples) + '\n'
+        s += 'Mean:\t\t\t' + str(self.mean) + '\n'
+        s += 'Variance:\t\t' + str(self.variance) + '\n'
+        s += 'ESS (batch means):\t' + str(self.ess) + '\n'
+        s += 'Split-R-hat:\t\t' + str(self.split_rhat)
+        return s
@@ -0,0 +1,122 @@
+"""
+Run many independent MCMC chains in parallel.
+
+Author:
+    Ilias Bilionis
+"""
+
+
+__all__ = ['sample_parallel']
+
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import numpy as np
+
+
+def _shard_filename(shard_dir, db_filename, chain):
+    """
+    Get the name of the database in which a worker writes its chain.
+    """
+    root, ext = os.path.splitext(os.path.basename(db_filename))
+    return os.path.join(shard_dir, root + '_shard_' + str(chain) + ext)
+
+
+def _sample_chain(args):
+    """
+    Sample a single chain (this is what the workers do).
+    """
+    mcmc_factory, chain, seed, shard_filename, num_samples, sample_kwargs = args
+    np.random.seed(seed)
+    mcmc = mcmc_factory(shard_filename)
+    mcmc.sample(num_samples, **sample_kwargs)
+    if mcmc.has_db:
+        mcmc.db.close()
+    result = {}
+    result['chain'] = chain
+    result['seed'] = seed
+    result['acceptance_rate'] = mcmc.acceptance_rate
+    result['model_state'] = mcmc.model.__getstate__()
+    result['proposal_state'] = mcmc.proposal.__getstate__()
+    return result
+
+
+def sample_parallel(mcmc_factory, num_chains, num_samples, db_filename=None,
+                    num_processes=None, seed=None, **sample_kwargs):
+    """
+    Sample many independent chains using a pool of processes.
+
+    Each chain is sampled by a separate :class:`pymcmc.MetropolisHastings`
+    object which is constructed inside the worker by ``mcmc_factory``. The
+    random number generator of every worker is seeded separately. Each worker
+    writes to its own database (a shard) and, at the end, all the shards are
+    merged into ``db_filename`` so that chain ``k`` ends up at
+    ``/mcmc/data/chain_k`` (if the database is new). The shards are kept in
+    a new temporary directory next to ``db_filename`` which is removed at
+    the end, even if sampling fails.
+
+    :param mcmc_factory:    A function that takes a database filename (or
+                            ``None``) and returns a
+                            :class:`pymcmc.MetropolisHastings` object that
+                            writes to it. It must be picklable, i.e. defined
+                            at the top level of a module.
+    :type mcmc_factory:     callable
+    :param num_chains:      The number of chains.
+    :type num_chains:       int
+    :param num_samples:     The number of samples to take per chain.
+    :type num_samples:      int
+    :param db_filename:     The database in which all the chains are stored.
+                            If ``None``, then nothing is saved.
+    :type db_filename:      str
+    :param num_processes:   The number of worker processes. If ``None``, then
+                            the number of cpus is used.
+    :type num_processes:    int
+    :param seed:            A seed used to generate the seeds of the chains.
+                            If ``None``, then the global numpy random state is
+                            used.
+    :type seed:             int
+    :returns:               A list with one dictionary per chain (ordered by
+                            chain) containing the keys ``chain``, ``seed``,
+                            ``acceptance_rate``, ``model_state`` and
+                            ``proposal_state``.
+
+    The rest of the keyword arguments are passed to
+    :meth:`pymcmc.MetropolisHastings.sample`.
+    """
+    rng = np.random if seed is None else np.random.RandomState(seed)
+    seeds = rng.randint(0, 2 ** 31 - 1, size=num_chains)
+    shard_dir = None
+    if db_filename is not None:
+        shard_dir = tempfile.mkdtemp(
+            prefix='.shards_',
+            dir=os.path.dirname(os.path.abspath(db_filename)))
+    try:
+        jobs = []
+        shard_filenames = []
+        for k in xrange(num_chains):
+            shard_filename = (None if db_filename is None
+                              else _shard_filename(shard_dir, db_filename, k))
+            shard_filenames.append(shard_filename)
+            jobs.append((mcmc_factory, k, int(seeds[k]), shard_filename,
+                         num_samples, sample_kwargs))
+        if num_processes is None:
+            num_processes = multiprocessing.cpu_count()
+        pool = multiprocessing.Pool(min(num_processes, num_chains))
+        try:
+            # Waiting with a timeout keeps the pool responsive to
+            # KeyboardInterrupt
+            results = pool.map_async(_sample_chain, jobs,
+                                     chunksize=1).get(2 ** 31)
+        finally:
+            # The workers are idle by now unless something went wrong
+            pool.terminate()
+            pool.join()
+        if db_filename is not None:
+            from . import merge_databases
+            merge_databases(db_filename, shard_filenames, remove_shards=True)
+    finally:
+        if shard_dir is not None:
+            shutil.rmtree(shard_dir, ignore_errors=True)
+    return results
@@ -0,0 +1,497 @@
+"""
+Sample a ladder of tempered chains in parallel and swap their states.
+
+Author:
+    Ilias Bilionis
+"""
+
+
+__all__ = ['ParallelTempering']
+
+
+import sys
+import math
+import traceback
+import multiprocessing
+import numpy as np
+from . import TemperedModel
+from . import GradProposal
+from . import ChainStorage
+from . import Callback
+
+
+class _RecordCollector(Callback):
+
+    """
+    Keeps the blocks of records it is given.
+    """
+
+    def __init__(self):
+        self.blocks = []
+
+    def on_record(self, sampler, records):
+        self.blocks.append(records)
+
+
+def _replica_report(mcmc):
+    """
+    Get what the master needs to know about a replica after a round.
+    """
+    model = mcmc.model.model
+    return {'params': np.array(model.params),
+            'log_likelihood': float(model.log_likelihood),
+            'accepted': mcmc.accepted,
+            'count': mcmc.count}
+
+
+def _run_worker(conn, mcmc_factory, replicas, betas, seed, db_fields):
+    """
+    Sample some of the replicas (this is what the workers do).
+
+    The worker builds its replicas and then waits for commands from the
+    master. A ``sample`` command sets the new parameters and temperatures
+    (after the swaps and the adaptation of the ladder) and continues every
+    replica for a number of steps. The replica ``0`` (the cold one) also
+    sends back its records. A ``close`` command sends back the final states
+    and ends the worker. The cold replica also says which entries of its
+    state should be stored if the user did not ask for some ``db_fields``
+    (see :class:`pymcmc.MetropolisHastings`).
+    """
+    try:
+        np.random.seed(seed)
+        mcmcs = {}
+        for k, beta in zip(replicas, betas):
+            mcmc = mcmc_factory(None)
+            mcmc.model = TemperedModel(mcmc.model, beta)
+            mcmc._prepare()
+            mcmcs[k] = mcmc
+        ready = dict((k, _replica_report(mcmc))
+                     for k, mcmc in mcmcs.iteritems())
+        if mcmcs.has_key(0):
+            (ready[0]['model_state'],
+             ready[0]['db_fields']) = mcmcs[0]._get_db_model_state(db_fields)
+            ready[0]['proposal_state'] = mcmcs[0].proposal.__getstate__()
+        conn.send(('ready', ready))
+        collector = None
+        while True:
+            command = conn.recv()
+            if command[0] == 'close':
+                final = dict((k, {'model_state': mcmc.model.__getstate__(),
+                                  'proposal_state':
+                                      mcmc.proposal.__getstate__()})
+                             for k, mcmc in mcmcs.iteritems())
+                conn.send(('closed', final))
+                break
+            (_, first_step, last_step, settings, new_params, new_betas,
+             fields) = command
+            for k, beta in new_betas.iteritems():
+                if beta != mcmcs[k].model.beta:
+                    mcmcs[k].model.beta = beta
+                    # The gradients remembered by the proposal were
+                    # tempered with the old beta
+                    if isinstance(mcmcs[k].proposal, GradProposal):
+                        mcmcs[k].proposal.forget_grads()
+            for k, params in new_params.iteritems():
+                mcmcs[k].model.params = params
+            if mcmcs.has_key(0) and fields is not None and collector is None:
+                collector = _RecordCollector()
+                mcmcs[0]._init_callbacks([collector], 1000, fields=fields)
+            for k, mcmc in mcmcs.iteritems():
+                mcmc._sample(first_step, last_step, checkpoint_frequency=None,
+                             verbose=False, **settings)
+            report = dict((k, _replica_report(mcmc))
+                          for k, mcmc in mcmcs.iteritems())
+            records = None
+            if collector is not None:
+                records = collector.blocks
+                collector.blocks = []
+            conn.send(('done', report, records))
+    except KeyboardInterrupt:
+        pass
+    except Exception:
+        conn.send(('error', traceback.format_exc()))
+    finally:
+        conn.close()
+
+
+class ParallelTempering(object):
+
+    """
+    Replica exchange (parallel tempering) sampling.
+
+    A ladder of replicas of the model is sampled. Replica ``k`` samples the
+    posterior with the log likelihood multiplied by the inverse temperature
+    ``betas[k]`` (see :class:`pymcmc.TemperedModel`), where
+    ``1 = betas[0] > betas[1] > ...``. The hot replicas move easily between
+    the modes of the posterior and the swaps pass what they find down to the
+    cold one (``betas[0] = 1``), which samples the posterior. So, the prior
+    of the model has to be proper.
+
+    The replicas are split among persistent worker processes. Each replica is
+    a :class:`pymcmc.MetropolisHastings` object (with its own proposal and
+    tuning) that is made by ``mcmc_factory`` inside the worker. Every
+    ``swap_frequency`` steps, the workers send the parameters and the log
+    likelihood of their replicas to the master, which tries to swap the
+    states of adjacent replicas (the even pairs and the odd pairs in turns).
+    Nothing else is sent, so a replica that receives new parameters
+    evaluates the model once more.
+
+    While the ladder is adapted, the spacing of the log temperatures is
+    changed so that all adjacent pairs swap at the same rate (the first and
+    the last temperatures are kept fixed).
+
+    Only the cold chain is stored (in the database). It is the chain of the
+    cold replica, so the steps at which a swap happened are steps at which
+    the cold chain jumps.
+
+    :param mcmc_factory:    A function that takes a database filename (it
+                            is always ``None``) and returns a
+                            :class:`pymcmc.MetropolisHastings` object (see
+                            :func:`pymcmc.sample_parallel`). It must be
+                            picklable, i.e. defined at the top level of a
+                            module.
+    :type mcmc_factory:     callable
+    :param num_temperatures:    The number of replicas.
+    :type num_temperatures:     int
+    :param max_temperature:     The temperature of the hottest replica. The
+                                initial ladder is geometric.
+    :type max_temperature:      float
+    :param betas:           The initial inverse temperatures. If given,
+                            ``num_temperatures`` and ``max_temperature`` are
+                            ignored.
+    :type betas:            1D :class:`numpy.ndarray`
+    :param num_processes:   The number of worker processes. If ``None``, then
+                            the number of cpus is used (but no more than the
+                            number of replicas).
+    :type num_processes:    int
+    :param db_filename:     The database in which the cold chain is stored.
+                            If ``None``, then nothing is saved.
+    :type db_filename:      str
+    :param db_buffer_size:  See :class:`pymcmc.DataBase`.
+    :type db_buffer_size:   int
+    :param db_fields:       See :class:`pymcmc.MetropolisHastings` (the
+                            gradients are stored by default only if the
+                            cold replica uses them).
+    :type db_fields:        list of str
+    :param db:              A storage backend to use instead of creating a
+                            :class:`pymcmc.DataBase`.
+    :type db:               :class:`pymcmc.ChainStorage`
+    :param seed:            A seed used for the swaps and to generate the
+                            seeds of the workers. If ``None``, then the
+                            global numpy random state is used.
+    :type seed:             int
+    """
+
+    def __init__(self, mcmc_factory, num_temperatures=8,
+                 max_temperature=100., betas=None, num_processes=None,
+                 db_filename=None, db_buffer_size=100, db_fields=None,
+                 db=None, seed=None):
+        """
+        Initialize the object.
+        """
+        self.mcmc_factory = mcmc_factory
+        if betas is None:
+            assert max_temperature > 1.
+            betas = max_temperature ** -np.linspace(0., 1., num_temperatures)
+        self.betas = np.array(betas, dtype='float64')
+        assert self.betas.ndim == 1 and self.betas.shape[0] >= 2
+        if (self.betas[0] != 1. or np.any(np.diff(self.betas) >= 0.) or
+            self.betas[-1] <= 0.):
+            raise ValueError('The inverse temperatures must start at 1 and'
+                             ' decrease to a positive number.')
+        if num_processes is None:
+            num_processes = multiprocessing.cpu_count()
+        self.num_processes = max(min(num_processes, self.num_temperatures), 1)
+        self.db_filename = db_filename
+        self._db_buffer_size = db_buffer_size
+        self._db_fields = db_fields
+        if db is not None:
+            assert isinstance(db, ChainStorage)
+        self.db = db
+        self._rng = np.random if seed is None else np.random.RandomState(seed)
+        self.model_states = None
+        self.proposal_states = None
+        self._workers = []
+
+    @property
+    def num_temperatures(self):
+        """
+        Get the number of replicas.
+        """
+        return self.betas.shape[0]
+
+    @property
+    def has_db(self):
+        """
+        Return ``True`` if we are using a database, ``False`` otherwise.
+        """
+        return self.db is not None or self.db_filename is not None
+
+    @property
+    def acceptance_rate(self):
+        """
+        Get the acceptance rate of each replica.
+        """
+        return self.accepted / self.count
+
+    @property
+    def swap_acceptance_rate(self):
+        """
+        Get the rate at which each pair of adjacent replicas swapped.
+        """
+        return self.swaps_accepted / np.maximum(self.swaps_attempted, 1)
+
+    def _start_workers(self):
+        """
+        Start the workers and wait until their replicas are ready.
+
+        :returns:   The reports of the replicas.
+        """
+        seeds = self._rng.randint(0, 2 ** 31 - 1, size=self.num_processes)
+        self._workers = []
+        for w in xrange(self.num_processes):
+            replicas = range(w, self.num_temperatures, self.num_processes)
+            conn, child_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_run_worker,
+                args=(child_conn, self.mcmc_factory, replicas,
+                      list(self.betas[replicas]), int(seeds[w]),
+                      self._db_fields))
+            process.daemon = True
+            process.start()
+            child_conn.close()
+            self._workers.append((process, conn, replicas))
+        return self._receive('ready')[0]
+
+    def _receive(self, expected):
+        """
+        Wait for the answers of all the workers.
+
+        :returns:   A tuple of the merged reports (replica -> report) and
+                    the list of the other things that were sent.
+        """
+        reports = {}
+        others = []
+        for process, conn, replicas in self._workers:
+            try:
+                answer = conn.recv()
+            except EOFError:
+                raise RuntimeError('A worker died.')
+            if answer[0] == 'error':
+                raise RuntimeError('A worker failed:\n' + answer[1])
+            assert answer[0] == expected
+            reports.update(answer[1])
+            others += answer[2:]
+        return reports, others
+
+    def _stop_workers(self, terminate=False):
+        """
+        Stop the workers.
+        """
+        for process, conn, replicas in self._workers:
+            if terminate:
+                process.terminate()
+            process.join()
+            conn.close()
+        self._workers = []
+
+    def _init_db(self, cold):
+        """
+        Create the database (if needed) and a new chain in it.
+        """
+        if self.db is None:
+            from . import DataBase
+            self.db = DataBase(self.db_filename, cold['model_state'],
+                               cold['proposal_state'],
+                               buffer_size=self._db_buffer_size,
+                               fields=cold['db_fields'])
+        self.db.add_proposal(cold['proposal_state'])
+        self.db.create_new_chain()
+
+    def _write_records(self, blocks):
+        """
+        Write the blocks of records of the cold chain to the database.
+        """
+        for block in blocks:
+            for j in xrange(block['step'].shape[0]):
+                state = dict((name, block[name][j]) for name in self.db.fields)
+                self.db.add_chain_record(int(block['step'][j]),
+                                         block['accepted'][j], state)
+
+    def _swap(self, reports, first_pair, new_params):
+        """
+        Try to swap the states of the pairs ``first_pair, first_pair + 2,
+        ...``.
+        """
+        for i in xrange(first_pair, self.num_temperatures - 1, 2):
+            a = reports[i]
+            b = reports[i + 1]
+            log_a = ((self.betas[i] - self.betas[i + 1]) *
+                     (b['log_likelihood'] - a['log_likelihood']))
+            self.swaps_attempted[i] += 1
+            self._ladder_acc[i] += math.exp(min(log_a, 0.))
+            self._ladder_num[i] += 1
+            if math.log(self._rng.rand()) <= log_a:
+                self.swaps_accepted[i] += 1
+                a['params'], b['params'] = b['params'], a['params']
+                a['log_likelihood'], b['log_likelihood'] = (b['log_likelihood'],
+                                                            a['log_likelihood'])
+                new_params[i] = a['params']
+                new_params[i + 1] = b['params']
+
+    def _adapt_ladder(self):
+        """
+        Change the spacing of the log temperatures so that the swap rates
+        become the same.
+        """
+        if np.any(self._ladder_num == 0):
+            return
+        rates = self._ladder_acc / self._ladder_num
+        self._ladder_acc[:] = 0.
+        self._ladder_num[:] = 0
+        log_t = -np.log(self.betas)
+        gaps = np.diff(log_t)
+        kappa = self.ladder_adaptation_rate / (1. + 0.1 * self._num_adapt)
+        gaps *= np.exp(kappa * (rates - np.mean(rates)))
+        gaps *= log_t[-1] / np.sum(gaps)
+        self.betas = np.exp(-np.hstack([0., np.cumsum(gaps)]))
+        self.betas[-1] = math.exp(-log_t[-1])
+        self._num_adapt += 1
+
+    def sample(self, num_samples, num_thin=1, num_burn=0, swap_frequency=10,
+               start_tuning_after=0, stop_tuning_after=None,
+               tuning_frequency=1000, stop_adapting_ladder_after=None,
+               ladder_adaptation_rate=1., verbose=False):
+        """
+        Sample the replicas.
+
+        :param num_samples:         The number of steps of every replica.
+        :type num_samples:          int
+        :param num_thin:            See
+                                    :meth:`pymcmc.MetropolisHastings.sample`.
+        :param num_burn:            See
+                                    :meth:`pymcmc.MetropolisHastings.sample`.
+        :param swap_frequency:      Try to swap every so many steps.
+        :type swap_frequency:       int
+        :param start_tuning_after:  See
+                                    :meth:`pymcmc.MetropolisHastings.sample`.
+        :param stop_tuning_after:   See
+                                    :meth:`pymcmc.MetropolisHastings.sample`.
+        :param tuning_frequency:    See
+                                    :meth:`pymcmc.MetropolisHastings.sample`.
+        :param stop_adapting_ladder_after:  Adapt the ladder until this step.
+                                            If ``None``, it is adapted during
+                                            the first half of the steps. Use
+                                            ``0`` to keep the ladder fixed.
+        :type stop_adapting_ladder_after:   int
+        :param ladder_adaptation_rate:  How fast the ladder changes.
+        :type ladder_adaptation_rate:   float
+        :param verbose:             Print something or not.
+        :type verbose:              bool
+
+        After sampling, the attributes ``betas`` (the final ladder),
+        ``acceptance_rate``, ``swap_acceptance_rate``, ``model_states`` and
+        ``proposal_states`` (the final states of the replicas) are
+        available.
+        """
+        assert swap_frequency >= 1
+        settings = {'num_thin': num_thin,
+                    'num_burn': num_burn,
+                    'start_tuning_after': (num_samples
+                                           if start_tuning_after is None
+                                           else start_tuning_after),
+                    'stop_tuning_after': (num_samples - 1
+                                          if stop_tuning_after is None
+                                          else min(stop_tuning_after,
+                                                   num_samples - 1)),
+                    'tuning_frequency': tuning_frequency}
+        if stop_adapting_ladder_after is None:
+            stop_adapting_ladder_after = num_samples // 2
+        self.ladder_adaptation_rate = ladder_adaptation_rate
+        num_pairs = self.num_temperatures - 1
+        self.swaps_attempted = np.zeros(num_pairs)
+        self.swaps_accepted = np.zeros(num_pairs)
+        self._ladder_acc = np.zeros(num_pairs)
+        self._ladder_num = np.zeros(num_pairs, dtype='int')
+        self._num_adapt = 0
+        self.accepted = np.zeros(self.num_temperatures)
+        self.count = np.zeros(self.num_temperatures)
+        try:
+            # If a replica cannot be made, the other workers must be stopped
+            reports = self._start_workers()
+            fields = None
+            if self.has_db:
+                self._init_db(reports[0])
+                fields = self.db.fields
+            new_params = {}
+            new_betas = {}
+            step = 0
+            num_rounds = 0
+            while step < num_samples:
+                last_step = min(step + swap_frequency, num_samples)
+                for process, conn, replicas in self._workers:
+                    conn.send(('sample', step, last_step, settings,
+                               dict((k, new_params[k]) for k in replicas
+                                    if new_params.has_key(k)),
+                               dict((k, new_betas[k]) for k in replicas
+                                    if new_betas.has_key(k)),
+                               fields))
+                reports, others = self._receive('done')
+                for blocks in others:
+                    if blocks is not None:
+                        self._write_records(blocks)
+                for k in xrange(self.num_temperatures):
+                    self.accepted[k] = reports[k]['accepted']
+                    self.count[k] = reports[k]['count']
+                step = last_step
+                new_params = {}
+                new_betas = {}
+                if step < num_samples:
+                    self._swap(reports, num_rounds % 2, new_params)
+                    if step <= stop_adapting_ladder_after:
+                        old_betas = self.betas
+                        self._adapt_ladder()
+                        if self.betas is not old_betas:
+                            new_betas = dict((k, self.betas[k]) for k in
+                                             xrange(self.num_temperatures))
+                num_rounds += 1
+                if verbose:
+                    sys.stdout.write('sample ' + str(step).zfill(len(str(num_samples)))
+                                     + ' of ' + str(num_samples)
+                                     + ', cold log_like: %.6f, acc. rate: %1.2f'
+                                       % (reports[0]['log_likelihood'],
+                                          self.acceptance_rate[0])
+                                     + ', min swap rate: %1.2f'
+                                       % np.min(self.swap_acceptance_rate)
+                                     + '\r')
+                    sys.stdout.flush()
+            for process, conn, replicas in self._workers:
+                conn.send(('close',))
+            final = self._receive('closed')[0]
+        except KeyboardInterrupt:
+            self._stop_workers(terminate=True)
+            if verbose:
+                sys.stdout.write('\n')
+            print '*** Interrupting sampling'
+        except Exception:
+            self._stop_workers(terminate=True)
+            raise
+        else:
+            self._stop_workers()
+            self.model_states = [final[k]['model_state']
+                                 for k in xrange(self.num_temperatures)]
+            self.proposal_states = [final[k]['proposal_state']
+                                    for k in xrange(self.num_temperatures)]
+            if verbose:
+                sys.stdout.write('\n')
+        if self.db is not None:
+            self.db.flush()
+
+    def __str__(self):
+        """
+        Return a string representation of the object.
+        """
+        s = 'Parallel tempering with ' + str(self.num_temperatures)
+        s += ' replicas\n'
+        s += 'Inverse temperatures:\t' + str(self.betas)
+        return s
@@ -0,0 +1,290 @@
+"""
+Timing of the phases of the sampling loop.
+
+Author:
+    Ilias Bilionis
+"""
+
+
+__all__ = ['Profiler']
+
+
+import timeit
+from . import Model
+
+
+# The most accurate wall clock of the platform
+_timer = timeit.default_timer
+
+
+class Profiler(object):
+
+    """
+    Records the wall time spent in each phase of the sampling loop and how
+    many times each phase was entered.
+
+    The phases are:
+        + ``propose``:  making the proposal (copying states, drawing random
+                        numbers, etc.),
+        + ``model``:    evaluating the model at new parameters,
+        + ``grad``:     evaluating the gradients of the model,
+        + ``accept``:   accepting or rejecting the proposal,
+        + ``storage``:  writing the chain and the checkpoints,
+        + ``tuning``:   adapting and tuning the proposal,
+        + ``callbacks``: notifying the callbacks (see
+                        :class:`pymcmc.Callback`).
+
+    Phases may be nested (e.g. the model is evaluated while proposing). The
+    time of a phase does not include the time of the phases nested in it, so
+    the times add up to the time spent in the sampling loop minus the time
+    spent elsewhere (``other``).
+
+    The model evaluations are seen through the model returned by
+    :meth:`pymcmc.Profiler.wrap_model`. A profiler is used by passing it (or
+    just ``True``) as the ``profile`` argument of
+    :meth:`pymcmc.MetropolisHastings.sample`. Timing a phase costs about a
+    microsecond, i.e. a few microseconds per step, which is negligible
+    unless the model is trivial.
+    """
+
+    # The phases of the sampling loop
+    PHASES = ['propose', 'model', 'grad', 'accept', 'storage', 'tuning',
+              'callbacks']
+
+    def __init__(self):
+        """
+        Initialize the object.
+        """
+        self.reset()
+
+    def reset(self):
+        """
+        Forget everything recorded so far.
+        """
+        self.times = dict((phase, 0.) for phase in self.PHASES)
+        self.calls = dict((phase, 0) for phase in self.PHASES)
+        self.total_time = 0.
+        self._stack = []
+        self._begin_time = None
+
+    def begin(self):
+        """
+        Mark the start of the sampling loop.
+        """
+        self._begin_time = _timer()
+
+    def end(self):
+        """
+        Mark the end of the sampling loop.
+        """
+        now = _timer()
+        # Close the phases left open by an exception
+        while self._stack:
+            self.stop()
+        if self._begin_time is not None:
+            self.total_time += now - self._begin_time
+            self._begin_time = None
+
+    def start(self, phase):
+        """
+        Enter a phase.
+        """
+        now = _timer()
+        stack = self._stack
+        if stack:
+            top = stack[-1]
+            self.times[top[0]] += now - top[1]
+        stack.append([phase, now])
+        self.calls[phase] += 1
+
+    def stop(self):
+        """
+        Leave the current phase.
+        """
+        now = _timer()
+        stack = self._stack
+        phase, start_time = stack.pop()
+        self.times[phase] += now - start_time
+        if stack:
+            # The enclosing phase continues from now
+            stack[-1][1] = now
+
+    def wrap_model(self, model):
+        """
+        Get a model that behaves as ``model`` but records the time of its
+        evaluations.
+        """
+        return _ProfiledModel(model, self)
+
+    def get_report(self):
+        """
+        Get the recorded times.
+
+        :returns:   A dictionary with the total time of the sampling loop
+                    (``total_time``), the time that was not spent in any
+                    phase (``other_time``) and, for each phase, a dictionary
+                    with its time (``time``), the number of calls
+                    (``calls``) and the fraction of the total time
+                    (``fraction``).
+        """
+        report = {}
+        report['total_time'] = self.total_time
+        report['other_time'] = max(self.total_time -
+                                   sum(self.times.values()), 0.)
+        report['phases'] = {}
+        for phase in self.PHASES:
+            fraction = (self.times[phase] / self.total_time
+                        if self.total_time > 0. else 0.)
+            report['phases'][phase] = {'time': self.times[phase],
+                                       'calls': self.calls[phase],
+                                       'fraction': fraction}
+        return report
+
+    def __str__(self):
+        """
+        Return a string representation of the object.
+        """
+        report = self.get_report()
+        s = 'Phase\t\tTime (s)\tCalls\t\tFraction\n'
+        for phase in self.PHASES:
+            r = report['phases'][phase]
+            s += '%-9s\t%.6f\t%-8d\t%1.3f\n' % (phase, r['time'], r['calls'],
+                                               r['fraction'])
+        other = report['other_time']
+        total = report['total_time']
+        s += '%-9s\t%.6f\t\t\t%1.3f\n' % ('other', other,
+                                          other / total if total > 0. else 0.)
+        s += 'Total time:\t%.6f' % total
+        return s
+
+
+class _ProfiledModel(Model):
+
+    """
+    A model that forwards everything to another model timing the
+    evaluations (setting the parameters or evaluating in batch) and the
+    gradients.
+
+    Models may compute the gradients only when they are asked for (e.g.
+    when the state is stored), so getting a state that contains them is
+    timed as a gradient evaluation too.
+    """
+
+    def __init__(self, model, profiler):
+        """
+        Initialize the object.
+        """
+        self.model = model
+        self.profiler = profiler
+        self.__name__ = model.__name__
+
+    def _has_grad_fields(self, fields):
+        """
+        Return ``True`` if getting these entries of the state may evaluate
+        the gradients.
+        """
+        if not self.model.has_grad:
+            return False
+        return (fields is None or 'grad_log_likelihood' in fields or
+                'grad_log_prior' in fields)
+
+    def __getstate__(self):
+        if not self._has_grad_fields(None):
+            return self.model.__getstate__()
+        self.profiler.start('grad')
+        try:
+            return self.model.__getstate__()
+        finally:
+            self.profiler.stop()
+
+    def __setstate__(self, state):
+        self.model.__setstate__(state)
+
+    def get_state(self, fields=None):
+        if not self._has_grad_fields(fields):
+            return self.model.get_state(fields)
+        self.profiler.start('grad')
+        try:
+            return self.model.get_state(fields)
+        finally:
+            self.profiler.stop()
+
+    @property
+    def log_likelihood(self):
+        return self.model.log_likelihood
+
+    @property
+    def log_prior(self):
+        return self.model.log_prior
+
+    @property
+    def num_params(self):
+        return self.model.num_params
+
+    @property
+    def params(self):
+        return self.model.params
+
+    @params.setter
+    def params(self, value):
+        self.profiler.start('model')
+        try:
+            self.model.params = value
+        finally:
+            self.profiler.stop()
+
+    @property
+    def param_names(self):
+        return self.model.param_names
+
+    @property
+    def grad_log_likelihood(self):
+        self.profiler.start('grad')
+        try:
+            return self.model.grad_log_likelihood
+        finally:
+            self.profiler.stop()
+
+    @property
+    def grad_log_prior(self):
+        self.profiler.start('grad')
+        try:
+            return self.model.grad_log_prior
+        finally:
+            self.profiler.stop()
+
+    @property
+    def grad_log_p(self):
+        self.profiler.start('grad')
+        try:
+            return self.model.grad_log_p
+        finally:
+            self.profiler.stop()
+
+    @property
+    def has_grad(self):
+        return self.model.has_grad
+
+    @property
+    def cache(self):
+        return self.model.cache
+
+    @property
+    def can_stage(self):
+        return self.model.can_stage
+
+    def stage(self):
+        self.model.stage()
+
+    def commit(self):
+        self.model.commit()
+
+    def rollback(self):
+        self.model.rollback()
+
+    def eval_batch(self, params, compute_grad=False):
+        self.profiler.start('model')
+        try:
+            return self.model.eval_batch(params, compute_grad=compute_grad)
+        finally:
+            self.profiler.stop()
@@ -50,6 +50,25 @@ class Proposal(object):
         """
         self.__name__ = state['name']
 
+    def get_checkpoint(self):
+        """
+        Get everything needed to restore the proposal exactly.
+
+        By default, this is the state of the object. Proposals that keep more
+        than their state (e.g. adaptation statistics) should add it here.
+        """
+        return copy.deepcopy(self.__getstate__())
+
+    def set_checkpoint(self, checkpoint):
+        """
+        Restore the proposal from a checkpoint.
+
+        :param checkpoint:  As returned by
+                            :meth:`pymcmc.Proposal.get_checkpoint`.
+        :type checkpoint:   dict
+        """
+        self.__setstate__(copy.deepcopy(checkpoint))
+
     def propose(self, model):
         """
         Propose a move.
@@ -75,6 +94,46 @@ class Proposal(object):
         model.__setstate__(old_state)
         return new_state, log_a1 + log_a2
 
+    def propose_staged(self, model):
+        """
+        Propose a move without copying the state of the model.
+
+        :param model:       The model. It must support staging (see
+                            :attr:`pymcmc.Model.can_stage`).
+        :returns:           The logarithm of the probability for acceptance.
+
+        Upon return, the model is left at the proposed state while the old
+        one is retained by the model. It is up to the caller to either
+        :meth:`pymcmc.Model.commit` or :meth:`pymcmc.Model.rollback`.
+        """
+        old_log_like = model.log_likelihood
+        old_log_prior = model.log_prior
+        model.stage()
+        log_a2 = self._do_propose(model)
+        new_log_like = model.log_likelihood
+        new_log_prior = model.log_prior
+        log_a1 = (new_log_like - old_log_like) + (new_log_prior - old_log_prior)
+        return log_a1 + log_a2
+
+    def propose_batch(self, model, state):
+        """
+        Propose a move for many chains at once.
+
+        :param model:       The model. It is only used to evaluate the new
+                            parameters via :meth:`pymcmc.Model.eval_batch`.
+        :param state:       The current state of the chains as returned by
+                            :meth:`pymcmc.Model.eval_batch`.
+        :type state:        dict
+        :returns:           A tuple of the following form:
+                            (new_state, log_p)
+                            where:
+                                + ``new_state`` is the proposed state of the
+                                  chains (same format as ``state``)
+                                + ``log_p`` is a 1D array containing the
+                                  probability for acceptance of each chain
+        """
+        raise NotImplementedError('Implement this.')
+
     def _do_propose(self, model):
         """
         Actually propose a move.
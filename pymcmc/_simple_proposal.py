@@ -10,6 +10,7 @@ Author:
 __all__ = ['SimpleProposal']
 
 
+import numpy as np
 from . import Proposal
 
 
@@ -44,6 +45,22 @@ class SimpleProposal(Proposal):
         model.params = new_params
         return log_p_old_cond_new - log_p_new_cond_old
 
+    def propose_batch(self, model, state):
+        """
+        Propose a move for many chains at once.
+
+        See :meth:`pymcmc.Proposal.propose_batch`.
+        """
+        old_params = state['params']
+        new_params = self._sample_batch(old_params)
+        new_state = model.eval_batch(new_params)
+        log_p_new_cond_old = self(new_params, old_params)
+        log_p_old_cond_new = self(old_params, new_params)
+        log_a1 = ((new_state['log_likelihood'] - state['log_likelihood']) +
+                  (new_state['log_prior'] - state['log_prior']))
+        log_a2 = log_p_old_cond_new - log_p_new_cond_old
+        return new_state, log_a1 + log_a2
+
     def _sample(self, old_params):
         """
         Sample the proposal given the ``old_params``.
@@ -53,11 +70,26 @@ class SimpleProposal(Proposal):
         """
         raise NotImplementedError('Implement this.')
 
+    def _sample_batch(self, old_params):
+        """
+        Sample the proposal given many ``old_params`` at once.
+
+        :param old_params:  The old parameters (one row per chain).
+        :returns:           The new parameters (one row per chain).
+
+        The default implementation loops over the rows. Deriving classes
+        should override it with something faster.
+        """
+        return np.array([self._sample(p) for p in old_params])
+
     def __call__(self, new_params, old_params):
         """
         Evaluate the proposal at the new parameters given the old parameters.
         :param new_params:      The new parameters.
         :param old_params:      The old parameters. We are assuming that we
                                 are conditioning on them.
+
+        If the parameters are 2D arrays (one row per chain), then this should
+        return a 1D array with the value for each row.
         """
         raise NotImplementedError('Implement this.')
@@ -0,0 +1,119 @@
+"""
+A model whose likelihood is raised to a power.
+
+Author:
+    Ilias Bilionis
+"""
+
+
+__all__ = ['TemperedModel']
+
+
+from . import Model
+
+
+class TemperedModel(Model):
+
+    """
+    A model whose log likelihood is that of another model multiplied by an
+    inverse temperature ``beta``. The log prior is not changed, so
+    ``beta = 0`` gives the prior and ``beta = 1`` the posterior.
+
+    The states (see :meth:`pymcmc.Model.__getstate__`) are those of the
+    underlying model, i.e. the log likelihood kept in them is not tempered.
+    So, changing the temperature does not require evaluating anything. On
+    the contrary, the batches returned by
+    :meth:`pymcmc.TemperedModel.eval_batch` are tempered, since they are what
+    the proposals see.
+
+    :param model:   The model.
+    :type model:    :class:`pymcmc.Model`
+    :param beta:    The inverse temperature.
+    :type beta:     float
+    """
+
+    def __init__(self, model, beta=1.):
+        """
+        Initialize the object.
+        """
+        assert isinstance(model, Model)
+        self.model = model
+        self.beta = float(beta)
+        assert self.beta >= 0.
+        super(TemperedModel, self).__init__(name=model.__name__)
+
+    def __getstate__(self):
+        return self.model.__getstate__()
+
+    def __setstate__(self, state):
+        self.model.__setstate__(state)
+
+    def get_state(self, fields=None):
+        return self.model.get_state(fields)
+
+    @property
+    def log_likelihood(self):
+        return self.beta * self.model.log_likelihood
+
+    @property
+    def log_prior(self):
+        return self.model.log_prior
+
+    @property
+    def num_params(self):
+        return self.model.num_params
+
+    @property
+    def params(self):
+        return self.model.params
+
+    @params.setter
+    def params(self, value):
+        self.model.params = value
+
+    @property
+    def param_names(self):
+        return self.model.param_names
+
+    @property
+    def grad_log_likelihood(self):
+        return self.beta * self.model.grad_log_likelihood
+
+    @property
+    def grad_log_prior(self):
+        return self.model.grad_log_prior
+
+    @property
+    def has_grad(self):
+        return self.model.has_grad
+
+    @property
+    def cache(self):
+        return self.model.cache
+
+    @property
+    def can_stage(self):
+        return self.model.can_stage
+
+    def stage(self):
+        self.model.stage()
+
+    def commit(self):
+        self.model.commit()
+
+    def rollback(self):
+        self.model.rollback()
+
+    def eval_batch(self, params, compute_grad=False):
+        batch = self.model.eval_batch(params, compute_grad=compute_grad)
+        batch['log_likelihood'] = self.beta * batch['log_likelihood']
+        if compute_grad:
+            batch['grad_log_likelihood'] = (self.beta *
+                                            batch['grad_log_likelihood'])
+        return batch
+
+    def __str__(self):
+        """
+        Return a string representation of the object.
+        """
+        return 'Inverse temperature:\t' + str(self.beta) + '\n' + str(self.model)
@@ -38,6 +38,27 @@ class TunableProposalConcept(object):
         """
         raise NotImplementedError('Implement this.')
 
+    def adapt(self, params):
+        """
+        Learn from the current parameters of the chain.
+
+        It is called after every step during the tuning period (in contrast
+        to :meth:`pymcmc.TunableProposalConcept.tune` which is called every
+        few steps). By default, it does nothing.
+
+        :param params:  The current parameters of the chain (or a 2D array
+                        with one row per chain).
+        :type params:   :class:`numpy.ndarray`
+        """
+        pass
+
+    def finish_tuning(self):
+        """
+        It is called once when the tuning period is over. By default, it does
+        nothing.
+        """
+        pass
+
     def __getstate__(self):
         """
         Get the state of the object.
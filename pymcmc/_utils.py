@@ -6,11 +6,11 @@ Author:
 """
 
 
-import tables as pt
 import numpy as np
 
 
-__all__ = ['UnknownTypeException', 'state_to_table_dtype']
+__all__ = ['UnknownTypeException', 'state_to_table_dtype',
+           'state_to_numpy_dtype', 'cholesky_update']
 
 
 class UnknownTypeException(Exception):
@@ -26,17 +26,28 @@ DTYPE_STR_BUFFER_SAFETY_FACTOR = 2
 
 
 def state_to_table_dtype(state,
-                         str_buffer_safety_factor=DTYPE_STR_BUFFER_SAFETY_FACTOR):
+                         str_buffer_safety_factor=DTYPE_STR_BUFFER_SAFETY_FACTOR,
+                         fields=None):
     """
     Get a state of an object represented as a dictionary and derive the
     appropriate type of a tables.Table.
 
     :param state:       The state of an object.
     :type state:        dict
+    :param fields:      The names of the entries of the state that should be
+                        part of the table. If ``None``, then all of them are
+                        used.
+    :type fields:       list of str
     :raises:            :class:`pymc.UnknownTypeException`
     """
+    import tables as pt
+    if fields is None:
+        fields = state.keys()
+    for name in fields:
+        if not state.has_key(name):
+            raise ValueError('The state has no entry named `' + name + '`.')
     dtype_dict = {}
-    for name in state.keys():
+    for name in fields:
         if isinstance(state[name], int):
             dtype = pt.UInt32Col()
         elif isinstance(state[name], float):
@@ -51,3 +62,71 @@ def state_to_table_dtype(state,
                                        %(name, type(state[name])))
         dtype_dict[name] = dtype
     return dtype_dict
+
+
+def state_to_numpy_dtype(state,
+                         str_buffer_safety_factor=DTYPE_STR_BUFFER_SAFETY_FACTOR,
+                         fields=None):
+    """
+    Get a state of an object represented as a dictionary and derive the
+    numpy data type and shape of each entry.
+
+    This is the numpy analogue of :func:`pymcmc.state_to_table_dtype`.
+
+    :param state:       The state of an object.
+    :type state:        dict
+    :param fields:      The names of the entries of the state that should be
+                        considered. If ``None``, then all of them are used.
+    :type fields:       list of str
+    :returns:           A dictionary mapping each name to a tuple
+                        (dtype, shape).
+    :raises:            :class:`pymc.UnknownTypeException`
+    """
+    if fields is None:
+        fields = state.keys()
+    for name in fields:
+        if not state.has_key(name):
+            raise ValueError('The state has no entry named `' + name + '`.')
+    dtype_dict = {}
+    for name in fields:
+        if isinstance(state[name], int):
+            dtype = (np.dtype('uint32'), ())
+        elif isinstance(state[name], float):
+            dtype = (np.dtype('float64'), ())
+        elif isinstance(state[name], str):
+            dtype = (np.dtype('S%d' % (len(state[name]) *
+                                       str_buffer_safety_factor)), ())
+        elif isinstance(state[name], np.ndarray):
+            dtype = (np.dtype('float64'), state[name].shape)
+        else:
+            raise UnknownTypeException('I cannot deal with the type of %s (%s)'
+                                       %(name, type(state[name])))
+        dtype_dict[name] = dtype
+    return dtype_dict
+
+
+def cholesky_update(L, x):
+    """
+    Update in place the Cholesky factor of a matrix after adding a rank one
+    term to it.
+
+    If ``L`` is the lower triangular factor of ``A``, then on return it is
+    the lower triangular factor of ``A + x x^T``. It costs O(d^2).
+
+    :param L:   A lower triangular matrix (modified in place).
+    :type L:    2D numpy array
+    :param x:   A vector (it is not modified).
+    :type x:    1D numpy array
+    :returns:   ``L``.
+    """
+    x = np.array(x, dtype='float64')
+    d = x.shape[0]
+    for k in xrange(d):
+        r = np.sqrt(L[k, k] ** 2 + x[k] ** 2)
+        c = r / L[k, k]
+        s = x[k] / L[k, k]
+        L[k, k] = r
+        if k + 1 < d:
+            L[k + 1:, k] = (L[k + 1:, k] + s * x[k + 1:]) / c
+            x[k + 1:] = c * x[k + 1:] - s * L[k + 1:, k]
+    return L
@@ -0,0 +1,103 @@
+"""
+Unit tests for the AdaptiveMetropolisProposal class and the rank one
+Cholesky update it relies on.
+
+Author:
+    Ilias Bilionis
+"""
+
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.split(__file__)[0],
+                                                '..')))
+import numpy as np
+import pymcmc as pm
+
+
+NUM_PRIOR = 50
+NUM_SAMPLES = 500
+
+
+def expected_cov(cov0, X):
+    """
+    The covariance the proposal should have after adapting to the rows of
+    ``X``.
+    """
+    n = X.shape[0]
+    M = (n - 1.) * np.cov(X.T)
+    return (NUM_PRIOR * cov0 + M) / (NUM_PRIOR + n)
+
+
+def make_samples(d, seed):
+    """
+    Draw correlated samples.
+    """
+    rng = np.random.RandomState(seed)
+    A = rng.randn(d, d)
+    return np.dot(rng.randn(NUM_SAMPLES, d), A.T) + rng.randn(d)
+
+
+def check_factor(proposal, cov):
+    """
+    Compare the factor of the proposal with that of ``cov``.
+    """
+    L = proposal.chol
+    assert np.allclose(np.triu(L, 1), 0.)
+    assert np.all(np.diag(L) > 0.)
+    assert np.allclose(np.dot(L, L.T), cov)
+    assert np.allclose(L, np.linalg.cholesky(cov))
+    assert np.allclose(proposal.cov, cov)
+
+
+def test_cholesky_update():
+    rng = np.random.RandomState(0)
+    A = rng.randn(5, 5)
+    A = np.dot(A, A.T) + np.eye(5)
+    x = rng.randn(5)
+    L = np.linalg.cholesky(A)
+    x_copy = x.copy()
+    assert pm.cholesky_update(L, x) is L
+    assert np.array_equal(x, x_copy)
+    assert np.allclose(L, np.linalg.cholesky(A + np.outer(x, x)))
+
+
+def test_adapt():
+    d = 4
+    X = make_samples(d, 1)
+    cov0 = 0.5 * np.eye(d)
+    # One sample at a time
+    proposal = pm.AdaptiveMetropolisProposal(cov0, num_prior=NUM_PRIOR)
+    for n, x in enumerate(X):
+        proposal.adapt(x)
+        if (n + 1) % 100 == 0:
+            check_factor(proposal, expected_cov(cov0, X[:n + 1]))
+    assert proposal.num_adapt == NUM_SAMPLES
+    # All at once
+    proposal = pm.AdaptiveMetropolisProposal(cov0, num_prior=NUM_PRIOR)
+    proposal.adapt(X)
+    check_factor(proposal, expected_cov(cov0, X))
+
+
+def test_singular_start():
+    d = 3
+    X = make_samples(d, 2)
+    # A covariance of rank one
+    v = np.array([1., 2., -1.])
+    cov0 = np.outer(v, v)
+    proposal = pm.AdaptiveMetropolisProposal(cov0, num_prior=NUM_PRIOR)
+    L = proposal.chol
+    assert np.all(np.diag(L) > 0.)
+    # A tiny jitter was added to the covariance so that it can be factored
+    cov0_jitter = proposal.cov.copy()
+    assert np.allclose(cov0_jitter, cov0, atol=1e-6)
+    assert np.allclose(np.dot(L, L.T), cov0_jitter)
+    proposal.adapt(X)
+    check_factor(proposal, expected_cov(cov0_jitter, X))
+
+
+if __name__ == '__main__':
+    test_cholesky_update()
+    test_adapt()
+    test_singular_start()
+    print 'OK'
@@ -0,0 +1,186 @@
+"""
+Unit tests for the ArrayModel class.
+
+Author:
+    Ilias Bilionis
+"""
+
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.split(__file__)[0],
+                                                '..')))
+import numpy as np
+import pymcmc as pm
+
+
+PREC = np.array([[2., 0.5], [0.5, 1.]])
+
+
+def log_likelihood(x):
+    return -0.5 * np.sum(np.dot(x, PREC) * x, axis=1)
+
+
+def grad_log_likelihood(x):
+    return -np.dot(x, PREC)
+
+
+def log_prior(x):
+    return -0.5 * np.sum(x ** 2, axis=1) / 10.
+
+
+def grad_log_prior(x):
+    return -x / 10.
+
+
+class PlainModel(pm.Model):
+
+    """
+    The same target as a model that keeps its state in a dictionary (and
+    does not support staging).
+    """
+
+    def __init__(self, init_params):
+        super(PlainModel, self).__init__(name='Plain Model')
+        self.params = init_params
+
+    def __getstate__(self):
+        return self._state
+
+    def __setstate__(self, state):
+        self._state = state
+
+    @property
+    def log_likelihood(self):
+        return self._state['log_likelihood']
+
+    @property
+    def log_prior(self):
+        return self._state['log_prior']
+
+    @property
+    def num_params(self):
+        return 2
+
+    @property
+    def params(self):
+        return self._state['params']
+
+    @params.setter
+    def params(self, value):
+        x = np.array(value, dtype='float64')
+        self._state = {'params': x,
+                       'log_likelihood': log_likelihood(x[None, :])[0],
+                       'log_prior': log_prior(x[None, :])[0],
+                       'grad_log_likelihood': grad_log_likelihood(x),
+                       'grad_log_prior': grad_log_prior(x)}
+
+    @property
+    def param_names(self):
+        return ['x0', 'x1']
+
+    @property
+    def grad_log_likelihood(self):
+        return self._state['grad_log_likelihood']
+
+    @property
+    def grad_log_prior(self):
+        return self._state['grad_log_prior']
+
+
+def make_model(init_params=np.zeros(2)):
+    """
+    Make the model with gradients.
+    """
+    return pm.ArrayModel(log_likelihood, init_params, log_prior=log_prior,
+                         grad_log_likelihood=grad_log_likelihood,
+                         grad_log_prior=grad_log_prior)
+
+
+def check_at(model, x):
+    """
+    Check that the model is at ``x``.
+    """
+    x = np.asarray(x, dtype='float64')
+    assert np.array_equal(model.params, x)
+    assert model.log_likelihood == log_likelihood(x[None, :])[0]
+    assert model.log_prior == log_prior(x[None, :])[0]
+    assert np.allclose(model.grad_log_p,
+                       grad_log_likelihood(x) + grad_log_prior(x))
+
+
+def test_staging():
+    model = make_model()
+    a, b, c = np.array([1., 2.]), np.array([-1., 0.5]), np.array([3., 3.])
+    model.params = a
+    # Many proposals while a is staged never overwrite it
+    for x in [b, c, b, c]:
+        model.stage()
+        model.params = x
+        model.params = -x
+        check_at(model, -x)
+        model.rollback()
+        check_at(model, a)
+    # A committed state stays
+    model.stage()
+    model.params = b
+    model.commit()
+    check_at(model, b)
+    model.rollback()
+    check_at(model, b)
+
+
+def test_states():
+    model = make_model(np.array([1., 2.]))
+    # The gradients are only computed if they are asked for
+    state = model.get_state(['params', 'log_likelihood', 'log_prior'])
+    assert sorted(state.keys()) == ['log_likelihood', 'log_prior', 'params']
+    state = model.__getstate__()
+    assert np.allclose(state['grad_log_likelihood'],
+                       grad_log_likelihood(np.array([1., 2.])))
+    # The states are copies
+    state['params'][0] = 100.
+    check_at(model, [1., 2.])
+    state['params'][0] = 1.
+    # Going back to a state (with or without the gradients)
+    model.params = np.array([5., 5.])
+    model.__setstate__(state)
+    check_at(model, [1., 2.])
+    del state['grad_log_likelihood']
+    del state['grad_log_prior']
+    model.params = np.array([5., 5.])
+    model.__setstate__(state)
+    check_at(model, [1., 2.])
+
+
+def test_eval_batch():
+    model = make_model(np.array([1., 2.]))
+    x = np.random.RandomState(0).randn(10, 2)
+    batch = model.eval_batch(x, compute_grad=True)
+    assert np.allclose(batch['log_likelihood'], log_likelihood(x))
+    assert np.allclose(batch['log_prior'], log_prior(x))
+    assert np.allclose(batch['grad_log_likelihood'], grad_log_likelihood(x))
+    assert np.allclose(batch['grad_log_prior'], grad_log_prior(x))
+    batch = model.eval_batch(x)
+    assert not batch.has_key('grad_log_likelihood')
+    check_at(model, [1., 2.])
+
+
+def test_same_chain():
+    # Sampling with the slots gives the same chain as copying the states
+    chains = []
+    for model in [make_model(np.ones(2)), PlainModel(np.ones(2))]:
+        mcmc = pm.MetropolisHastings(model, proposal=pm.MALAProposal(dt=0.5))
+        np.random.seed(7)
+        mcmc.sample(300)
+        chains.append((np.array(model.params), mcmc.accepted))
+    assert np.allclose(chains[0][0], chains[1][0])
+    assert chains[0][1] == chains[1][1]
+
+
+if __name__ == '__main__':
+    test_staging()
+    test_states()
+    test_eval_batch()
+    test_same_chain()
+    print 'OK'
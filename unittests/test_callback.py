@@ -0,0 +1,188 @@
+"""
+Unit tests for the callbacks of the sampling methods.
+
+Author:
+    Ilias Bilionis
+"""
+
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.split(__file__)[0],
+                                                '..')))
+import shutil
+import tempfile
+import numpy as np
+import pymcmc as pm
+
+
+NUM_SAMPLES = 250
+BLOCK_SIZE = 16
+TUNING_FREQUENCY = 50
+SEED = 314
+
+
+class EventLog(pm.Callback):
+
+    """
+    Keeps everything it is told in the order it is told.
+    """
+
+    def __init__(self, interrupt_at=None):
+        self.events = []
+        self.interrupt_at = interrupt_at
+
+    def on_step(self, sampler, steps):
+        self.events.append(('step', steps))
+        if (self.interrupt_at is not None and
+            steps['step'][-1] >= self.interrupt_at):
+            raise KeyboardInterrupt()
+
+    def on_record(self, sampler, records):
+        self.events.append(('record', records))
+
+    def on_tune(self, sampler, step, acceptance_rate):
+        self.events.append(('tune', step))
+
+    def on_interrupt(self, sampler, step):
+        self.events.append(('interrupt', step))
+
+    def on_finish(self, sampler):
+        self.events.append(('finish', None))
+
+    def blocks(self, kind):
+        return [value for event, value in self.events if event == kind]
+
+    def concatenate(self, kind):
+        blocks = self.blocks(kind)
+        return dict((name, np.concatenate([b[name] for b in blocks]))
+                    for name in blocks[0].keys())
+
+
+class NoOp(pm.Callback):
+
+    """
+    Overrides nothing.
+    """
+
+    pass
+
+
+def make_mcmc(db_filename=None):
+    """
+    Make a sampler of a 2-d normal with gradients.
+    """
+    model = pm.ArrayModel(lambda x: -0.5 * np.sum(x ** 2, axis=1),
+                          np.zeros(2), grad_log_likelihood=lambda x: -x)
+    return pm.MetropolisHastings(model,
+                                 proposal=pm.RandomWalkProposal(cov=np.eye(2)),
+                                 db_filename=db_filename)
+
+
+def sample(mcmc, callbacks):
+    """
+    Sample with a fixed seed.
+    """
+    np.random.seed(SEED)
+    mcmc.sample(NUM_SAMPLES, num_thin=3, num_burn=10,
+                tuning_frequency=TUNING_FREQUENCY, callbacks=callbacks,
+                callback_block_size=BLOCK_SIZE)
+
+
+def test_events():
+    tmp = tempfile.mkdtemp()
+    try:
+        mcmc = make_mcmc(os.path.join(tmp, 'chain.h5'))
+        log = EventLog()
+        sample(mcmc, [log, NoOp()])
+        chain = mcmc.db.read_chain(0)
+        mcmc.db.close()
+    finally:
+        shutil.rmtree(tmp)
+    # The steps come in blocks and none is missing
+    assert all(b['step'].shape[0] <= BLOCK_SIZE for b in log.blocks('step'))
+    steps = log.concatenate('step')
+    assert np.array_equal(steps['step'], np.arange(1, NUM_SAMPLES + 1))
+    assert steps['params'].shape == (NUM_SAMPLES, 2)
+    assert np.sum(steps['accepted']) == mcmc.accepted
+    assert np.array_equal(steps['params'][-1], mcmc.model.params)
+    # The records are those of the database (without the gradients)
+    records = log.concatenate('record')
+    assert sorted(records.keys()) == sorted(name for name in chain.keys()
+                                            if name != 'proposal')
+    assert not 'grad_log_likelihood' in records
+    for name in records.keys():
+        assert np.array_equal(records[name], chain[name]), name
+    # Everything up to a tuning is passed before it
+    steps_seen = 0
+    for event, value in log.events:
+        if event == 'step':
+            steps_seen = value['step'][-1]
+        elif event == 'tune':
+            assert steps_seen == value
+    tunes = log.blocks('tune')
+    assert tunes == range(TUNING_FREQUENCY + 1, NUM_SAMPLES,
+                          TUNING_FREQUENCY)
+    assert log.events[-1] == ('finish', None)
+    assert len(log.blocks('finish')) == 1
+
+
+def test_default_fields():
+    # Without a database, the records do not have the gradients
+    log = EventLog()
+    sample(make_mcmc(), [log])
+    records = log.concatenate('record')
+    assert sorted(records.keys()) == ['accepted', 'log_likelihood',
+                                      'log_prior', 'params', 'step']
+
+
+def test_same_chain():
+    # The callbacks do not change the chain
+    mcmc = make_mcmc()
+    sample(mcmc, None)
+    params = np.array(mcmc.model.params)
+    mcmc = make_mcmc()
+    sample(mcmc, [EventLog()])
+    assert np.array_equal(mcmc.model.params, params)
+
+
+def test_no_collection():
+    # Nothing is collected for callbacks that do not want it
+    callbacks = pm.CallbackList([NoOp()])
+    assert not callbacks.wants_steps and not callbacks.wants_records
+    callbacks = pm.CallbackList([NoOp(), EventLog()])
+    assert callbacks.wants_steps and callbacks.wants_records
+
+
+def test_interrupt():
+    log = EventLog(interrupt_at=100)
+    sample(make_mcmc(), [log])
+    # The interruption comes right after the step that raised it
+    last_step = log.concatenate('step')['step'][-1]
+    assert 100 <= last_step <= 100 + BLOCK_SIZE
+    assert log.events[-2] == ('interrupt', last_step)
+    assert log.events[-1] == ('finish', None)
+
+
+def test_batch():
+    log = EventLog()
+    mcmc = make_mcmc()
+    np.random.seed(SEED)
+    mcmc.sample_batch(100, 5, callbacks=[log], callback_block_size=BLOCK_SIZE)
+    steps = log.concatenate('step')
+    assert steps['params'].shape == (100, 5, 2)
+    assert steps['accepted'].shape == (100, 5)
+    assert np.array_equal(np.sum(steps['accepted'], axis=0), mcmc.accepted)
+    records = log.concatenate('record')
+    assert records['params'].shape == (99, 5, 2)
+    assert np.array_equal(records['params'][-1], mcmc.batch_state['params'])
+
+
+if __name__ == '__main__':
+    test_events()
+    test_default_fields()
+    test_same_chain()
+    test_no_collection()
+    test_interrupt()
+    test_batch()
+    print 'OK'
@@ -0,0 +1,150 @@
+"""
+Unit tests for checkpointing and resuming chains.
+
+A chain that is interrupted after a checkpoint and resumed must be exactly
+the same as a chain that was never interrupted.
+
+Author:
+    Ilias Bilionis
+"""
+
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.split(__file__)[0],
+                                                '..')))
+import shutil
+import tempfile
+import numpy as np
+import pymcmc as pm
+
+
+NUM_SAMPLES = 300
+CHECKPOINT_FREQUENCY = 100
+INTERRUPT_AT = 150
+SEED = 12345
+
+
+class Interrupt(pm.Callback):
+
+    """
+    Interrupts sampling (as if Ctrl-C was pressed) at a given step.
+    """
+
+    def __init__(self, step):
+        self.step = step
+
+    def on_step(self, sampler, steps):
+        if steps['step'][-1] >= self.step:
+            raise KeyboardInterrupt()
+
+
+def make_mcmc(db):
+    """
+    Make a sampler of a correlated 2-d normal that stores its chain in
+    ``db``.
+    """
+    prec = np.linalg.inv(np.array([[1., 0.8], [0.8, 2.]]))
+    model = pm.ArrayModel(lambda x: -0.5 * np.sum(np.dot(x, prec) * x, axis=1),
+                          np.zeros(2))
+    proposal = pm.RandomWalkProposal(cov=np.eye(2), block_size=64)
+    return pm.MetropolisHastings(model, proposal=proposal, db=db)
+
+
+def make_db(kind, path):
+    """
+    Make (or open) a storage of the given kind.
+    """
+    model_state = make_mcmc(None).model.__getstate__()
+    proposal_state = pm.RandomWalkProposal(cov=np.eye(2)).__getstate__()
+    if kind == 'numpy':
+        return pm.NumpyDataBase(path, model_state, proposal_state)
+    return pm.DataBase(path, model_state, proposal_state, buffer_size=7)
+
+
+def sample(mcmc, interrupt=False):
+    """
+    Sample with tuning and checkpoints (and maybe interrupt it).
+    """
+    np.random.seed(SEED)
+    mcmc.sample(NUM_SAMPLES, num_thin=2, tuning_frequency=40,
+                stop_tuning_after=200,
+                checkpoint_frequency=CHECKPOINT_FREQUENCY,
+                callbacks=[Interrupt(INTERRUPT_AT)] if interrupt else None,
+                callback_block_size=1)
+
+
+def check_resume(kind):
+    """
+    Compare an interrupted and resumed chain with an uninterrupted one.
+    """
+    tmp = tempfile.mkdtemp()
+    try:
+        ext = '' if kind == 'numpy' else '.h5'
+        # The uninterrupted chain
+        db = make_db(kind, os.path.join(tmp, 'full' + ext))
+        mcmc = make_mcmc(db)
+        sample(mcmc)
+        full = db.read_chain(0)
+        full_params = np.array(mcmc.model.params)
+        db.close()
+        # The interrupted chain
+        filename = os.path.join(tmp, 'resumed' + ext)
+        db = make_db(kind, filename)
+        mcmc = make_mcmc(db)
+        sample(mcmc, interrupt=True)
+        assert db.get_num_records(0) < full['step'].shape[0]
+        db.close()
+        # Resume it in a new sampler (e.g. after a crash)
+        np.random.seed(0)
+        db = make_db(kind, filename)
+        mcmc = make_mcmc(db)
+        mcmc.resume()
+        resumed = db.read_chain(0)
+        assert np.array_equal(mcmc.model.params, full_params)
+        assert sorted(resumed.keys()) == sorted(full.keys())
+        for name in full.keys():
+            assert np.array_equal(resumed[name], full[name]), name
+        db.close()
+    finally:
+        shutil.rmtree(tmp)
+
+
+def test_no_gradients_in_checkpoints():
+    # A random walk does not need the gradients, so the checkpoints must
+    # not compute them
+    num_grads = [0]
+    def grad_log_likelihood(x):
+        num_grads[0] += 1
+        return -x
+    model = pm.ArrayModel(lambda x: -0.5 * np.sum(x ** 2, axis=1),
+                          np.zeros(2), grad_log_likelihood=grad_log_likelihood)
+    tmp = tempfile.mkdtemp()
+    try:
+        db = make_db('numpy', tmp)
+        mcmc = pm.MetropolisHastings(model,
+                                     proposal=pm.RandomWalkProposal(
+                                         cov=np.eye(2)),
+                                     db=db)
+        mcmc.sample(NUM_SAMPLES, checkpoint_frequency=CHECKPOINT_FREQUENCY)
+        checkpoint = db.get_checkpoint(0)
+        assert not 'grad_log_likelihood' in checkpoint['model_state']
+        assert num_grads[0] == 0
+        db.close()
+    finally:
+        shutil.rmtree(tmp)
+
+
+def test_resume_database():
+    check_resume('hdf5')
+
+
+def test_resume_numpy_database():
+    check_resume('numpy')
+
+
+if __name__ == '__main__':
+    test_resume_database()
+    test_resume_numpy_database()
+    test_no_gradients_in_checkpoints()
+    print 'OK'
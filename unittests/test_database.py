@@ -0,0 +1,143 @@
+"""
+Unit tests for the buffered writes of the DataBase class.
+
+Author:
+    Ilias Bilionis
+"""
+
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.split(__file__)[0],
+                                                '..')))
+import gc
+import shutil
+import subprocess
+import tempfile
+import numpy as np
+import pymcmc as pm
+from pymcmc._chain_storage import _open_storages
+
+
+MODEL_STATE = {'params': np.zeros(2), 'log_likelihood': 0., 'log_prior': 0.}
+PROPOSAL_STATE = pm.RandomWalkProposal(cov=np.eye(2)).__getstate__()
+
+# A script that leaves some records in the buffer when it exits
+WRITE_AND_EXIT = """
+import sys
+sys.path.insert(0, %r)
+import numpy as np
+import pymcmc as pm
+sys.path.insert(0, %r)
+from test_database import MODEL_STATE, PROPOSAL_STATE, add_records
+db = pm.DataBase(%r, MODEL_STATE, PROPOSAL_STATE, buffer_size=100,
+                 flush_interval=1e6)
+db.add_proposal(PROPOSAL_STATE)
+db.create_new_chain()
+add_records(db, 0, 3)
+"""
+
+
+def add_records(db, first, last):
+    """
+    Add the records ``first, ..., last - 1`` to the current chain.
+    """
+    for i in xrange(first, last):
+        db.add_chain_record(i + 1, i, {'params': np.array([i, -i]),
+                                       'log_likelihood': float(i),
+                                       'log_prior': -float(i)})
+
+
+def check_records(db, num_records):
+    """
+    Check the records of the first chain.
+    """
+    data = db.read_chain(0)
+    i = np.arange(num_records)
+    assert np.array_equal(data['step'], i + 1)
+    assert np.array_equal(data['accepted'], i)
+    assert np.array_equal(data['params'], np.vstack([i, -i]).T)
+    assert np.array_equal(data['log_likelihood'], i)
+    assert np.array_equal(data['log_prior'], -i)
+
+
+def test_buffer():
+    tmp = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmp, 'db.h5')
+        db = pm.DataBase(filename, MODEL_STATE, PROPOSAL_STATE,
+                         buffer_size=7, flush_interval=1e6)
+        db.add_proposal(PROPOSAL_STATE)
+        chain = db.create_new_chain()
+        add_records(db, 0, 10)
+        # Only the full buffer has reached the table
+        assert chain.nrows == 7
+        # Reading sees everything
+        assert db.get_num_records(0) == 10
+        assert chain.nrows == 10
+        add_records(db, 10, 12)
+        assert chain.nrows == 10
+        # Closing writes the rest
+        db.close()
+        db = pm.DataBase(filename, MODEL_STATE, PROPOSAL_STATE)
+        check_records(db, 12)
+        db.close()
+    finally:
+        shutil.rmtree(tmp)
+
+
+def test_flush_interval():
+    tmp = tempfile.mkdtemp()
+    try:
+        db = pm.DataBase(os.path.join(tmp, 'db.h5'), MODEL_STATE,
+                         PROPOSAL_STATE, buffer_size=100, flush_interval=0.)
+        db.add_proposal(PROPOSAL_STATE)
+        chain = db.create_new_chain()
+        add_records(db, 0, 5)
+        assert chain.nrows == 5
+        db.close()
+    finally:
+        shutil.rmtree(tmp)
+
+
+def test_flush_at_exit():
+    tmp = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmp, 'db.h5')
+        here = os.path.abspath(os.path.split(__file__)[0])
+        script = WRITE_AND_EXIT % (os.path.join(here, '..'), here, filename)
+        subprocess.check_call([sys.executable, '-c', script])
+        db = pm.DataBase(filename, MODEL_STATE, PROPOSAL_STATE)
+        check_records(db, 3)
+        db.close()
+    finally:
+        shutil.rmtree(tmp)
+
+
+def test_registry_is_weak():
+    tmp = tempfile.mkdtemp()
+    try:
+        num_open = len(_open_storages)
+        db = pm.DataBase(os.path.join(tmp, 'db.h5'), MODEL_STATE,
+                         PROPOSAL_STATE)
+        assert len(_open_storages) == num_open + 1
+        db.close()
+        assert len(_open_storages) == num_open
+        # A storage that is not closed can still be garbage collected
+        db = pm.DataBase(os.path.join(tmp, 'db.h5'), MODEL_STATE,
+                         PROPOSAL_STATE)
+        fd = db.fd
+        del db
+        gc.collect()
+        assert len(_open_storages) == num_open
+        fd.close()
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    test_buffer()
+    test_flush_interval()
+    test_flush_at_exit()
+    test_registry_is_weak()
+    print 'OK'
@@ -0,0 +1,121 @@
+"""
+Unit tests for the EvaluationCache class.
+
+Author:
+    Ilias Bilionis
+"""
+
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.split(__file__)[0],
+                                                '..')))
+import numpy as np
+import pymcmc as pm
+
+
+def make_state(x, with_grads=False):
+    """
+    Make a state at a 2-d point.
+    """
+    state = {'params': np.array(x, dtype='float64'),
+             'log_likelihood': -0.5 * np.sum(np.square(x)),
+             'log_prior': 0.}
+    if with_grads:
+        state['grad_log_likelihood'] = -state['params']
+        state['grad_log_prior'] = np.zeros(2)
+    return state
+
+
+# The size of an entry: the key, the parameters (and the gradients)
+SIZE = 16 + 16
+SIZE_WITH_GRADS = SIZE + 2 * 16
+
+
+def test_hits_and_eviction():
+    cache = pm.EvaluationCache(max_entries=3)
+    points = [[float(i), 0.] for i in xrange(4)]
+    for x in points[:3]:
+        assert cache.get(x) is None
+        cache.put(x, make_state(x))
+    assert cache.misses == 3 and cache.hits == 0
+    state = cache.get(points[0])
+    assert state is not None and state['params'][0] == 0.
+    assert cache.hits == 1
+    assert cache.hit_rate == 0.25
+    # Point 1 is now the least recently used
+    cache.put(points[3], make_state(points[3]))
+    assert len(cache) == 3
+    assert cache.get(points[1]) is None
+    for x in [points[0], points[2], points[3]]:
+        assert cache.get(x) is not None
+    # A copy of the parameters (or another dtype) finds the same entry
+    assert cache.get(np.array([3, 0], dtype='int64')) is not None
+    # Putting a state again replaces it
+    cache.put(points[3], make_state([-1., -1.]))
+    assert len(cache) == 3
+    assert cache.get(points[3])['params'][0] == -1.
+    cache.clear()
+    assert len(cache) == 0 and cache.hits == 0 and cache.num_bytes == 0
+
+
+def test_bytes():
+    cache = pm.EvaluationCache(max_entries=100, max_bytes=3 * SIZE)
+    for i in xrange(3):
+        cache.put([i, 0.], make_state([i, 0.]))
+    assert cache.num_bytes == 3 * SIZE
+    assert len(cache) == 3
+    # Adding the gradients to a cached state makes it larger
+    state = cache.get([2., 0.])
+    state.update(make_state([2., 0.], with_grads=True))
+    cache.resize([2., 0.])
+    assert cache.num_bytes == SIZE + SIZE_WITH_GRADS
+    assert len(cache) == 2
+    assert cache.get([0., 0.]) is None
+    # Resizing is not a lookup
+    hits = cache.hits
+    cache.resize([1., 0.])
+    cache.resize([5., 0.])
+    assert cache.hits == hits
+    # The last entry is kept even if it alone is too large
+    cache.max_bytes = 10
+    cache.put([7., 0.], make_state([7., 0.], with_grads=True))
+    assert len(cache) == 1
+    assert cache.num_bytes == SIZE_WITH_GRADS
+
+
+def test_model():
+    num_calls = {'log_likelihood': 0, 'grad': 0}
+    def log_likelihood(x):
+        num_calls['log_likelihood'] += 1
+        return -0.5 * np.sum(x ** 2, axis=1)
+    def grad_log_likelihood(x):
+        num_calls['grad'] += 1
+        return -x
+    cache = pm.EvaluationCache(max_entries=10)
+    model = pm.ArrayModel(log_likelihood, np.zeros(2),
+                          grad_log_likelihood=grad_log_likelihood,
+                          cache=cache)
+    model.params = np.ones(2)
+    assert num_calls['log_likelihood'] == 2
+    # Going back does not evaluate anything
+    model.params = np.zeros(2)
+    assert num_calls['log_likelihood'] == 2
+    assert model.log_likelihood == 0.
+    # The gradients are added to the cached state...
+    assert np.array_equal(model.grad_log_likelihood, np.zeros(2))
+    assert num_calls['grad'] == 1
+    assert cache.num_bytes == SIZE + SIZE_WITH_GRADS
+    # ... so they are not evaluated again either
+    model.params = np.ones(2)
+    model.params = np.zeros(2)
+    assert np.array_equal(model.grad_log_likelihood, np.zeros(2))
+    assert num_calls == {'log_likelihood': 2, 'grad': 1}
+    assert cache.hits == 3 and cache.misses == 2
+
+
+if __name__ == '__main__':
+    test_hits_and_eviction()
+    test_bytes()
+    test_model()
+    print 'OK'
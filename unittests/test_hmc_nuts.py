@@ -0,0 +1,100 @@
+"""
+Unit tests for the HMC and NUTS proposals.
+
+Both proposals sample a correlated 2-d normal. After the warm-up, the mean
+and the variance of the chain must match those of the target and NUTS must
+accept (on average) at the rate its step size was adapted for.
+
+Author:
+    Ilias Bilionis
+"""
+
+
+import sys
+import os
+import math
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.split(__file__)[0],
+                                                '..')))
+import numpy as np
+import pymcmc as pm
+
+
+MEAN = np.array([1., -2.])
+COV = np.array([[1., 0.5], [0.5, 2.]])
+NUM_WARMUP = 1000
+NUM_SAMPLES = 3000
+SEED = 31415
+
+
+class Collector(pm.Callback):
+
+    """
+    Keeps the parameters of every step and the acceptance statistic of
+    NUTS.
+    """
+
+    def __init__(self):
+        self.params = []
+        self.accept_stats = []
+
+    def on_step(self, sampler, steps):
+        self.params.append(steps['params'])
+        accept_stat = getattr(sampler.proposal, 'accept_stat', None)
+        if accept_stat is not None:
+            self.accept_stats.append(accept_stat)
+
+
+def make_model():
+    """
+    Make the 2-d normal target.
+    """
+    prec = np.linalg.inv(COV)
+    return pm.ArrayModel(
+        lambda x: -0.5 * np.sum(np.dot(x - MEAN, prec) * (x - MEAN), axis=1),
+        np.zeros(2),
+        grad_log_likelihood=lambda x: -np.dot(x - MEAN, prec))
+
+
+def run(proposal):
+    """
+    Tune the proposal, sample and return the collector of the samples after
+    the warm-up.
+    """
+    np.random.seed(SEED)
+    mcmc = pm.MetropolisHastings(make_model(), proposal=proposal)
+    mcmc.sample(NUM_WARMUP, tuning_frequency=100)
+    collector = Collector()
+    mcmc.sample(NUM_SAMPLES, start_tuning_after=None, callbacks=[collector],
+                callback_block_size=1)
+    collector.params = np.vstack(collector.params)
+    return collector
+
+
+def check_moments(params):
+    """
+    Compare the moments of the chain with those of the target.
+    """
+    assert params.shape == (NUM_SAMPLES, 2)
+    assert np.all(np.abs(np.mean(params, axis=0) - MEAN) < 0.15)
+    var = np.var(params, axis=0)
+    assert np.all(np.abs(var / np.diag(COV) - 1.) < 0.2)
+
+
+def test_hmc():
+    collector = run(pm.HMCProposal(step_size=0.5, num_steps=5))
+    check_moments(collector.params)
+
+
+def test_nuts():
+    proposal = pm.NUTSProposal(step_size=1., target_accept=0.8)
+    collector = run(proposal)
+    check_moments(collector.params)
+    # The step size was fixed to the dual averaged one after the warm-up
+    assert proposal.step_size == math.exp(proposal._log_step_size_bar)
+    assert abs(np.mean(collector.accept_stats) - 0.8) < 0.1
+
+
+if __name__ == '__main__':
+    test_hmc()
+    test_nuts()
+    print 'OK'
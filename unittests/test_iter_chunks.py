@@ -0,0 +1,101 @@
+"""
+Unit tests for reading stored chains in chunks.
+
+Author:
+    Ilias Bilionis
+"""
+
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.split(__file__)[0],
+                                                '..')))
+import shutil
+import tempfile
+import numpy as np
+import pymcmc as pm
+
+
+MODEL_STATE = {'params': np.zeros(2), 'log_likelihood': 0., 'log_prior': 0.}
+PROPOSAL_STATE = pm.RandomWalkProposal(cov=np.eye(2)).__getstate__()
+NUM_RECORDS = [103, 40]
+
+# (chunk_size, start, stop, thin)
+READS = [(10, 0, None, 1), (10, 0, None, 3), (7, 5, 95, 2), (1, 0, 12, 5),
+         (1000, 0, None, 1), (4, -30, None, 4), (9, 50, 1000, 7),
+         (5, 20, 20, 1)]
+
+
+def make_db(kind, path):
+    """
+    Make a storage of the given kind with two chains. The records of the
+    chains are numbered by their ``step`` (chain ``k`` starts from
+    ``1000 k``).
+    """
+    if kind == 'numpy':
+        db = pm.NumpyDataBase(path, MODEL_STATE, PROPOSAL_STATE,
+                              initial_capacity=16)
+    else:
+        db = pm.DataBase(path, MODEL_STATE, PROPOSAL_STATE, buffer_size=16)
+    db.add_proposal(PROPOSAL_STATE)
+    for k, num_records in enumerate(NUM_RECORDS):
+        db.create_new_chain()
+        for i in xrange(1000 * k, 1000 * k + num_records):
+            db.add_chain_record(i, 0, {'params': np.array([i, -i]),
+                                       'log_likelihood': float(i),
+                                       'log_prior': 0.})
+    return db
+
+
+def check_iter_chunks(kind):
+    """
+    Compare the chunks with slices of the chains.
+    """
+    tmp = tempfile.mkdtemp()
+    try:
+        db = make_db(kind, os.path.join(tmp, 'chains' +
+                                        ('' if kind == 'numpy' else '.h5')))
+        for chunk_size, start, stop, thin in READS:
+            steps = dict((k, []) for k in xrange(len(NUM_RECORDS)))
+            for chain_num, chunk in db.iter_chunks(fields=['step', 'params'],
+                                                   chunk_size=chunk_size,
+                                                   start=start, stop=stop,
+                                                   thin=thin):
+                assert sorted(chunk.keys()) == ['params', 'step']
+                assert 1 <= chunk['step'].shape[0] <= chunk_size
+                assert np.array_equal(chunk['params'][:, 0], chunk['step'])
+                steps[chain_num].append(chunk['step'])
+            for k, num_records in enumerate(NUM_RECORDS):
+                expected = (1000 * k + np.arange(num_records))[start:stop:thin]
+                got = (np.hstack(steps[k]) if len(steps[k]) > 0
+                       else np.zeros(0))
+                assert np.array_equal(got, expected), (k, chunk_size, start,
+                                                       stop, thin)
+        # Selecting the chains
+        chains = [k for k, _ in db.iter_chunks(chain_nums=1, chunk_size=15)]
+        assert chains == [1] * 3
+        chains = [k for k, _ in db.iter_chunks(chain_nums=[1, 0],
+                                               chunk_size=50)]
+        assert chains == [1, 0, 0, 0]
+        # All the columns by default
+        _, chunk = db.iter_chunks(chain_nums=0).next()
+        assert sorted(chunk.keys()) == ['accepted', 'log_likelihood',
+                                        'log_prior', 'params', 'proposal',
+                                        'step']
+        db.close()
+    finally:
+        shutil.rmtree(tmp)
+
+
+def test_database():
+    check_iter_chunks('hdf5')
+
+
+def test_numpy_database():
+    check_iter_chunks('numpy')
+
+
+if __name__ == '__main__':
+    test_database()
+    test_numpy_database()
+    print 'OK'
@@ -0,0 +1,93 @@
+"""
+Unit tests for the LowRankGPRegression class.
+
+On a small problem, the log likelihood, its gradients and the predictions
+must match those of a GPy.models.GPRegression with the same kernel (which
+forms the full covariance matrix).
+
+Author:
+    Ilias Bilionis
+"""
+
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.split(__file__)[0],
+                                                '..')))
+import numpy as np
+import GPy
+import pymcmc as pm
+
+
+class PolynomialBasis(object):
+
+    """
+    The monomials ``1, x, ..., x^degree`` of a scalar input.
+    """
+
+    def __init__(self, degree):
+        self.degree = degree
+        self.num_output = degree + 1
+
+    def __call__(self, X):
+        return X[:, :1] ** np.arange(self.num_output)[None, :]
+
+
+def make_models(ARD, num_outputs):
+    """
+    Make a low rank and a dense model of the same data at the same
+    (non-default) parameters.
+    """
+    rng = np.random.RandomState(1234)
+    basis = PolynomialBasis(4)
+    X = rng.rand(15, 1)
+    Y = (np.dot(basis(X), rng.randn(basis.num_output, num_outputs)) +
+         0.1 * rng.randn(15, num_outputs))
+    variance = 0.5 + rng.rand(basis.num_output) if ARD else 0.7
+    low_rank = pm.LowRankGPRegression(
+        X, Y, pm.MeanFunction(1, basis, variance=variance, ARD=ARD),
+        noise_variance=0.05)
+    dense = GPy.models.GPRegression(
+        X, Y, pm.MeanFunction(1, basis, variance=variance, ARD=ARD))
+    dense.likelihood.variance = 0.05
+    return low_rank, dense
+
+
+def check_against_dense(ARD, num_outputs):
+    """
+    Compare the low rank model with the dense one.
+    """
+    low_rank, dense = make_models(ARD, num_outputs)
+    assert np.allclose(low_rank.param_array, dense.param_array)
+    # GPy adds a small jitter to the noise of the dense model
+    tol = {'rtol': 1e-5, 'atol': 1e-6}
+    assert np.allclose(low_rank.log_likelihood(), dense.log_likelihood(),
+                       **tol)
+    assert np.allclose(low_rank.gradient, dense.gradient, **tol)
+    Xnew = np.linspace(-0.2, 1.2, 7)[:, None]
+    for full_cov in [False, True]:
+        mean, var = low_rank.predict(Xnew, full_cov=full_cov)
+        dense_mean, dense_var = dense.predict(Xnew, full_cov=full_cov)
+        assert mean.shape == dense_mean.shape
+        assert var.shape == dense_var.shape
+        assert np.allclose(mean, dense_mean, **tol)
+        assert np.allclose(var, dense_var, **tol)
+
+
+def test_single_variance():
+    check_against_dense(False, 1)
+
+
+def test_ARD():
+    check_against_dense(True, 1)
+
+
+def test_many_outputs():
+    check_against_dense(True, 3)
+
+
+if __name__ == '__main__':
+    test_single_variance()
+    test_ARD()
+    test_many_outputs()
+    print 'OK'
@@ -0,0 +1,136 @@
+"""
+Unit tests for the NumpyDataBase class.
+
+Author:
+    Ilias Bilionis
+"""
+
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.split(__file__)[0],
+                                                '..')))
+import shutil
+import tempfile
+import numpy as np
+import pymcmc as pm
+from pymcmc._numpy_database import NPY_HEADER_LENGTH
+
+
+MODEL_STATE = {'params': np.zeros(2), 'log_likelihood': 0., 'log_prior': 0.}
+PROPOSAL_STATE = pm.RandomWalkProposal(cov=np.eye(2)).__getstate__()
+NUM_RECORDS = 50
+
+
+def add_records(db, first, last):
+    """
+    Add the records ``first, ..., last - 1`` to the current chain.
+    """
+    for i in xrange(first, last):
+        db.add_chain_record(i + 1, i, {'params': np.array([i, -i]),
+                                       'log_likelihood': float(i),
+                                       'log_prior': -float(i)})
+
+
+def check_records(db, chain_num, num_records):
+    """
+    Check the records of a chain.
+    """
+    data = db.read_chain(chain_num)
+    assert sorted(data.keys()) == ['accepted', 'log_likelihood', 'log_prior',
+                                   'params', 'proposal', 'step']
+    i = np.arange(num_records)
+    assert np.array_equal(data['step'], i + 1)
+    assert np.array_equal(data['accepted'], i)
+    assert np.array_equal(data['params'], np.vstack([i, -i]).T)
+    assert np.array_equal(data['log_likelihood'], i)
+    assert np.array_equal(data['log_prior'], -i)
+
+
+def test_growth():
+    tmp = tempfile.mkdtemp()
+    try:
+        db = pm.NumpyDataBase(tmp, MODEL_STATE, PROPOSAL_STATE,
+                              initial_capacity=4)
+        db.add_proposal(PROPOSAL_STATE)
+        chain = db.create_new_chain()
+        add_records(db, 0, NUM_RECORDS)
+        # The space was doubled as needed
+        assert chain['params'].capacity == 64
+        check_records(db, 0, NUM_RECORDS)
+        # After flushing, the files can be read directly
+        params = np.load(db.get_chain_filename(0, 'params'), mmap_mode='r')
+        assert params.shape == (NUM_RECORDS, 2)
+        del params
+        # Closing drops the space that was not used
+        filename = db.get_chain_filename(0, 'params')
+        db.close()
+        assert (os.path.getsize(filename) ==
+                NPY_HEADER_LENGTH + NUM_RECORDS * 2 * 8)
+        assert np.load(filename).shape == (NUM_RECORDS, 2)
+    finally:
+        shutil.rmtree(tmp)
+
+
+def test_reopen():
+    tmp = tempfile.mkdtemp()
+    try:
+        db = pm.NumpyDataBase(tmp, MODEL_STATE, PROPOSAL_STATE,
+                              initial_capacity=8)
+        db.add_proposal(PROPOSAL_STATE)
+        db.create_new_chain()
+        add_records(db, 0, NUM_RECORDS)
+        db.close()
+        # Open it again and add a chain with another proposal
+        db = pm.NumpyDataBase(tmp, MODEL_STATE, PROPOSAL_STATE)
+        assert db.num_chains == 1
+        assert db.proposal_id == 0
+        check_records(db, 0, NUM_RECORDS)
+        db.add_proposal(PROPOSAL_STATE)
+        db.create_new_chain()
+        add_records(db, 0, 10)
+        db.close()
+        db = pm.NumpyDataBase(tmp, MODEL_STATE, PROPOSAL_STATE)
+        assert db.num_chains == 2
+        assert len(db.proposals) == 2
+        check_records(db, 0, NUM_RECORDS)
+        check_records(db, 1, 10)
+        assert np.all(db.read_chain(1, fields=['proposal'])['proposal'] == 1)
+        model_state, proposal_state = db.get_states(1, 3)
+        assert np.array_equal(model_state['params'], [3., -3.])
+        assert model_state['log_likelihood'] == 3.
+        assert proposal_state['name'] == PROPOSAL_STATE['name']
+        db.close()
+    finally:
+        shutil.rmtree(tmp)
+
+
+def test_same_as_database():
+    # A chain stored in either backend is the same
+    tmp = tempfile.mkdtemp()
+    try:
+        chains = []
+        for db in [pm.NumpyDataBase(os.path.join(tmp, 'numpy'), MODEL_STATE,
+                                    PROPOSAL_STATE),
+                   pm.DataBase(os.path.join(tmp, 'db.h5'), MODEL_STATE,
+                               PROPOSAL_STATE)]:
+            model = pm.ArrayModel(lambda x: -0.5 * np.sum(x ** 2, axis=1),
+                                  np.zeros(2))
+            mcmc = pm.MetropolisHastings(
+                model, proposal=pm.RandomWalkProposal(cov=np.eye(2)), db=db)
+            np.random.seed(1)
+            mcmc.sample(200, num_thin=3, tuning_frequency=50)
+            chains.append(db.read_chain(0))
+            db.close()
+    finally:
+        shutil.rmtree(tmp)
+    assert sorted(chains[0].keys()) == sorted(chains[1].keys())
+    for name in chains[0].keys():
+        assert np.array_equal(chains[0][name], chains[1][name]), name
+
+
+if __name__ == '__main__':
+    test_growth()
+    test_reopen()
+    test_same_as_database()
+    print 'OK'
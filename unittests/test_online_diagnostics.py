@@ -0,0 +1,136 @@
+"""
+Unit tests for the OnlineDiagnostics class.
+
+The samples are streamed one at a time and the statistics are compared
+with those computed in two passes over the whole chain.
+
+Author:
+    Ilias Bilionis
+"""
+
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.split(__file__)[0],
+                                                '..')))
+import numpy as np
+import pymcmc as pm
+
+
+PHI = 0.8
+NUM_SAMPLES = 20050
+NUM_CHAINS = 2
+NUM_PARAMS = 3
+BLOCK_SIZE = 100
+WINDOW_SIZE = 4000
+
+
+def ar1_chains(seed, offsets=0.):
+    """
+    Sample AR(1) chains of shape ``(NUM_SAMPLES, NUM_CHAINS, NUM_PARAMS)``.
+    Their effective sample size is ``n (1 - PHI) / (1 + PHI)``.
+    """
+    rng = np.random.RandomState(seed)
+    e = rng.randn(NUM_SAMPLES, NUM_CHAINS, NUM_PARAMS)
+    x = np.empty(e.shape)
+    x[0] = e[0] / np.sqrt(1. - PHI ** 2)
+    for t in xrange(1, NUM_SAMPLES):
+        x[t] = PHI * x[t - 1] + e[t]
+    return x + offsets
+
+
+def stream(x):
+    """
+    Pass the chains to a new diagnostics object one sample at a time.
+    """
+    diagnostics = pm.OnlineDiagnostics(NUM_PARAMS, num_chains=NUM_CHAINS,
+                                       block_size=BLOCK_SIZE,
+                                       window_size=WINDOW_SIZE)
+    for params in x:
+        diagnostics.update(params)
+    diagnostics.flush()
+    return diagnostics
+
+
+def two_pass_split_rhat(window):
+    """
+    The split-R-hat of the chains in ``window``.
+    """
+    m = window.shape[0] // 2
+    halves = [window[:m, k] for k in xrange(NUM_CHAINS)]
+    halves += [window[-m:, k] for k in xrange(NUM_CHAINS)]
+    means = np.array([h.mean(axis=0) for h in halves])
+    within = np.mean([h.var(axis=0, ddof=1) for h in halves], axis=0)
+    between_m = means.var(axis=0, ddof=1)
+    return np.sqrt(((m - 1.) / m * within + between_m) / within)
+
+
+def test_moments_and_ess():
+    x = ar1_chains(1)
+    diagnostics = stream(x)
+    assert diagnostics.num_samples == NUM_SAMPLES
+    assert np.allclose(diagnostics.mean, x.mean(axis=0))
+    assert np.allclose(diagnostics.variance, x.var(axis=0, ddof=1))
+    # Batch means over the complete blocks
+    num_batches = NUM_SAMPLES // BLOCK_SIZE
+    n = num_batches * BLOCK_SIZE
+    batch_means = x[:n].reshape((num_batches, BLOCK_SIZE) +
+                                x.shape[1:]).mean(axis=1)
+    ess = (n * x.var(axis=0, ddof=1) /
+           (BLOCK_SIZE * batch_means.var(axis=0, ddof=1)))
+    assert np.allclose(diagnostics.ess, ess)
+    # Both estimates are close to the truth
+    true_ess = NUM_SAMPLES * (1. - PHI) / (1. + PHI)
+    assert np.all(np.abs(diagnostics.ess / true_ess - 1.) < 0.3)
+    true_window_ess = WINDOW_SIZE * (1. - PHI) / (1. + PHI)
+    assert np.all(np.abs(diagnostics.window_ess / true_window_ess - 1.) < 0.4)
+    assert abs(diagnostics.min_ess / (NUM_CHAINS * true_ess) - 1.) < 0.3
+
+
+def test_window():
+    x = ar1_chains(2)
+    diagnostics = stream(x)
+    window = x[-WINDOW_SIZE:]
+    assert np.array_equal(diagnostics.window, window)
+    # The autocorrelation of the window
+    rho = diagnostics.autocorrelation(max_lag=10)
+    assert rho.shape == (11, NUM_CHAINS, NUM_PARAMS)
+    w = window - window.mean(axis=0)
+    for lag in [0, 1, 5, 10]:
+        expected = ((w[:WINDOW_SIZE - lag] * w[lag:]).sum(axis=0) /
+                    (w * w).sum(axis=0))
+        assert np.allclose(rho[lag], expected)
+    assert np.all(np.abs(rho[1] - PHI) < 0.05)
+    # The split-R-hat of the window
+    split_rhat = diagnostics.split_rhat
+    assert np.allclose(split_rhat, two_pass_split_rhat(window))
+    assert np.all(split_rhat < 1.05)
+
+
+def test_split_rhat_detects_disagreement():
+    # The chains are around different values
+    x = ar1_chains(3, offsets=np.array([[0.], [4.]]))
+    diagnostics = stream(x)
+    assert np.allclose(diagnostics.split_rhat,
+                       two_pass_split_rhat(x[-WINDOW_SIZE:]))
+    assert np.all(diagnostics.split_rhat > 1.3)
+
+
+def test_sampler():
+    # The sampler passes every sample after the burn-in to the diagnostics
+    model = pm.ArrayModel(lambda x: -0.5 * np.sum(x ** 2, axis=1),
+                          np.zeros(2))
+    mcmc = pm.MetropolisHastings(model,
+                                 proposal=pm.RandomWalkProposal(cov=np.eye(2)))
+    np.random.seed(4)
+    mcmc.sample(1000, num_burn=200, diagnostics=True)
+    assert mcmc.diagnostics.num_samples == 800
+    assert mcmc.diagnostics.mean.shape == (1, 2)
+
+
+if __name__ == '__main__':
+    test_moments_and_ess()
+    test_window()
+    test_split_rhat_detects_disagreement()
+    test_sampler()
+    print 'OK'
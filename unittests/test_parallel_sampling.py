@@ -0,0 +1,111 @@
+"""
+Unit tests for sampling many chains in parallel and merging their databases.
+
+Author:
+    Ilias Bilionis
+"""
+
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.split(__file__)[0],
+                                                '..')))
+import multiprocessing
+import shutil
+import tempfile
+import numpy as np
+import tables as pt
+import pymcmc as pm
+
+
+NUM_CHAINS = 3
+NUM_SAMPLES = 200
+
+
+def make_mcmc(db_filename):
+    """
+    Make a sampler of a 2-d normal that writes to ``db_filename``.
+    """
+    model = pm.ArrayModel(lambda x: -0.5 * np.sum(x ** 2, axis=1),
+                          np.zeros(2))
+    return pm.MetropolisHastings(model,
+                                 proposal=pm.RandomWalkProposal(cov=np.eye(2)),
+                                 db_filename=db_filename)
+
+
+def make_mcmc_or_fail(db_filename):
+    """
+    Make a sampler, except for the second chain.
+    """
+    if db_filename.endswith('_shard_1.h5'):
+        raise ValueError('No sampler for this chain.')
+    return make_mcmc(db_filename)
+
+
+def test_sample_parallel():
+    tmp = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmp, 'chains.h5')
+        results = pm.sample_parallel(make_mcmc, NUM_CHAINS, NUM_SAMPLES,
+                                     db_filename=filename, num_processes=2,
+                                     seed=1)
+        assert [r['chain'] for r in results] == range(NUM_CHAINS)
+        assert len(set(r['seed'] for r in results)) == NUM_CHAINS
+        # Only the merged database is left
+        assert os.listdir(tmp) == ['chains.h5']
+        fd = pt.open_file(filename, mode='r')
+        try:
+            names = list(fd.root.mcmc.chain_counter.cols.name[:])
+            assert names == ['chain_' + str(k) for k in xrange(NUM_CHAINS)]
+            assert fd.root.mcmc.proposals.nrows == NUM_CHAINS
+            for k in xrange(NUM_CHAINS):
+                chain = fd.get_node('/mcmc/data', 'chain_' + str(k))
+                assert chain.nrows == NUM_SAMPLES - 1
+                # Each chain refers to the proposal of its own shard
+                assert np.all(chain.cols.proposal[:] == k)
+                assert chain.cols.accepted[-1] == round(
+                    results[k]['acceptance_rate'] * NUM_SAMPLES)
+        finally:
+            fd.close()
+        # Merging again appends the chains after the ones that are there
+        shards = [os.path.join(tmp, 'shard_' + str(k) + '.h5')
+                  for k in xrange(2)]
+        for shard in shards:
+            mcmc = make_mcmc(shard)
+            mcmc.sample(10)
+            mcmc.db.close()
+        pm.merge_databases(filename, shards, remove_shards=True)
+        assert os.listdir(tmp) == ['chains.h5']
+        db = pm.DataBase(filename, make_mcmc(None).model.__getstate__(),
+                         pm.RandomWalkProposal().__getstate__())
+        assert db.num_chains == NUM_CHAINS + 2
+        proposals = db.read_chain(NUM_CHAINS + 1,
+                                  fields=['proposal'])['proposal']
+        assert np.all(proposals == NUM_CHAINS + 1)
+        db.close()
+    finally:
+        shutil.rmtree(tmp)
+
+
+def test_failing_chain():
+    tmp = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmp, 'chains.h5')
+        try:
+            pm.sample_parallel(make_mcmc_or_fail, NUM_CHAINS, NUM_SAMPLES,
+                               db_filename=filename, num_processes=2)
+        except ValueError:
+            pass
+        else:
+            assert False, 'The failure of the chain was not reported.'
+        # The workers are gone and so are the shards of the other chains
+        assert multiprocessing.active_children() == []
+        assert os.listdir(tmp) == []
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    test_sample_parallel()
+    test_failing_chain()
+    print 'OK'
@@ -0,0 +1,250 @@
+"""
+Unit tests for the ParallelTempering class.
+
+Author:
+    Ilias Bilionis
+"""
+
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.split(__file__)[0],
+                                                '..')))
+import math
+import shutil
+import tempfile
+import numpy as np
+import pymcmc as pm
+
+
+# The modes of the bimodal target (far apart compared to their width)
+MODE = 4.
+WIDTH = 0.5
+NUM_WARMUP = 2000
+NUM_SAMPLES = 10000
+
+
+def mixture_log_likelihood(x):
+    """
+    An equal mixture of two normals at -MODE and MODE (one row per point).
+    """
+    log_a = -0.5 * np.sum((x - MODE) ** 2, axis=1) / WIDTH ** 2
+    log_b = -0.5 * np.sum((x + MODE) ** 2, axis=1) / WIDTH ** 2
+    return np.logaddexp(log_a, log_b)
+
+
+def mixture_grad_log_likelihood(x):
+    """
+    The gradient of :func:`mixture_log_likelihood`.
+    """
+    log_a = -0.5 * np.sum((x - MODE) ** 2, axis=1) / WIDTH ** 2
+    log_b = -0.5 * np.sum((x + MODE) ** 2, axis=1) / WIDTH ** 2
+    w = np.exp(log_a - np.logaddexp(log_a, log_b))[:, None]
+    return -(w * (x - MODE) + (1. - w) * (x + MODE)) / WIDTH ** 2
+
+
+def wide_log_prior(x):
+    """
+    A proper prior that does not favour either mode.
+    """
+    return -0.5 * np.sum(x ** 2, axis=1) / 100.
+
+
+def make_mcmc(db_filename):
+    """
+    Make a replica that starts in the mode at -MODE.
+    """
+    model = pm.ArrayModel(mixture_log_likelihood, -MODE * np.ones(2),
+                          log_prior=wide_log_prior)
+    return pm.MetropolisHastings(model,
+                                 proposal=pm.RandomWalkProposal(cov=np.eye(2),
+                                                                scale=0.5))
+
+
+def make_mala_mcmc(db_filename):
+    """
+    Make a replica that uses the gradients.
+    """
+    model = pm.ArrayModel(mixture_log_likelihood, -MODE * np.ones(2),
+                          log_prior=wide_log_prior,
+                          grad_log_likelihood=mixture_grad_log_likelihood,
+                          grad_log_prior=lambda x: -x / 100.)
+    return pm.MetropolisHastings(model, proposal=pm.MALAProposal(dt=0.1))
+
+
+def make_rw_mcmc_with_grads(db_filename):
+    """
+    Make a replica of a model with gradients that does not use them.
+    """
+    mcmc = make_mala_mcmc(db_filename)
+    mcmc.proposal = pm.RandomWalkProposal(cov=np.eye(2), scale=0.5)
+    return mcmc
+
+
+def make_mcmc_or_fail(db_filename):
+    """
+    Make a replica in some workers and fail in the others.
+    """
+    if np.random.rand() < 0.5:
+        raise RuntimeError('No replica for this worker.')
+    return make_mcmc(db_filename)
+
+
+class FixedUniforms(object):
+
+    """
+    A random state whose uniforms are given in advance.
+    """
+
+    def __init__(self, values):
+        self.values = list(values)
+
+    def rand(self):
+        return self.values.pop(0)
+
+
+class Collector(pm.Callback):
+
+    """
+    Keeps the parameters of every step.
+    """
+
+    def __init__(self):
+        self.params = []
+
+    def on_step(self, sampler, steps):
+        self.params.append(steps['params'])
+
+
+def test_swap():
+    pt = pm.ParallelTempering(make_mcmc, betas=[1., 0.5, 0.2])
+    pt.swaps_attempted = np.zeros(2)
+    pt.swaps_accepted = np.zeros(2)
+    pt._ladder_acc = np.zeros(2)
+    pt._ladder_num = np.zeros(2, dtype='int')
+    # (beta_0 - beta_1) (L_1 - L_0) = 0.5 * (-12 + 10) = -1
+    reports = {0: {'params': np.zeros(2), 'log_likelihood': -10.},
+               1: {'params': np.ones(2), 'log_likelihood': -12.},
+               2: {'params': 2. * np.ones(2), 'log_likelihood': -30.}}
+    # Rejected: u > exp(-1)
+    new_params = {}
+    pt._rng = FixedUniforms([0.4])
+    pt._swap(reports, 0, new_params)
+    assert new_params == {}
+    assert pt.swaps_attempted[0] == 1 and pt.swaps_accepted[0] == 0
+    assert abs(pt._ladder_acc[0] - math.exp(-1.)) < 1e-12
+    # Accepted: u < exp(-1)
+    pt._rng = FixedUniforms([0.3])
+    pt._swap(reports, 0, new_params)
+    assert pt.swaps_accepted[0] == 1
+    assert np.array_equal(new_params[0], np.ones(2))
+    assert np.array_equal(new_params[1], np.zeros(2))
+    assert reports[0]['log_likelihood'] == -12.
+    assert reports[1]['log_likelihood'] == -10.
+    # The odd pair: (0.5 - 0.2) (-30 + 10) < 0 and u = 1 is never below
+    pt._rng = FixedUniforms([1.])
+    pt._swap(reports, 1, new_params)
+    assert pt.swaps_attempted[1] == 1 and pt.swaps_accepted[1] == 0
+    # Moving towards a higher likelihood is always accepted
+    reports[2]['log_likelihood'] = 0.
+    pt._rng = FixedUniforms([1.])
+    pt._swap(reports, 1, new_params)
+    assert pt.swaps_accepted[1] == 1
+
+
+def test_adapt_ladder():
+    pt = pm.ParallelTempering(make_mcmc, num_temperatures=5,
+                              max_temperature=50.)
+    pt.ladder_adaptation_rate = 1.
+    pt._num_adapt = 0
+    for rates in [[0.9, 0.1, 0.5, 0.3], [0.2, 0.2, 0.9, 0.6]]:
+        pt._ladder_acc = np.array(rates)
+        pt._ladder_num = np.ones(4, dtype='int')
+        pt._adapt_ladder()
+        assert pt.betas[0] == 1.
+        assert abs(pt.betas[-1] - 1. / 50.) < 1e-12
+        assert np.all(np.diff(pt.betas) < 0.)
+    # The pair that swaps most often gets the largest gap
+    gaps = np.diff(-np.log(pt.betas))
+    assert np.argmax(gaps) == 2
+
+
+def test_bimodal():
+    np.random.seed(2718)
+    # A single chain stays in the mode it starts from
+    mcmc = make_mcmc(None)
+    collector = Collector()
+    mcmc.sample(NUM_SAMPLES, tuning_frequency=100,
+                stop_tuning_after=NUM_WARMUP, callbacks=[collector])
+    x = np.vstack(collector.params)[NUM_WARMUP:]
+    assert np.all(x[:, 0] < 0.)
+    # The cold chain of parallel tempering visits both of them
+    tmp = tempfile.mkdtemp()
+    try:
+        pt = pm.ParallelTempering(make_mcmc, num_temperatures=6,
+                                  max_temperature=200., num_processes=2,
+                                  db_filename=os.path.join(tmp, 'pt.h5'),
+                                  seed=2718)
+        pt.sample(NUM_SAMPLES, swap_frequency=10, tuning_frequency=100,
+                  stop_tuning_after=NUM_WARMUP)
+        x = pt.db.read_chain(0, fields=['params'])['params']
+        pt.db.close()
+    finally:
+        shutil.rmtree(tmp)
+    assert x.shape == (NUM_SAMPLES - 1, 2)
+    x = x[NUM_WARMUP:]
+    sign = np.sign(x[:, 0])
+    assert np.sum(sign[1:] != sign[:-1]) >= 20
+    # It spends the same time in each mode and it stays close to them
+    assert abs(np.mean(x[:, 0] > 0.) - 0.5) < 0.15
+    for in_mode in [x[:, 0] > 0., x[:, 0] < 0.]:
+        assert np.all(np.abs(np.abs(np.mean(x[in_mode], axis=0)) - MODE)
+                      < 0.2)
+    assert np.all(pt.swap_acceptance_rate > 0.2)
+    # The ladder kept its end points
+    assert pt.betas[0] == 1.
+    assert abs(pt.betas[-1] - 1. / 200.) < 1e-12
+
+
+def test_db_fields():
+    # The gradients are stored only if the cold replica uses them
+    tmp = tempfile.mkdtemp()
+    try:
+        for factory, has_grads in [(make_rw_mcmc_with_grads, False),
+                                   (make_mala_mcmc, True)]:
+            pt = pm.ParallelTempering(factory, num_temperatures=2,
+                                      num_processes=1,
+                                      db_filename=os.path.join(
+                                          tmp, factory.__name__ + '.h5'),
+                                      seed=1)
+            pt.sample(50)
+            data = pt.db.read_chain(0)
+            pt.db.close()
+            assert ('grad_log_likelihood' in data) == has_grads
+            assert ('grad_log_prior' in data) == has_grads
+            assert data['params'].shape == (49, 2)
+    finally:
+        shutil.rmtree(tmp)
+
+
+def test_failing_factory():
+    # With this seed, one of the two workers fails and the other one waits
+    # for commands, so it has to be stopped
+    pt = pm.ParallelTempering(make_mcmc_or_fail, num_temperatures=4,
+                              num_processes=2, seed=1)
+    try:
+        pt.sample(100)
+    except RuntimeError:
+        pass
+    else:
+        assert False, 'The failure of the factory was not reported.'
+    assert pt._workers == []
+
+
+if __name__ == '__main__':
+    test_swap()
+    test_adapt_ladder()
+    test_bimodal()
+    test_db_fields()
+    test_failing_factory()
+    print 'OK'
@@ -0,0 +1,57 @@
+"""
+Unit tests for the Profiler class.
+
+Author:
+    Ilias Bilionis
+"""
+
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.split(__file__)[0],
+                                                '..')))
+import shutil
+import tempfile
+import time
+import numpy as np
+import pymcmc as pm
+
+
+NUM_SAMPLES = 100
+GRAD_TIME = 0.005
+
+
+def slow_grad_log_likelihood(x):
+    """
+    The gradient of a standard normal that takes a while.
+    """
+    time.sleep(GRAD_TIME)
+    return -x
+
+
+def test_lazy_gradients():
+    # A random walk does not need the gradients, but storing them computes
+    # them and that time must be charged to 'grad'
+    model = pm.ArrayModel(lambda x: -0.5 * np.sum(x ** 2, axis=1),
+                          np.zeros(2),
+                          grad_log_likelihood=slow_grad_log_likelihood)
+    tmp = tempfile.mkdtemp()
+    try:
+        mcmc = pm.MetropolisHastings(
+            model, proposal=pm.RandomWalkProposal(cov=np.eye(2)),
+            db_filename=os.path.join(tmp, 'chain.h5'),
+            db_fields=['params', 'log_likelihood', 'log_prior',
+                       'grad_log_likelihood', 'grad_log_prior'])
+        mcmc.sample(NUM_SAMPLES, profile=True)
+        report = mcmc.profiler.get_report()
+        mcmc.db.close()
+    finally:
+        shutil.rmtree(tmp)
+    phases = report['phases']
+    assert phases['grad']['time'] >= 0.5 * NUM_SAMPLES * GRAD_TIME
+    assert phases['storage']['time'] < 0.2 * phases['grad']['time']
+
+
+if __name__ == '__main__':
+    test_lazy_gradients()
+    print 'OK'
@@ -0,0 +1,128 @@
+"""
+Unit tests for advancing many chains at once.
+
+The chains sample a correlated 2-d normal. Each chain must be accepted or
+rejected on its own, stored in its own table and, all together, have the
+moments of the target.
+
+Author:
+    Ilias Bilionis
+"""
+
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.split(__file__)[0],
+                                                '..')))
+import shutil
+import tempfile
+import numpy as np
+import pymcmc as pm
+
+
+MEAN = np.array([1., -2.])
+COV = np.array([[1., 0.5], [0.5, 2.]])
+NUM_CHAINS = 20
+NUM_WARMUP = 500
+NUM_SAMPLES = 2000
+SEED = 27182
+
+
+class Collector(pm.Callback):
+
+    """
+    Keeps the acceptance masks of every step.
+    """
+
+    def __init__(self):
+        self.accepted = []
+
+    def on_step(self, sampler, steps):
+        self.accepted.append(steps['accepted'])
+
+
+def make_model():
+    """
+    Make the 2-d normal target.
+    """
+    prec = np.linalg.inv(COV)
+    return pm.ArrayModel(
+        lambda x: -0.5 * np.sum(np.dot(x - MEAN, prec) * (x - MEAN), axis=1),
+        np.zeros(2),
+        grad_log_likelihood=lambda x: -np.dot(x - MEAN, prec))
+
+
+def check_batch(proposal):
+    """
+    Sample many chains with a proposal and check them.
+    """
+    np.random.seed(SEED)
+    tmp = tempfile.mkdtemp()
+    try:
+        mcmc = pm.MetropolisHastings(make_model(), proposal=proposal,
+                                     db_filename=os.path.join(tmp, 'b.h5'))
+        collector = Collector()
+        init_params = np.random.randn(NUM_CHAINS, 2)
+        mcmc.sample_batch(NUM_SAMPLES, NUM_CHAINS, init_params=init_params,
+                          tuning_frequency=100, stop_tuning_after=NUM_WARMUP,
+                          callbacks=[collector])
+        # The chains are accepted one by one
+        accepted = np.vstack(collector.accepted)
+        assert accepted.shape == (NUM_SAMPLES, NUM_CHAINS)
+        assert np.array_equal(np.sum(accepted, axis=0), mcmc.accepted)
+        assert np.mean(np.any(accepted != accepted[:, :1], axis=1)) > 0.5
+        # Each chain has its own table
+        assert mcmc.db.num_chains == NUM_CHAINS
+        params = []
+        for k in xrange(NUM_CHAINS):
+            data = mcmc.db.read_chain(k)
+            assert data['params'].shape == (NUM_SAMPLES - 1, 2)
+            assert data['accepted'][-1] == mcmc.accepted[k]
+            assert np.array_equal(data['params'][-1],
+                                  mcmc.batch_state['params'][k])
+            params.append(data['params'][NUM_WARMUP:])
+        mcmc.db.close()
+    finally:
+        shutil.rmtree(tmp)
+    params = np.vstack(params)
+    assert np.all(np.abs(np.mean(params, axis=0) - MEAN) < 0.1)
+    assert np.all(np.abs(np.cov(params.T) / COV - 1.) < 0.15)
+    return mcmc
+
+
+def test_random_walk():
+    mcmc = check_batch(pm.RandomWalkProposal(cov=np.eye(2)))
+    # The gradients are not computed if nobody needs them
+    assert not mcmc.batch_state.has_key('grad_log_likelihood')
+
+
+def test_mala():
+    check_batch(pm.MALAProposal(dt=0.5))
+
+
+def test_missing_fields():
+    # A random walk does not compute the gradients, so they cannot be stored
+    tmp = tempfile.mkdtemp()
+    try:
+        mcmc = pm.MetropolisHastings(
+            make_model(), proposal=pm.RandomWalkProposal(cov=np.eye(2)),
+            db_filename=os.path.join(tmp, 'b.h5'),
+            db_fields=['params', 'log_likelihood', 'log_prior',
+                       'grad_log_likelihood'])
+        try:
+            mcmc.sample_batch(10, NUM_CHAINS)
+        except ValueError:
+            pass
+        else:
+            assert False, 'The missing gradients were not reported.'
+        assert mcmc.db.num_chains == 0
+        mcmc.db.close()
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    test_random_walk()
+    test_mala()
+    test_missing_fields()
+    print 'OK'